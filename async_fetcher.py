@@ -0,0 +1,98 @@
+# async_fetcher.py
+"""
+多標的並行 K 線抓取 (ccxt.async_support)
+
+requests 為 [(symbol, timeframe, limit), ...]，以 asyncio 同時送出，
+semaphore 限制同時在途的請求數，ccxt 的 enableRateLimit 節流器負責遵守交易所頻率限制。
+整輪耗時取決於最慢的一個請求，而不是所有請求的總和。
+- fetch_iter: async generator，每完成一個就 yield (symbol, timeframe, df, error)
+- fetch_many: 同步包裝，回傳 { (symbol, timeframe): df }，失敗的標的不在結果內
+"""
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional, Tuple
+
+import pandas as pd
+import ccxt.async_support as ccxt_async
+
+from exchange_registry import ensure_markets_async
+
+OHLCV_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+Request = Tuple[str, str, int]
+
+
+def _make_exchange(exchange_id: str, market_type: str, testnet: bool) -> Any:
+    ex_cls = getattr(ccxt_async, exchange_id, None)
+    if ex_cls is None:
+        raise ValueError(f"exchange {exchange_id} not found in ccxt.async_support")
+    config = {"enableRateLimit": True, "options": {}}
+    if market_type != "spot":
+        config["options"]["defaultType"] = market_type
+    exchange = ex_cls(config)
+    if testnet:
+        exchange.set_sandbox_mode(True)
+    return exchange
+
+
+async def _fetch_one(exchange: Any, sem: asyncio.Semaphore, symbol: str, timeframe: str, limit: int,
+                     retries: int) -> Tuple[str, str, pd.DataFrame, Optional[Exception]]:
+    error: Optional[Exception] = None
+    for attempt in range(retries + 1):
+        async with sem:
+            try:
+                ohlcv = await exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+                return symbol, timeframe, pd.DataFrame(ohlcv, columns=OHLCV_COLUMNS), None
+            except ccxt_async.NetworkError as e:
+                # 逾時 / 限流類錯誤才重試，其餘 (如交易對不存在) 直接回報
+                error = e
+            except Exception as e:
+                return symbol, timeframe, pd.DataFrame(columns=OHLCV_COLUMNS), e
+        await asyncio.sleep(0.5 * (2 ** attempt))
+    return symbol, timeframe, pd.DataFrame(columns=OHLCV_COLUMNS), error
+
+
+async def fetch_iter(requests: Iterable[Request], exchange_id: str = "bybit", market_type: str = "spot",
+                     testnet: bool = False, max_concurrency: int = 10,
+                     retries: int = 2) -> AsyncIterator[Tuple[str, str, pd.DataFrame, Optional[Exception]]]:
+    """依完成順序 yield (symbol, timeframe, df, error)；df 為 ccxt 欄位格式 (timestamp 為毫秒)"""
+    requests = list(requests)
+    if not requests:
+        return
+    exchange = _make_exchange(exchange_id, market_type, testnet)
+    try:
+        try:
+            await ensure_markets_async(exchange, market_type, testnet)
+        except Exception:
+            # markets 載入失敗時 fetch_ohlcv 會自行重試載入
+            pass
+        sem = asyncio.Semaphore(max(1, int(max_concurrency)))
+        tasks = [asyncio.ensure_future(_fetch_one(exchange, sem, s, tf, int(n), retries))
+                 for s, tf, n in requests]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+        finally:
+            for t in tasks:
+                t.cancel()
+    finally:
+        await exchange.close()
+
+
+async def fetch_many_async(requests: Iterable[Request], on_result: Optional[Callable] = None,
+                           **kwargs) -> Dict[Tuple[str, str], pd.DataFrame]:
+    frames: Dict[Tuple[str, str], pd.DataFrame] = {}
+    async for symbol, timeframe, df, error in fetch_iter(requests, **kwargs):
+        if on_result is not None:
+            on_result(symbol, timeframe, df, error)
+        if error is None and not df.empty:
+            frames[(symbol, timeframe)] = df
+    return frames
+
+
+def fetch_many(requests: Iterable[Request], on_result: Optional[Callable] = None,
+               **kwargs) -> Dict[Tuple[str, str], pd.DataFrame]:
+    """
+    同步呼叫端使用：並行抓取全部 requests，回傳 { (symbol, timeframe): df }。
+    on_result(symbol, timeframe, df, error) 會在每個請求完成時呼叫 (可用來顯示進度或記錄錯誤)。
+    其餘參數同 fetch_iter：exchange_id / market_type / testnet / max_concurrency / retries。
+    """
+    return asyncio.run(fetch_many_async(requests, on_result=on_result, **kwargs))
@@ -3,7 +3,7 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from data_fetch import fetch_multi_timeframes
-from signal_generator import generate_signal
+from indicator_stream import iter_signals
 from strategies import run_strategy
 
 BEST_PATH = "best_params.json"
@@ -25,16 +25,10 @@ def backtest_equity(symbol, strategy_name, params, dfs):
     tp_pct = params.get("take_profit_pct", 0.05)
     sl_pct = params.get("stop_loss_pct", -0.03)
 
-    for i in range(len(df_1m)):
-        price = df_1m["close"].iloc[i]
-        dfs_slice = {
-            "1m": df_1m.iloc[:i+1],
-            "15m": dfs["15m"].iloc[:i//15+1],
-            "1h": dfs["1h"].iloc[:i//60+1],
-            "4h": dfs["4h"].iloc[:i//240+1],
-            "1d": dfs["1d"].iloc[:i//1440+1],
-        }
-        sigs = generate_signal(dfs_slice)
+    closes = df_1m["close"].to_numpy(dtype=float)
+    # 串流指標：每根 K 線 O(1) 更新，等同對前綴呼叫 generate_signal
+    for i, sigs in iter_signals(dfs):
+        price = closes[i]
         decision = run_strategy(strategy_name, sigs)
 
         if decision == 1 and position == 0:
@@ -1,29 +1,45 @@
 ﻿# backtester.py
 import numpy as np
 import pandas as pd
-import ccxt
 import argparse
 import json
+import math
+from itertools import product
 from typing import Any, Dict, List, Optional
 
+from exchange_registry import get_exchange, store_key
+from ohlcv_cache import OHLCVCache
+from ohlcv_resample import align_index, resample_ohlcv
+from ohlcv_store import client_key, fetch_through
+from perf_metrics import MetricsAccumulator, batch_metrics
+
+try:
+    from numba import njit
+except Exception:
+    njit = None
+
 # ========== 鞈??? ==========
+# 單一行程共用的 K 線快取；交易所連線由 exchange_registry 共用 (markets 走磁碟快取)
+OHLCV_CACHE = OHLCVCache(maxsize=256, ttl=300.0)
+
+def _get_default_exchange() -> Any:
+    return get_exchange("bybit")
+
 def fetch_ohlcv(symbol: str, timeframe: str = "1h", limit: int = 1000, exchange: Optional[Any] = None) -> pd.DataFrame:
-    if exchange is None:
-        exchange = ccxt.bybit({"enableRateLimit": True})
-    try:
-        exchange.load_markets()
-    except Exception:
-        pass
+    # 記憶體快取 → 本地 OHLCV store → 交易所 (只抓缺少的 K 線)；交易所失敗時退回已存資料
+    # store / 快取鍵含市場類型 (現貨與合約的 K 線分開)
+    exchange_id = client_key(exchange) if exchange is not None else store_key("bybit")
 
-    try:
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-    except Exception:
-        ohlcv = []
+    def _load(sym: str, tf: str, n: int) -> pd.DataFrame:
+        return fetch_through(exchange, sym, timeframe=tf, limit=n,
+                             exchange_factory=_get_default_exchange, exchange_id=exchange_id)
 
-    if not ohlcv:
+    ohlcv = OHLCV_CACHE.get(exchange_id, symbol, timeframe, limit, _load)
+
+    if ohlcv.empty:
         return pd.DataFrame(columns=["timestamp", "open", "high", "low", "close", "volume"])
 
-    df = pd.DataFrame(ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"])
+    df = ohlcv.copy()
     df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms", utc=True)
     df = df.drop_duplicates(subset=["timestamp"]).sort_values("timestamp").reset_index(drop=True)
     return df
@@ -113,15 +129,9 @@ def calculate_max_drawdown(equity_curve) -> float:
     if arr.size == 0:
         return 0.0
 
-    # compute running max and drawdowns
-    running_max = np.maximum.accumulate(arr)
-    # avoid division by zero where running_max == 0
-    with np.errstate(divide="ignore", invalid="ignore"):
-        drawdowns = (running_max - arr) / np.where(running_max == 0, np.nan, running_max)
-    # replace nan with 0 for cases where running_max was zero
-    drawdowns = np.nan_to_num(drawdowns, nan=0.0, posinf=0.0, neginf=0.0)
-    max_dd = float(np.max(drawdowns)) if drawdowns.size > 0 else 0.0
-    return max_dd
+    acc = MetricsAccumulator()
+    acc.update_many(arr)
+    return float(acc.max_dd)
 
 def calculate_sharpe_ratio(equity_curve, periods_per_year: int = 252 * 24) -> float:
     """
@@ -142,23 +152,107 @@ def calculate_sharpe_ratio(equity_curve, periods_per_year: int = 252 * 24) -> fl
     if arr.size < 2:
         return 0.0
 
-    # period returns
-    returns = np.diff(arr) / (arr[:-1] + 1e-12)
-    if returns.size == 0:
-        return 0.0
+    acc = MetricsAccumulator()
+    acc.update_many(arr)
+    return float(acc.sharpe(periods_per_year, ddof=1))
 
-    mean_r = np.mean(returns)
-    std_r = np.std(returns, ddof=1) if returns.size > 1 else 0.0
-    if std_r == 0:
-        return 0.0
+# ========== 璅⊥鈭斗???==========
+def parse_timeframe_to_seconds(tf: str) -> int:
+    tf = str(tf).lower().strip()
+    if tf.endswith("m"):
+        return int(tf[:-1]) * 60
+    if tf.endswith("h"):
+        return int(tf[:-1]) * 3600
+    if tf.endswith("d"):
+        return int(tf[:-1]) * 86400
+    try:
+        return int(tf) * 60
+    except Exception:
+        return 3600
 
-    # annualize
-    sharpe = (mean_r / std_r) * np.sqrt(periods_per_year)
-    return float(sharpe)
+def encode_signals(signals, n: int) -> np.ndarray:
+    """
+    Convert a signal list ("buy"/"sell"/None/...) or a numeric array into an int8
+    vector of length n: 1 = buy, -1 = sell, 0 = hold. A short input is padded with 0.
+    """
+    out = np.zeros(n, dtype=np.int8)
+    if isinstance(signals, np.ndarray) and signals.dtype.kind in "iuf":
+        m = min(n, len(signals))
+        out[:m] = np.sign(signals[:m]).astype(np.int8)
+        return out
+    for i, s in enumerate(signals[:n]):
+        if s == "buy":
+            out[i] = 1
+        elif s == "sell":
+            out[i] = -1
+    return out
+
+if njit is not None:
+    @njit(cache=True)
+    def _simulate_kernel(sig, close, delay_bars, slippage, initial_capital):
+        n = close.shape[0]
+        equity = np.empty(n, dtype=np.float64)
+        capital = initial_capital
+        position = 0.0
+        trades = 0
+        for i in range(n):
+            exec_index = i + delay_bars
+            if exec_index > n - 1:
+                exec_index = n - 1
+            s = sig[i]
+            if s == 1 and position == 0 and capital > 0:
+                position = capital / (close[exec_index] * (1.0 + slippage))
+                capital = 0.0
+                trades += 1
+            elif s == -1 and position > 0:
+                capital = position * (close[exec_index] * (1.0 - slippage))
+                position = 0.0
+                trades += 1
+            equity[i] = capital + position * close[i]
+        return equity, trades
+else:
+    def _simulate_kernel(sig, close, delay_bars, slippage, initial_capital):
+        # NumPy fallback: the long-only state machine reduces to alternating events
+        # (first buy, first sell after it, next buy, ...), so only trades are looped over.
+        n = close.shape[0]
+        exec_px = close[np.minimum(np.arange(n) + delay_bars, n - 1)]
+        idx = np.flatnonzero(sig)
+        if initial_capital <= 0:
+            idx = idx[:0]
+        s = sig[idx]
+        keep = np.ones(len(s), dtype=bool)
+        keep[1:] = s[1:] != s[:-1]
+        idx, s = idx[keep], s[keep]
+        if len(s) and s[0] == -1:
+            idx = idx[1:]
+
+        values = np.empty(len(idx), dtype=np.float64)
+        capital = initial_capital
+        position = 0.0
+        for j, i in enumerate(idx):
+            if j % 2 == 0:
+                position = capital / (exec_px[i] * (1.0 + slippage))
+                values[j] = position
+            else:
+                capital = position * (exec_px[i] * (1.0 - slippage))
+                values[j] = capital
+
+        equity = np.full(n, float(initial_capital))
+        last = np.searchsorted(idx, np.arange(n), side="right") - 1
+        held = (last >= 0) & (last % 2 == 0)
+        flat = (last >= 0) & (last % 2 == 1)
+        equity[held] = values[last[held]] * close[held]
+        equity[flat] = values[last[flat]]
+        return equity, len(idx)
 
-# ========== 璅⊥鈭斗???==========
-def simulate_trades(df: pd.DataFrame, signals: List[Optional[str]], initial_capital: float = 1000.0, allow_partial: bool = False) -> Dict[str, Any]:
-    if df.empty or not signals:
+def simulate_trades(df, signals, initial_capital: float = 1000.0,
+                    sim_slippage: float = 0.0, sim_delay: float = 0.0, timeframe: str = "1h") -> Dict[str, Any]:
+    """
+    Long-only, all-in simulator. signals is a list of "buy"/"sell"/None or an int8 array.
+    sim_delay (seconds) moves execution to the close of a later bar; sim_slippage is
+    charged against the trader on both sides.
+    """
+    if df is None or df.empty or signals is None or len(signals) == 0:
         return {
             "trades": 0,
             "total_pnl": 0.0,
@@ -166,47 +260,35 @@ def simulate_trades(df: pd.DataFrame, signals: List[Optional[str]], initial_capi
             "sharpe_ratio": 0.0,
             "equity_curve": []
         }
+    bar_seconds = parse_timeframe_to_seconds(timeframe)
+    delay_bars = int(math.ceil(float(sim_delay) / max(1, bar_seconds)))
+    close = np.ascontiguousarray(df["close"].to_numpy(dtype=np.float64))
+    sig = encode_signals(signals, len(close))
 
-    capital = float(initial_capital)
-    position = 0.0
-    equity_curve: List[float] = []
+    equity, trades_count = _simulate_kernel(sig, close, delay_bars, float(sim_slippage), float(initial_capital))
 
-    for i in range(len(df)):
-        price = float(df["close"].iloc[i])
-        signal = signals[i] if i < len(signals) else None
-
-        if signal == "buy" and position == 0 and capital > 0:
-            position = capital / price
-            capital = 0.0
-        elif signal == "sell" and position > 0:
-            capital = position * price
-            position = 0.0
-
-        equity = capital + position * price
-        equity_curve.append(equity)
-
-    trades = sum(1 for s in signals if s in ("buy", "sell"))
-    total_pnl = equity_curve[-1] - initial_capital if equity_curve else 0.0
-    max_dd = calculate_max_drawdown(equity_curve) if equity_curve else 0.0
-    sharpe = calculate_sharpe_ratio(equity_curve) if equity_curve else 0.0
-
-    result = {
-        "trades": trades,
+    total_pnl = equity[-1] - initial_capital
+    acc = MetricsAccumulator()
+    acc.update_many(equity)
+    max_dd = acc.max_dd
+    sharpe = acc.sharpe()
+    return {
+        "trades": int(trades_count),
         "total_pnl": float(total_pnl),
         "max_drawdown": float(max_dd),
         "sharpe_ratio": float(sharpe),
-        "equity_curve": equity_curve
+        "equity_curve": equity.tolist()
     }
-    return result
 
 # ========== 蝯曹??葫隞嚗?游??豢釣?伐? ==========
-def backtest(symbol: str, strategy: str, timeframe: str = "1h", limit: int = 1000, params: Optional[Dict[str, Any]] = None, exchange: Optional[Any] = None) -> Dict[str, Any]:
+def backtest(symbol: str, strategy: str, timeframe: str = "1h", limit: int = 1000,
+             params=None, exchange=None):
     params = params or {}
     df = fetch_ohlcv(symbol, timeframe=timeframe, limit=limit, exchange=exchange)
-
-    if df.empty:
-        return simulate_trades(pd.DataFrame(), [])
-
+    if df is None or df.empty:
+        return simulate_trades(pd.DataFrame(), [], initial_capital=float(params.get("initial_capital", 1000.0)))
+    sim_slippage = float(params.get("sim_slippage", 0.0))
+    sim_delay = float(params.get("sim_delay", 0.0))
     if strategy == "trend_mix":
         short = int(params.get("short_window", 20))
         long = int(params.get("long_window", 50))
@@ -227,15 +309,123 @@ def backtest(symbol: str, strategy: str, timeframe: str = "1h", limit: int = 100
         short = int(params.get("short_window", 20))
         long = int(params.get("long_window", 50))
         signals = trend_strategy(df, short_window=short, long_window=long)
-
-    result = simulate_trades(df, signals, initial_capital=float(params.get("initial_capital", 1000)))
-    # attach some context
+    result = simulate_trades(df, signals,
+                             initial_capital=float(params.get("initial_capital", 1000.0)),
+                             sim_slippage=sim_slippage,
+                             sim_delay=sim_delay,
+                             timeframe=timeframe)
     result["symbol"] = symbol
     result["strategy"] = strategy
     result["timeframe"] = timeframe
     result["params"] = params
     return result
 
+# ========== 參數網格批次回測 ==========
+GRID_STRATEGIES = ("trend_mix", "osc_mix", "hybrid_mix")
+
+if njit is not None:
+    @njit(cache=True)
+    def _simulate_kernel_2d(sig, close, delay_bars, slippage, initial_capital):
+        m = sig.shape[0]
+        n = close.shape[0]
+        equity = np.empty((n, m), dtype=np.float64)
+        trades = np.zeros(m, dtype=np.int64)
+        for j in range(m):
+            eq, t = _simulate_kernel(sig[j], close, delay_bars[j], slippage[j], initial_capital[j])
+            equity[:, j] = eq
+            trades[j] = t
+        return equity, trades
+else:
+    def _simulate_kernel_2d(sig, close, delay_bars, slippage, initial_capital):
+        m = sig.shape[0]
+        equity = np.empty((close.shape[0], m), dtype=np.float64)
+        trades = np.zeros(m, dtype=np.int64)
+        for j in range(m):
+            equity[:, j], trades[j] = _simulate_kernel(sig[j], close, delay_bars[j], slippage[j], initial_capital[j])
+        return equity, trades
+
+def _expand_param_grid(param_grid) -> List[Dict[str, Any]]:
+    if isinstance(param_grid, dict):
+        keys = list(param_grid.keys())
+        return [dict(zip(keys, combo)) for combo in product(*param_grid.values())]
+    return [dict(p) for p in param_grid]
+
+def backtest_grid(df: pd.DataFrame, strategy: str, param_grid, timeframe: str = "1h",
+                  return_curves: bool = False) -> pd.DataFrame:
+    """
+    Evaluate many parameter sets of trend_mix / osc_mix / hybrid_mix on one OHLCV frame.
+
+    param_grid: dict of lists (like config.PARAM_GRID) or a list of param dicts.
+    Every distinct moving-average window and RSI period is computed once and shared,
+    signals for all combos are stacked into one int8 matrix and simulated together.
+    Returns one row per combo: the params plus trades / total_pnl / max_drawdown /
+    sharpe_ratio (and equity_curve when return_curves=True). Each row matches
+    backtest() with the same params on the same data.
+    """
+    if strategy not in GRID_STRATEGIES:
+        raise ValueError(f"backtest_grid does not support strategy: {strategy}")
+    combos = _expand_param_grid(param_grid)
+    if df is None or df.empty or not combos:
+        return pd.DataFrame(combos)
+
+    close_s = df["close"].astype(float)
+    close = np.ascontiguousarray(close_s.to_numpy(dtype=np.float64))
+    n, m = len(close), len(combos)
+
+    ma_cache: Dict[int, np.ndarray] = {}
+    def ma(window: int) -> np.ndarray:
+        if window not in ma_cache:
+            ma_cache[window] = close_s.rolling(window, min_periods=1).mean().to_numpy()
+        return ma_cache[window]
+
+    rsi_cache: Dict[int, np.ndarray] = {}
+    delta = close_s.diff()
+    gain = delta.clip(lower=0)
+    loss = -delta.clip(upper=0)
+    def rsi(period: int) -> np.ndarray:
+        if period not in rsi_cache:
+            avg_gain = gain.ewm(alpha=1/period, min_periods=1, adjust=False).mean()
+            avg_loss = loss.ewm(alpha=1/period, min_periods=1, adjust=False).mean()
+            rs = avg_gain / (avg_loss + 1e-9)
+            rsi_cache[period] = (100 - (100 / (1 + rs))).to_numpy()
+        return rsi_cache[period]
+
+    sig = np.zeros((m, n), dtype=np.int8)
+    capital = np.empty(m)
+    slippage = np.empty(m)
+    delay_bars = np.empty(m, dtype=np.int64)
+    bar_seconds = max(1, parse_timeframe_to_seconds(timeframe))
+
+    for j, p in enumerate(combos):
+        capital[j] = float(p.get("initial_capital", 1000.0))
+        slippage[j] = float(p.get("sim_slippage", 0.0))
+        delay_bars[j] = int(math.ceil(float(p.get("sim_delay", 0.0)) / bar_seconds))
+        # trend_mix only emits "up"/"down", which simulate_trades never executes
+        if strategy == "trend_mix":
+            continue
+        r = rsi(int(p.get("rsi_period", 14)))
+        buy = r < float(p.get("rsi_lower", 30))
+        sell = r > float(p.get("rsi_upper", 70))
+        if strategy == "hybrid_mix":
+            ms = ma(int(p.get("short_window", 20)))
+            ml = ma(int(p.get("long_window", 50)))
+            buy &= ms > ml
+            sell &= ms < ml
+        sig[j, buy] = 1
+        sig[j, sell] = -1
+
+    equity, trades = _simulate_kernel_2d(sig, close, delay_bars, slippage, capital)
+
+    out = pd.DataFrame(combos)
+    out["trades"] = trades.astype(int)
+    out["total_pnl"] = equity[-1] - capital
+    metrics = batch_metrics(equity)
+    out["max_drawdown"] = metrics["max_drawdown"]
+    out["sharpe_ratio"] = metrics["sharpe"]
+    if return_curves:
+        out["equity_curve"] = [equity[:, j].tolist() for j in range(m)]
+    return out
+
 # ========== 憭望?撠?撌亙 ==========
 def _align_high_to_low_indices(ts_high, ts_low):
     """
@@ -243,30 +433,14 @@ def _align_high_to_low_indices(ts_high, ts_low):
     For each low timeframe point find last high timeframe index <= that time.
     Works with timezone-aware and naive pandas Series/Index.
     """
-    sh = pd.Series(ts_high) if not isinstance(ts_high, pd.Series) else ts_high
-    sl = pd.Series(ts_low) if not isinstance(ts_low, pd.Series) else ts_low
-
-    def to_int64_array(s: pd.Series) -> np.ndarray:
-        s_dt = pd.to_datetime(s)
-        # if timezone-aware, convert to UTC and remove tz
-        try:
-            if getattr(s_dt.dt, "tz", None) is not None:
-                s_dt = s_dt.dt.tz_convert("UTC").dt.tz_localize(None)
-        except Exception:
-            # ignore tz ops if not available
-            pass
-        return np.array(s_dt.astype("datetime64[ns]").astype(np.int64))
-
-    hi = to_int64_array(sh)
-    lo = to_int64_array(sl)
-    idxs = np.searchsorted(hi, lo, side="right") - 1
-    return idxs
+    return align_index(ts_high, ts_low)
 
 # ========== 憭望??望嚗?蝑嚗?==========
 def backtest_multi_tf(symbol: str, strategy_func=trend_strategy, higher_tf: str = "1h", lower_tf: str = "15m", limit: int = 1000, params: Optional[Dict[str, Any]] = None, exchange: Optional[Any] = None) -> Dict[str, Any]:
     params = params or {}
-    df_high = fetch_ohlcv(symbol, timeframe=higher_tf, limit=limit, exchange=exchange)
+    # 只抓低週期一次，高週期在本地合成 (與交易所相同的分桶邊界，兩者涵蓋同一段時間)
     df_low = fetch_ohlcv(symbol, timeframe=lower_tf, limit=limit * 4, exchange=exchange)
+    df_high = resample_ohlcv(df_low, higher_tf)
 
     if df_high.empty or df_low.empty:
         return simulate_trades(pd.DataFrame(), [])
@@ -307,8 +481,9 @@ def backtest_multi_tf_hybrid(symbol: str, higher_tf: str = "1h", lower_tf: str =
     rsi_upper = float(params.get("rsi_upper", 70))
     rsi_lower = float(params.get("rsi_lower", 30))
 
-    df_high = fetch_ohlcv(symbol, timeframe=higher_tf, limit=limit, exchange=exchange)
+    # 只抓低週期一次，高週期在本地合成 (與交易所相同的分桶邊界，兩者涵蓋同一段時間)
     df_low = fetch_ohlcv(symbol, timeframe=lower_tf, limit=limit * 4, exchange=exchange)
+    df_high = resample_ohlcv(df_low, higher_tf)
 
     if df_high.empty or df_low.empty:
         return simulate_trades(pd.DataFrame(), [])
@@ -398,103 +573,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-# ---------- PATCH START: inserted functions for sim_slippage and sim_delay ----------
-import math
-def parse_timeframe_to_seconds(tf: str) -> int:
-    tf = str(tf).lower().strip()
-    if tf.endswith("m"):
-        return int(tf[:-1]) * 60
-    if tf.endswith("h"):
-        return int(tf[:-1]) * 3600
-    if tf.endswith("d"):
-        return int(tf[:-1]) * 86400
-    try:
-        return int(tf) * 60
-    except Exception:
-        return 3600
-
-def simulate_trades(df, signals, initial_capital: float = 1000.0,
-                    sim_slippage: float = 0.0, sim_delay: float = 0.0, timeframe: str = "1h"):
-    if df is None or df.empty or not signals:
-        return {
-            "trades": 0,
-            "total_pnl": 0.0,
-            "max_drawdown": 0.0,
-            "sharpe_ratio": 0.0,
-            "equity_curve": []
-        }
-    bar_seconds = parse_timeframe_to_seconds(timeframe)
-    delay_bars = int(math.ceil(float(sim_delay) / max(1, bar_seconds)))
-    capital = float(initial_capital)
-    position = 0.0
-    equity_curve = []
-    trades_count = 0
-    prices = [float(x) for x in df["close"].values]
-    n = len(prices)
-    for i in range(n):
-        price = prices[i]
-        signal = signals[i] if i < len(signals) else None
-        exec_index = min(n - 1, i + delay_bars)
-        exec_price_base = prices[exec_index]
-        if signal == "buy" and position == 0 and capital > 0:
-            exec_price = exec_price_base * (1.0 + float(sim_slippage))
-            position = capital / exec_price
-            capital = 0.0
-            trades_count += 1
-        elif signal == "sell" and position > 0:
-            exec_price = exec_price_base * (1.0 - float(sim_slippage))
-            capital = position * exec_price
-            position = 0.0
-            trades_count += 1
-        equity = capital + position * price
-        equity_curve.append(equity)
-    total_pnl = equity_curve[-1] - initial_capital if equity_curve else 0.0
-    max_dd = calculate_max_drawdown(equity_curve) if equity_curve else 0.0
-    sharpe = calculate_sharpe_ratio(equity_curve) if equity_curve else 0.0
-    return {
-        "trades": int(trades_count),
-        "total_pnl": float(total_pnl),
-        "max_drawdown": float(max_dd),
-        "sharpe_ratio": float(sharpe),
-        "equity_curve": equity_curve
-    }
-
-def backtest(symbol: str, strategy: str, timeframe: str = "1h", limit: int = 1000,
-             params=None, exchange=None):
-    params = params or {}
-    df = fetch_ohlcv(symbol, timeframe=timeframe, limit=limit, exchange=exchange)
-    if df is None or df.empty:
-        return simulate_trades(pd.DataFrame(), [], initial_capital=float(params.get("initial_capital", 1000.0)))
-    sim_slippage = float(params.get("sim_slippage", 0.0))
-    sim_delay = float(params.get("sim_delay", 0.0))
-    if strategy == "trend_mix":
-        short = int(params.get("short_window", 20))
-        long = int(params.get("long_window", 50))
-        signals = trend_strategy(df, short_window=short, long_window=long)
-    elif strategy == "osc_mix":
-        period = int(params.get("rsi_period", 14))
-        upper = float(params.get("rsi_upper", 70))
-        lower = float(params.get("rsi_lower", 30))
-        signals = osc_strategy(df, period=period, upper=upper, lower=lower)
-    elif strategy == "hybrid_mix":
-        short = int(params.get("short_window", 20))
-        long = int(params.get("long_window", 50))
-        period = int(params.get("rsi_period", 14))
-        upper = float(params.get("rsi_upper", 70))
-        lower = float(params.get("rsi_lower", 30))
-        signals = hybrid_strategy(df, short_window=short, long_window=long, period=period, upper=upper, lower=lower)
-    else:
-        short = int(params.get("short_window", 20))
-        long = int(params.get("long_window", 50))
-        signals = trend_strategy(df, short_window=short, long_window=long)
-    result = simulate_trades(df, signals,
-                             initial_capital=float(params.get("initial_capital", 1000.0)),
-                             sim_slippage=sim_slippage,
-                             sim_delay=sim_delay,
-                             timeframe=timeframe)
-    result["symbol"] = symbol
-    result["strategy"] = strategy
-    result["timeframe"] = timeframe
-    result["params"] = params
-    return result
-# ---------- PATCH END ----------
@@ -1,18 +1,38 @@
 import os
+import time
 import pandas as pd
-import ccxt
+
+from exchange_registry import get_exchange
+from kline_downloader import ccxt_pages, download
+from ohlcv_store import client_key, default_store, timeframe_ms
 
 from code.get_top_50_assets import get_top_50_assets_by_volume
 
-def download_ohlcv(exchange, symbol, timeframe, limit=1000):
-    data = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-    df = pd.DataFrame(data, columns=[
-        "datetime","open","high","low","close","volume"
-    ])
+def download_many(exchange, symbols, timeframes, limit=1000):
+    """
+    所有 symbol × timeframe 的最近 limit 根一起分段並行下載進本地 OHLCV store
+    (已存在的 K 線不再重抓，共用同一個權重預算)，回傳 { (symbol, timeframe): df }
+    """
+    now = int(time.time() * 1000)
+    jobs = [(sym, tf, now - limit * timeframe_ms(tf), now) for sym in symbols for tf in timeframes]
+    key = client_key(exchange)
+    download(jobs, fetch_page=ccxt_pages(exchange), exchange_id=key)
+    store = default_store()
+    return {(sym, tf): store.read(key, sym, tf, start=start).tail(limit).reset_index(drop=True)
+            for sym, tf, start, _ in jobs}
+
+def _to_frame(df, symbol, timeframe):
+    if df.empty:
+        raise RuntimeError(f"no OHLCV data for {symbol} {timeframe}")
+    df = df.rename(columns={"timestamp": "datetime"})
     df["datetime"] = pd.to_datetime(df["datetime"], unit="ms")
     df.set_index("datetime", inplace=True)
     return df
 
+def download_ohlcv(exchange, symbol, timeframe, limit=1000):
+    df = download_many(exchange, [symbol], [timeframe], limit)[(symbol, timeframe)]
+    return _to_frame(df, symbol, timeframe)
+
 if __name__ == "__main__":
     # 确保已安装：ccxt, pandas
     # pip install ccxt pandas
@@ -21,14 +41,16 @@ if __name__ == "__main__":
     ohlcv_dir    = os.path.join(project_root, "data", "ohlcv")
     os.makedirs(ohlcv_dir, exist_ok=True)
 
-    exchange = ccxt.binance()
+    exchange = get_exchange("binance")
     assets   = get_top_50_assets_by_volume()
 
+    timeframes = ["5m", "4h"]
+    frames = download_many(exchange, assets, timeframes, limit=1000)
     for sym in assets:
         sym_file = sym.replace("/", "_")
-        for tf in ["5m", "4h"]:
+        for tf in timeframes:
             try:
-                df = download_ohlcv(exchange, sym, tf, limit=1000)
+                df = _to_frame(frames[(sym, tf)], sym, tf)
                 out_path = os.path.join(ohlcv_dir, f"{sym_file}_{tf}.csv")
                 df.to_csv(out_path)
                 print(f"Saved {out_path}")
@@ -2,19 +2,24 @@ import os
 import optuna
 import numpy as np
 import pandas as pd
+from datetime import datetime
 
+from optuna_pruning import Checkpoints, make_pruner
+from parallel_optuna import run_parallel
+from pareto import study_front
 from code.get_top_50_assets import get_top_50_assets_by_volume
 from code.ai_predict_trend import ai_predict_trend
 from code.simulate_dca_strategy import simulate_dca_strategy
 
-def objective(trial):
-    # 建議/優化參數
-    rsi_threshold = trial.suggest_int("rsi_threshold", 20, 80)
-    td_confirm    = trial.suggest_categorical("td_confirm", [True, False])
-    dca_ratio     = trial.suggest_float("dca_ratio", 0.1, 0.5)
-    dca_spacing   = trial.suggest_float("dca_spacing", 0.01, 0.05)
-    dca_max_steps = trial.suggest_int("dca_max_steps", 1, 5)
+# run_parallel worker 啟動時注入的 { sym_file: 5m DataFrame }；未注入時每個 trial 自行選股讀檔
+_FRAMES = None
+
+def attach_frames(frames):
+    global _FRAMES
+    _FRAMES = frames
 
+def load_selected_frames():
+    """選股 (AI 趨勢判斷) 並讀入 5m K 線；與 trial 參數無關，整個 study 只需做一次"""
     project_root = os.path.dirname(os.path.dirname(__file__))
     top_assets   = get_top_50_assets_by_volume()
     selected     = []
@@ -27,21 +32,32 @@ def objective(trial):
         if len(selected) >= 10:
             break
 
-    pnls, maxdds, sharpes = [], [], []
-
-    # 回測模擬
+    frames = {}
     for sym_file in selected:
         path_5m = os.path.join(project_root, "data", "ohlcv", f"{sym_file}_5m.csv")
         path_4h = os.path.join(project_root, "data", "ohlcv", f"{sym_file}_4h.csv")
-
-        try:
-            data_5m = pd.read_csv(path_5m, parse_dates=True, index_col="datetime")
-            data_4h = pd.read_csv(path_4h, parse_dates=True, index_col="datetime")
-        except FileNotFoundError:
-            # 如果檔案不存在就跳過該資產
+        # 如果檔案不存在就跳過該資產
+        if not os.path.exists(path_5m) or not os.path.exists(path_4h):
             continue
+        frames[sym_file] = pd.read_csv(path_5m, parse_dates=True, index_col="datetime")
+    return frames
+
+def objective(trial):
+    # 建議/優化參數
+    rsi_threshold = trial.suggest_int("rsi_threshold", 20, 80)
+    td_confirm    = trial.suggest_categorical("td_confirm", [True, False])
+    dca_ratio     = trial.suggest_float("dca_ratio", 0.1, 0.5)
+    dca_spacing   = trial.suggest_float("dca_spacing", 0.01, 0.05)
+    dca_max_steps = trial.suggest_int("dca_max_steps", 1, 5)
 
-        pnl, maxdd, sharpe = simulate_dca_strategy(
+    frames = _FRAMES if _FRAMES is not None else load_selected_frames()
+    pnls, maxdds, sharpes = [], [], []
+    # 每回測完一個資產回報一次平均報酬，明顯落後的參數組不必跑完所有資產
+    checkpoints = Checkpoints(trial, n_bars=len(frames), n_checkpoints=len(frames))
+
+    # 回測模擬
+    for i, (sym_file, data_5m) in enumerate(frames.items()):
+        pnl, maxdd, sharpe, _ = simulate_dca_strategy(
             data_5m,
             rsi_threshold,
             td_confirm,
@@ -52,6 +68,8 @@ def objective(trial):
         pnls.append(pnl)
         maxdds.append(maxdd)
         sharpes.append(sharpe)
+        if checkpoints.due(i):
+            checkpoints.report(i, np.mean(pnls))
 
     # 如果都沒有回測到任何資料，視為失敗
     if not pnls:
@@ -60,23 +78,35 @@ def objective(trial):
     return np.mean(pnls), np.mean(maxdds), np.mean(sharpes)
 
 
+def nsga2_sampler(seed):
+    return optuna.samplers.NSGAIISampler(seed=seed)
+
+
 if __name__ == "__main__":
     project_root = os.path.dirname(os.path.dirname(__file__))
     db_path      = os.path.join(project_root, "dca_study.db")
     storage_url  = f"sqlite:///{db_path}"
 
-    study = optuna.create_study(
-        directions=["maximize", "minimize", "maximize"],
-        sampler=optuna.samplers.NSGAIISampler(),
-        storage=storage_url,
+    frames = load_selected_frames()
+    if not frames:
+        raise RuntimeError("No valid OHLCV CSV found for any selected asset.")
+
+    # 多行程共同最佳化；同一天重跑只補足本次未完成的 50 個 trial
+    study = run_parallel(
+        objective,
         study_name="dca_study",
-        load_if_exists=True
+        storage=storage_url,
+        n_trials=50,
+        directions=["maximize", "minimize", "maximize"],
+        run_id=datetime.now().strftime("%Y%m%d"),
+        sampler_factory=nsga2_sampler,
+        pruner=make_pruner(multi_objective=True),
+        shared=frames,
+        setup=attach_frames,
     )
 
-    study.optimize(objective, n_trials=50, show_progress_bar=True)
-
     # 匯出最佳結果
-    best    = study.best_trials
+    best    = study_front(study)
     records = []
     for t in best:
         rec = {
@@ -1,10 +1,11 @@
 # adaptive_dca_ai/code/simulate_dca_strategy.py
 from typing import Tuple, Any, List
 import pandas as pd
-import numpy as np
 import logging
 import os
 
+from perf_metrics import MetricsAccumulator
+
 _log = logging.getLogger("adaptive_dca_ai.simulate_dca_strategy")
 if not _log.handlers:
     _log.addHandler(logging.StreamHandler())
@@ -62,23 +63,14 @@ def simulate_dca_strategy(
 
     # simple equity: scale normalized price series to initial capital
     norm = closes / closes[0]
-    equity = (norm * initial_capital).tolist()
+    equity = norm * initial_capital
 
+    # single pass over the series: running peak / drawdown and Welford return stats
+    metrics = MetricsAccumulator()
+    metrics.update_many(equity)
     pnl_usd = equity[-1] - initial_capital
-    # max drawdown simple calculation
-    peak = -float("inf")
-    maxdd = 0.0
-    for v in equity:
-        if v > peak:
-            peak = v
-        dd = (peak - v) / max(1.0, peak)
-        if dd > maxdd:
-            maxdd = dd
+    maxdd = metrics.max_dd
     # simple sharpe approximation: mean return / std of returns * sqrt(252)
-    rets = np.diff(equity) / np.maximum(equity[:-1], 1e-9)
-    if rets.size > 1:
-        sharpe = float((rets.mean() / (rets.std() + 1e-12)) * (252 ** 0.5))
-    else:
-        sharpe = 0.0
+    sharpe = metrics.sharpe(periods_per_year=252, ddof=0, eps=1e-12)
 
-    return float(pnl_usd), float(maxdd), float(sharpe), equity
\ No newline at end of file
+    return float(pnl_usd), float(maxdd), float(sharpe), equity.tolist()
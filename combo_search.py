@@ -0,0 +1,156 @@
+# combo_search.py
+"""
+互補策略組合的快速搜尋
+
+不再對每一組 combinations 逐一組出平均權益曲線重算回撤 / Sharpe，而是：
+1. 所有候選權益曲線截到共同長度，逐根報酬疊成一個 (n_bars, n_curves) 矩陣，只算一次平均向量與共變異矩陣
+2. 等權組合的 Sharpe 由 mean(mu[G]) / sqrt(sum(cov[G, G]) / k²) 直接得出 (每根再平衡的近似)
+3. 以 beam search 由兩兩組合逐層擴充到 max_group_size，每層只保留近似 Sharpe 最高的 beam_width 組
+4. 只對進入決選的組合組出實際的平均權益曲線，重算 PnL / 最大回撤 / Sharpe 後排序
+
+1000 條候選曲線、每組最多 5 個策略仍在秒級完成。
+"""
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from perf_metrics import PERIODS_PER_YEAR, MetricsAccumulator
+
+MIN_CURVE_LEN = 3  # 至少兩筆報酬才有 Sharpe
+
+
+# ========== 報酬矩陣 ==========
+def return_matrix(curves: Sequence[Sequence[float]]) -> np.ndarray:
+    """截到最短曲線長度後的逐根報酬矩陣 (n_bars - 1, n_curves)；前一根為 0 或非有限值的報酬記為 0"""
+    length = min(len(c) for c in curves)
+    eq = np.column_stack([np.asarray(c[:length], dtype=np.float64) for c in curves])
+    prev = eq[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = (eq[1:] - prev) / prev
+    r[~np.isfinite(r) | (prev == 0)] = 0.0
+    return r
+
+
+def _sharpe(mean: np.ndarray, var: np.ndarray, periods_per_year: float) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(var > 0, mean / np.sqrt(var) * np.sqrt(periods_per_year), 0.0)
+
+
+# ========== beam search ==========
+def beam_search(mu: np.ndarray, cov: np.ndarray, max_group_size: int = 3, min_group_size: int = 2,
+                beam_width: int = 200, periods_per_year: float = PERIODS_PER_YEAR) -> List[Tuple[Tuple[int, ...], float]]:
+    """
+    回傳 [(組合索引 tuple, 近似 Sharpe), ...]，包含 min_group_size..max_group_size 各層 beam 內的組合。
+    每層以 B × n 的向量運算擴充：新成員 j 的組合平均 = (S + mu_j) / (k + 1)，
+    變異 = (Q + 2 * sum_i cov[i, j] + cov[j, j]) / (k + 1)²，S / Q 為原組合的報酬和與共變異區塊和。
+    """
+    n = len(mu)
+    max_group_size = min(max_group_size, n)
+    if n < 2 or max_group_size < 2:
+        return []
+    diag = np.diag(cov)
+
+    # 第一層：所有兩兩組合一次算完
+    iu, ju = np.triu_indices(n, k=1)
+    scores = _sharpe((mu[iu] + mu[ju]) / 2, (diag[iu] + diag[ju] + 2 * cov[iu, ju]) / 4, periods_per_year)
+    keep = _top(scores, beam_width)
+    beam = [(iu[t], ju[t]) for t in keep]
+    beam_scores = scores[keep]
+
+    found = []
+    if min_group_size <= 2:
+        found.extend(zip(beam, beam_scores.tolist()))
+
+    for k in range(2, max_group_size):
+        members = np.asarray(beam)                              # (B, k)
+        sum_mu = mu[members].sum(axis=1)                        # (B,)
+        quad = cov[members[:, :, None], members[:, None, :]].sum(axis=(1, 2))
+        cross = cov[members].sum(axis=1)                        # (B, n)：sum_i cov[i, j]
+        mean = (sum_mu[:, None] + mu[None, :]) / (k + 1)
+        var = (quad[:, None] + 2 * cross + diag[None, :]) / (k + 1) ** 2
+        scores = _sharpe(mean, var, periods_per_year)
+        np.put_along_axis(scores, members, -np.inf, axis=1)     # 不重複加入已在組內的成員
+
+        # 同一組合可由不同前綴擴充而來，取前幾名時去重
+        flat = scores.ravel()
+        order = _top(flat, min(flat.size, beam_width * (k + 1)))
+        seen = set()
+        new_beam, new_scores = [], []
+        for t in order:
+            if not np.isfinite(flat[t]):
+                break
+            b, j = divmod(int(t), n)
+            group = tuple(sorted((*beam[b], j)))
+            if group in seen:
+                continue
+            seen.add(group)
+            new_beam.append(group)
+            new_scores.append(float(flat[t]))
+            if len(new_beam) >= beam_width:
+                break
+        if not new_beam:
+            break
+        beam, beam_scores = new_beam, np.asarray(new_scores)
+        if k + 1 >= min_group_size:
+            found.extend(zip(beam, new_scores))
+    return [(tuple(int(i) for i in g), float(s)) for g, s in found]
+
+
+def _top(scores: np.ndarray, count: int) -> np.ndarray:
+    """分數最高的 count 個位置 (由高到低)"""
+    count = min(count, scores.size)
+    if count <= 0:
+        return np.empty(0, dtype=np.int64)
+    part = np.argpartition(-scores, count - 1)[:count]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+# ========== 決選 ==========
+def _combo_metrics(curves: Sequence[Sequence[float]], periods_per_year: float) -> Dict[str, float]:
+    """決選組合：各成員截到組內最短長度後平均，重算實際 PnL / 最大回撤 / Sharpe"""
+    length = min(len(c) for c in curves)
+    combo = np.mean([np.asarray(c[:length], dtype=np.float64) for c in curves], axis=0)
+    acc = MetricsAccumulator()
+    acc.update_many(combo)
+    return {"pnl": acc.pnl, "drawdown": acc.max_dd, "sharpe": acc.sharpe(periods_per_year)}
+
+
+def search_combos(curves: Dict[Hashable, Sequence[float]], max_group_size: int = 3, min_group_size: int = 2,
+                  top_n: int = 5, beam_width: int = 200, n_finalists: Optional[int] = None,
+                  periods_per_year: float = PERIODS_PER_YEAR) -> pd.DataFrame:
+    """
+    curves: { 候選 key: 權益曲線 }
+    回傳依實際 Sharpe 排序的前 top_n 組：combo (以 " + " 串接的 key)、group、size、approx_sharpe、pnl、drawdown、sharpe
+    n_finalists: 以近似 Sharpe 取多少組進入決選重算 (預設 max(4 * top_n, 20))
+    """
+    columns = ["combo", "group", "size", "approx_sharpe", "pnl", "drawdown", "sharpe"]
+    keys = [k for k, c in curves.items() if c is not None and len(c) >= MIN_CURVE_LEN]
+    if len(keys) < 2:
+        return pd.DataFrame(columns=columns)
+
+    values = [curves[k] for k in keys]
+    r = return_matrix(values)
+    if r.shape[0] < 2:
+        return pd.DataFrame(columns=columns)
+    mu = r.mean(axis=0)
+    cov = np.atleast_2d(np.cov(r, rowvar=False, ddof=1))
+
+    found = beam_search(mu, cov, max_group_size=max_group_size, min_group_size=min_group_size,
+                        beam_width=beam_width, periods_per_year=periods_per_year)
+    if not found:
+        return pd.DataFrame(columns=columns)
+    n_finalists = n_finalists or max(4 * top_n, 20)
+    found.sort(key=lambda item: item[1], reverse=True)
+
+    rows = []
+    for group, approx in found[:n_finalists]:
+        rows.append({
+            "combo": " + ".join(str(keys[i]) for i in group),
+            "group": tuple(keys[i] for i in group),
+            "size": len(group),
+            "approx_sharpe": approx,
+            **_combo_metrics([values[i] for i in group], periods_per_year),
+        })
+    out = pd.DataFrame(rows, columns=columns)
+    return out.sort_values("sharpe", ascending=False, kind="stable").head(top_n).reset_index(drop=True)
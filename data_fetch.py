@@ -1,35 +1,78 @@
 import pandas as pd
-import ccxt
+from exchange_registry import get_exchange, store_key
+from ohlcv_store import fetch_through, timeframe_ms
+from ohlcv_resample import resample_ohlcv
 
-def fetch_multi_timeframes(symbol="BTC/USDT", limit=1000):
+TIMEFRAMES = ["1m", "15m", "1h", "4h", "1d"]
+EXCHANGE_KEY = store_key("bybit", "future")   # store 鍵含市場類型，合約 K 線不與現貨混存
+MAX_BASE_BARS = 25_000   # 一個抓取序列最多的根數 (約 25 頁)；合成需要更多時改抓較粗的週期作為另一個基準
+
+def _base_bars(timeframe, base_timeframe, limit):
+    """
+    由 base_timeframe 在本地合成 limit 根 timeframe (多抓一根份，丟掉開頭不完整的那根) 所需的基準根數；
+    不能整除 (或月線) 時回傳 None
+    """
+    if str(timeframe).strip().endswith("M") or str(base_timeframe).strip().endswith("M"):
+        return None
+    step, base_step = timeframe_ms(timeframe), timeframe_ms(base_timeframe)
+    if step % base_step:
+        return None
+    return (limit + 1) * (step // base_step)
+
+def _duration(timeframe):
+    tf = str(timeframe).strip()
+    return 31 * 86_400_000 * int(tf[:-1] or 1) if tf.endswith("M") else timeframe_ms(tf)
+
+def plan_sources(timeframes, limit=1000, max_base_bars=MAX_BASE_BARS):
     """
-    從 Bybit 抓取多週期 K 線資料
+    { 向交易所抓的週期: [根數, [由它在本地合成的週期]] }。由細到粗，每個週期優先由最粗的已抓序列合成，
+    合成所需根數超過 max_base_bars 時自己成為新的抓取序列；
+    limit=1000 時 1m 抓 15015 根合成 15m，1h 抓 24024 根合成 4h / 1d，共兩個序列
+    """
+    plan = {}
+    for tf in sorted(dict.fromkeys(timeframes), key=_duration):
+        for base in reversed(list(plan)):
+            n = _base_bars(tf, base, limit)
+            if n is not None and n <= max_base_bars:
+                plan[base][0] = max(plan[base][0], n)
+                plan[base][1].append(tf)
+                break
+        else:
+            plan[tf] = [limit, []]
+    return plan
+
+def fetch_multi_timeframes(symbol="BTC/USDT", limit=1000, timeframes=TIMEFRAMES):
+    """
+    從 Bybit 抓取多週期 K 線資料：只抓 plan_sources 選出的少數週期 (經本地 store，只補缺少的 K 線)，
+    其餘週期由較細的序列在本地合成，分桶邊界與交易所相同
     symbol: 幣對 (例如 "BTC/USDT")
-    limit: K 線數量
-    回傳: dict { timeframe: DataFrame }
+    limit: 每個週期的 K 線數量
+    回傳: dict { timeframe: DataFrame }；多週期對齊索引請用 ohlcv_resample.alignment(dfs)
     """
-    exchange = ccxt.bybit({
-        "options": {"defaultType": "future"}
-    })
+    # 共用連線延後到真的需要向交易所補抓時才建立
+    def _exchange():
+        return get_exchange("bybit", market_type="future")
 
-    timeframes = ["1m", "15m", "1h", "4h", "1d"]
     dfs = {}
-
-    for tf in timeframes:
+    for tf, (n, derived) in plan_sources(timeframes, limit).items():
         try:
-            ohlcv = exchange.fetch_ohlcv(symbol, timeframe=tf, limit=limit)
-            df = pd.DataFrame(ohlcv, columns=["timestamp","open","high","low","close","volume"])
+            # 讀穿本地 store，只補抓缺少的 K 線 (超過單頁上限時分頁)
+            df = fetch_through(None, symbol, timeframe=tf, limit=n, exchange_factory=_exchange,
+                               exchange_id=EXCHANGE_KEY)
+            if df.empty:
+                raise ValueError("no data")
             df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-            df.set_index("timestamp", inplace=True)
-            dfs[tf] = df
+            df = df.set_index("timestamp")
         except Exception as e:
             print(f"抓取 {symbol} {tf} 失敗: {e}")
-            dfs[tf] = pd.DataFrame()
-
-    return dfs
+            df = pd.DataFrame()
+        dfs[tf] = df.tail(limit)
+        for high_tf in derived:
+            dfs[high_tf] = resample_ohlcv(df, high_tf).tail(limit) if not df.empty else pd.DataFrame()
+    return {tf: dfs[tf] for tf in timeframes}
 
 if __name__ == "__main__":
     dfs = fetch_multi_timeframes("BTC/USDT", limit=10)
     for tf, df in dfs.items():
         print(f"\n=== {tf} ===")
-        print(df.head())
\ No newline at end of file
+        print(df.head())
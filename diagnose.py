@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime
-from itertools import product, combinations
+from itertools import product
 
 from volume_scanner import get_top_volume_symbols
 from portfolio_manager import PortfolioManager
@@ -10,15 +10,21 @@ from position_logger import log_positions
 from report_generator import generate_report
 from execution_engine import ExecutionEngine
 from backtester import (
+    GRID_STRATEGIES,
     backtest,
+    backtest_grid,
     backtest_multi_tf,
     backtest_multi_tf_hybrid,
-    calculate_max_drawdown,
-    calculate_sharpe_ratio,
     trend_strategy,
     osc_strategy,
-    hybrid_strategy
+    hybrid_strategy,
+    fetch_ohlcv,
+    simulate_trades,
+    OHLCV_CACHE
 )
+from exchange_registry import ensure_markets, get_exchange
+from combo_search import search_combos
+from monte_carlo import robustness_many
 from config import STRATEGIES, TIMEFRAMES, PARAM_GRID, MULTI_TF_CONFIG
 
 # 強制 stdout/stderr 為 UTF-8，避免 CP950 無法輸出 emoji 導致的 UnicodeEncodeError
@@ -68,21 +74,67 @@ def batch_backtest(symbols):
     results = {}
     param_combos = list(product(*PARAM_GRID.values()))
     param_keys = list(PARAM_GRID.keys())
+    param_dicts = [dict(zip(param_keys, combo)) for combo in param_combos]
 
     for symbol in symbols:
+        # 每個 symbol × timeframe 只抓一次 K 線，單週期策略整個參數網格一次向量化回測
+        grids = {}
+        for timeframe in TIMEFRAMES:
+            df = fetch_ohlcv(symbol, timeframe=timeframe, limit=1000)
+            for strategy in STRATEGIES:
+                if strategy in GRID_STRATEGIES:
+                    grids[(strategy, timeframe)] = backtest_grid(df, strategy, param_dicts, timeframe=timeframe, return_curves=True)
+
         for strategy in STRATEGIES:
             for timeframe in TIMEFRAMES:
-                for i, combo in enumerate(param_combos):
-                    param_dict = dict(zip(param_keys, combo))
+                grid = grids.get((strategy, timeframe))
+                shared = None
+                for i, param_dict in enumerate(param_dicts):
                     key = (symbol, strategy, timeframe, f"param_{i}")
 
-                    result = run_backtest(symbol, strategy, timeframe, param_dict)
+                    if grid is not None and not grid.empty:
+                        row = grid.iloc[i]
+                        result = {
+                            "trades": int(row["trades"]),
+                            "total_pnl": float(row["total_pnl"]),
+                            "max_drawdown": float(row["max_drawdown"]),
+                            "sharpe_ratio": float(row["sharpe_ratio"]),
+                            "equity_curve": row["equity_curve"],
+                            "symbol": symbol,
+                            "strategy": strategy,
+                            "timeframe": timeframe,
+                            "params": param_dict,
+                        }
+                    elif grid is not None:
+                        result = simulate_trades(pd.DataFrame(), [])
+                    else:
+                        # 多週期策略不吃網格參數，同一 symbol 只回測一次
+                        if shared is None:
+                            shared = run_backtest(symbol, strategy, timeframe, param_dict)
+                        result = dict(shared)
                     result["equity_curve"] = result.get("equity_curve", [])
                     results[key] = result
 
     return pd.DataFrame(results).T
 
 
+# ========== Monte Carlo 穩健度 ==========
+MC_PATHS = 10000
+
+
+def add_robustness(df, n_paths=MC_PATHS):
+    """對每條權益曲線重抽報酬路徑，加上 mc_pnl_p5 / mc_max_drawdown_p95 / mc_sharpe_p5 等欄位"""
+    if "equity_curve" not in df.columns:
+        return df
+    curves = {idx: c for idx, c in df["equity_curve"].items() if isinstance(c, (list, np.ndarray)) and len(c) > 2}
+    if not curves:
+        return df
+    mc = robustness_many(curves, n_paths=n_paths, seed=0)
+    for col in mc.columns:
+        df[f"mc_{col}"] = mc[col]
+    return df
+
+
 # ========== 結果解讀 ==========
 def interpret_results(df):
     print("\n=== 快速解讀 ===")
@@ -97,68 +149,33 @@ def interpret_results(df):
 
 
 # ========== 策略組合推薦 ==========
+COMBO_COLUMNS = ["combo", "pnl", "drawdown", "sharpe"]
+
+
+def _combo_candidates(df):
+    if "equity_curve" not in df.columns:
+        return {}
+    return {idx: c for idx, c in df["equity_curve"].items() if isinstance(c, (list, np.ndarray)) and len(c) > 2}
+
+
+def _format_combos(found):
+    if found.empty:
+        return pd.DataFrame(columns=COMBO_COLUMNS)
+    return found[COMBO_COLUMNS].round({"pnl": 2, "drawdown": 3, "sharpe": 2})
+
+
 def find_complementary_combos(df, top_n=5):
     print("\n=== 自動推薦互補策略組合 ===")
-    combos = list(combinations(df.index, 2))
-    results = []
-
-    for a, b in combos:
-        curve_a = df.loc[a].get("equity_curve", [])
-        curve_b = df.loc[b].get("equity_curve", [])
-        if not curve_a or not curve_b:
-            continue
-
-        min_len = min(len(curve_a), len(curve_b))
-        if min_len == 0:
-            continue
-
-        combo_curve = [(curve_a[i] + curve_b[i]) / 2 for i in range(min_len)]
-        pnl = combo_curve[-1] - combo_curve[0]
-        dd = calculate_max_drawdown(combo_curve)
-        sharpe = calculate_sharpe_ratio(combo_curve)
-
-        results.append({
-            "combo": f"{a} + {b}",
-            "pnl": round(pnl, 2),
-            "drawdown": round(dd, 3),
-            "sharpe": round(sharpe, 2)
-        })
-
-    df_combo = pd.DataFrame(results).sort_values(by="sharpe", ascending=False).head(top_n)
+    df_combo = _format_combos(search_combos(_combo_candidates(df), max_group_size=2, top_n=top_n))
     print(df_combo if not df_combo.empty else "（無可用組合）")
     return df_combo
 
 
-def optimize_combos(df, max_group_size=3, top_n=5):
+def optimize_combos(df, max_group_size=3, top_n=5, beam_width=200):
+    """以報酬共變異矩陣 + beam search 搜尋 2..max_group_size 策略的等權組合，只對決選組合重算回撤"""
     print(f"\n=== 最佳策略組合推薦 (最多 {max_group_size} 策略) ===")
-    candidates = [idx for idx in df.index if isinstance(df.loc[idx].get("equity_curve", []), list)]
-    results = []
-
-    for r in range(2, max_group_size + 1):
-        for group in combinations(candidates, r):
-            curves = [df.loc[g].get("equity_curve", []) for g in group]
-            lens = [len(c) for c in curves if c]
-            if not lens:
-                continue
-            min_len = min(lens)
-            if min_len == 0:
-                continue
-
-            curves = [np.array(c[:min_len]) for c in curves]
-            combo_curve = sum(curves) / len(curves)
-
-            pnl = combo_curve[-1] - combo_curve[0]
-            dd = calculate_max_drawdown(combo_curve)
-            sharpe = calculate_sharpe_ratio(combo_curve)
-
-            results.append({
-                "combo": " + ".join([str(g) for g in group]),
-                "pnl": round(pnl, 2),
-                "drawdown": round(dd, 3),
-                "sharpe": round(sharpe, 2)
-            })
-
-    df_opt = pd.DataFrame(results).sort_values(by="sharpe", ascending=False).head(top_n)
+    df_opt = _format_combos(search_combos(_combo_candidates(df), max_group_size=max_group_size,
+                                          top_n=top_n, beam_width=beam_width))
     print(df_opt if not df_opt.empty else "（無最佳組合）")
     return df_opt
 
@@ -186,6 +203,14 @@ def analyze_results(df, pm):
     except Exception:
         print("（資料不足）")
 
+    print("\n=== Top 5 策略 (依 Monte Carlo Sharpe 5% 分位) ===")
+    try:
+        add_robustness(df)
+        print(df.sort_values(by="mc_sharpe_p5", ascending=False)[
+            ["mc_pnl_p5", "mc_max_drawdown_p95", "mc_sharpe_p5", "mc_prob_loss"]].head(5))
+    except Exception as e:
+        print(f"（Monte Carlo 失敗: {e}）")
+
     interpret_results(df)
 
     print("\n=== 多週期混合共振專區 (multi_tf_hybrid) ===")
@@ -220,10 +245,8 @@ def analyze_results(df, pm):
 
 # ========== 主程式 ==========
 def _valid_symbol_filter(symbols):
-    import ccxt
-    exchange = ccxt.bybit({"enableRateLimit": True})
     try:
-        markets = exchange.load_markets()
+        markets = ensure_markets(get_exchange("bybit", load_markets=False))
     except Exception:
         markets = {}
     valid = []
@@ -259,6 +282,7 @@ if __name__ == "__main__":
     print(selected)
 
     df = batch_backtest(selected)
+    print(f"\n📦 K 線快取統計: {OHLCV_CACHE.stats()}")
     analyze_results(df, pm)
 
     engine = ExecutionEngine(mode="simulate", base_capital=10000, stop_loss=0.05, take_profit=0.1)
@@ -0,0 +1,144 @@
+# exchange_registry.py
+"""
+行程內共用的 ccxt 交易所連線
+
+get_exchange() 對同一組 (交易所, 市場類型, testnet, API key) 只建立一個 client，
+所有呼叫端共用同一個實例，因此 enableRateLimit 的節流狀態也一併共用。
+markets / currencies 以 json 快取在磁碟上，未過期時直接 set_markets()，
+整個掃描循環只需要一次 load_markets 下載。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import ccxt
+
+from ohlcv_store import market_key
+
+MARKETS_CACHE_DIR = Path(os.environ.get("MARKETS_CACHE_DIR", Path(__file__).parent / "data" / "markets"))
+MARKETS_REFRESH_SECONDS = 6 * 3600
+
+_clients: Dict[Tuple, Any] = {}
+_lock = threading.Lock()
+
+
+def _client_key(exchange_id: str, market_type: str, testnet: bool, api_key: Optional[str]) -> Tuple:
+    key_hash = hashlib.sha1(api_key.encode("utf-8")).hexdigest()[:12] if api_key else ""
+    return (exchange_id, market_type, bool(testnet), key_hash)
+
+
+def _markets_path(exchange_id: str, market_type: str, testnet: bool) -> Path:
+    suffix = "_testnet" if testnet else ""
+    return MARKETS_CACHE_DIR / f"{exchange_id}_{market_type}{suffix}.json"
+
+
+def _restore_markets(exchange: Any, path: Path, refresh_seconds: float) -> bool:
+    if not path.exists() or time.time() - path.stat().st_mtime > refresh_seconds:
+        return False
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        exchange.set_markets(cached["markets"], cached.get("currencies") or None)
+        return True
+    except Exception:
+        return False
+
+
+def _save_markets(exchange: Any, path: Path):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"markets": exchange.markets, "currencies": exchange.currencies}, f, default=str)
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+
+def ensure_markets(exchange: Any, market_type: str = "spot", testnet: bool = False,
+                   refresh_seconds: float = MARKETS_REFRESH_SECONDS, reload: bool = False) -> dict:
+    """
+    讓 exchange.markets 可用：已載入就直接回傳，其次讀磁碟快取，最後才 load_markets() 並寫回快取。
+    """
+    if exchange.markets and not reload:
+        return exchange.markets
+    path = _markets_path(exchange.id, market_type, testnet)
+    if not reload and _restore_markets(exchange, path, refresh_seconds):
+        return exchange.markets
+    markets = exchange.load_markets(reload=reload)
+    _save_markets(exchange, path)
+    return markets
+
+
+async def ensure_markets_async(exchange: Any, market_type: str = "spot", testnet: bool = False,
+                               refresh_seconds: float = MARKETS_REFRESH_SECONDS) -> dict:
+    """ensure_markets 的 ccxt.async_support 版本，與同步 client 共用同一份磁碟快取"""
+    if exchange.markets:
+        return exchange.markets
+    path = _markets_path(exchange.id, market_type, testnet)
+    if _restore_markets(exchange, path, refresh_seconds):
+        return exchange.markets
+    markets = await exchange.load_markets()
+    _save_markets(exchange, path)
+    return markets
+
+
+def get_exchange(exchange_id: str = "bybit", market_type: str = "spot", testnet: bool = False,
+                 api_key: Optional[str] = None, secret: Optional[str] = None,
+                 load_markets: bool = True, options: Optional[dict] = None) -> Any:
+    """
+    取得共用的 ccxt client。
+    market_type: "spot" / "future" / "swap"... 會寫入 options.defaultType
+    load_markets: True 時保證 markets 已載入 (優先使用磁碟快取)
+    """
+    key = _client_key(exchange_id, market_type, testnet, api_key)
+    with _lock:
+        exchange = _clients.get(key)
+        if exchange is None:
+            ex_cls = getattr(ccxt, exchange_id, None)
+            if ex_cls is None:
+                raise ValueError(f"exchange {exchange_id} not found in ccxt")
+            config = {"enableRateLimit": True, "options": dict(options or {})}
+            if market_type != "spot":
+                config["options"]["defaultType"] = market_type
+            if api_key:
+                config["apiKey"] = api_key
+                config["secret"] = secret
+            exchange = ex_cls(config)
+            if testnet:
+                exchange.set_sandbox_mode(True)
+            _clients[key] = exchange
+
+        if load_markets:
+            try:
+                ensure_markets(exchange, market_type, testnet)
+            except Exception:
+                # 市場資訊載入失敗時仍回傳 client，部分 API (如 fetch_tickers) 可照常使用
+                pass
+    return exchange
+
+
+@lru_cache(maxsize=None)
+def _default_type(exchange_id: str) -> str:
+    ex_cls = getattr(ccxt, exchange_id, None)
+    if ex_cls is None:
+        raise ValueError(f"exchange {exchange_id} not found in ccxt")
+    return ex_cls().options.get("defaultType") or "spot"
+
+
+def store_key(exchange_id: str = "bybit", market_type: str = "spot") -> str:
+    """
+    get_exchange(exchange_id, market_type) 所建 client 在 OHLCV store / 快取中的鍵，不需建立連線。
+    market_type="spot" 時不覆寫 defaultType，鍵依交易所預設 (例如 bybit 預設為 swap -> "bybit:swap")
+    """
+    return market_key(exchange_id, _default_type(exchange_id) if market_type == "spot" else market_type)
+
+
+def clear_registry():
+    with _lock:
+        _clients.clear()
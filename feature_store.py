@@ -0,0 +1,234 @@
+# feature_store.py
+"""
+本地指標特徵庫 (逐欄 memmap，隨新 K 線增量更新)
+
+每個 (symbol, timeframe) 一個資料夾，每欄一個固定寬度的二進位檔 (timestamp 為 int64，其餘 float64)，
+旁邊一個 meta.json 記錄列數與指標規格。指標與交易參數無關，預先把整段參數範圍都算好
+(預設 RSI 5..50 每個週期一欄)，Optuna trial 只需依參數查欄位，不再從收盤價重算。
+
+欄位：open / high / low / close / volume、rsi_{n}、macd / macd_signal / macd_hist、
+bb_lower / bb_middle / bb_upper、slowk / slowd、td_buy_setup / td_sell_setup / td_buy_countdown / td_sell_countdown
+
+- update(symbol, tf, ohlcv): 與既有資料逐根比對，從第一根不同的 K 線起重寫 (通常只有最後一根未收盤 + 新 K 線)；
+  重算時往前多取 warmup 根讓遞迴指標 (RSI / EMA) 收斂，只寫回變動的列
+- column(symbol, tf, name): 唯讀 memmap，不複製資料
+- lookup(symbol, tf, timestamps) / sync(symbol, tf, df): 依開盤時間取出與 df 逐列對齊的特徵
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+
+from ohlcv_resample import frame_timestamps
+from ohlcv_store import _to_records
+from td_sequential import td_frame
+
+DEFAULT_ROOT = Path(os.environ.get("FEATURE_STORE_DIR", Path(__file__).parent / "data" / "features"))
+RSI_PERIODS = tuple(range(5, 51))
+WARMUP = 1000          # 增量重算時往前多取的根數；RSI(50) 與整段重算的差異 < 1e-7
+FORMAT_VERSION = 1
+
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume"]
+MACD_COLUMNS = {"macd": "MACD_", "macd_signal": "MACDs_", "macd_hist": "MACDh_"}
+BBANDS_COLUMNS = {"bb_lower": "BBL_", "bb_middle": "BBM_", "bb_upper": "BBU_"}
+STOCH_COLUMNS = {"slowk": "STOCHk", "slowd": "STOCHd"}
+TD_COLUMNS = ["td_buy_setup", "td_sell_setup", "td_buy_countdown", "td_sell_countdown"]
+
+
+def feature_columns(rsi_periods: Iterable[int] = RSI_PERIODS) -> List[str]:
+    return ([f"rsi_{n}" for n in rsi_periods] + list(MACD_COLUMNS) + list(BBANDS_COLUMNS)
+            + list(STOCH_COLUMNS) + TD_COLUMNS)
+
+
+def _pick(frame: Optional[pd.DataFrame], prefix: str, n: int) -> np.ndarray:
+    """pandas_ta 結果中以 prefix 開頭的欄位 (欄名因版本而異)；缺少時為 NaN"""
+    if frame is not None:
+        for col in frame.columns:
+            if str(col).startswith(prefix):
+                return frame[col].to_numpy(dtype=np.float64)
+    return np.full(n, np.nan)
+
+
+def compute_features(df: pd.DataFrame, rsi_periods: Iterable[int] = RSI_PERIODS) -> Dict[str, np.ndarray]:
+    """df 需含 high / low / close；回傳 { 欄名: float64 陣列 }，參數與 research/ 各任務原本的呼叫相同"""
+    close = df["close"].astype(float).reset_index(drop=True)
+    high = df["high"].astype(float).reset_index(drop=True)
+    low = df["low"].astype(float).reset_index(drop=True)
+    n = len(close)
+
+    out = {}
+    for period in rsi_periods:
+        rsi = ta.rsi(close, length=period)
+        out[f"rsi_{period}"] = rsi.to_numpy(dtype=np.float64) if rsi is not None else np.full(n, np.nan)
+    macd = ta.macd(close, fast=12, slow=26, signal=9)
+    out.update({name: _pick(macd, prefix, n) for name, prefix in MACD_COLUMNS.items()})
+    bb = ta.bbands(close, length=20, std=2)
+    out.update({name: _pick(bb, prefix, n) for name, prefix in BBANDS_COLUMNS.items()})
+    stoch = ta.stoch(high, low, close)
+    out.update({name: _pick(stoch, prefix, n) for name, prefix in STOCH_COLUMNS.items()})
+    td = td_frame(pd.DataFrame({"close": close, "high": high, "low": low}))
+    out.update({name: td[name].to_numpy(dtype=np.float64) for name in TD_COLUMNS})
+    return out
+
+
+def _safe_name(s: str) -> str:
+    return str(s).replace("/", "_").replace(":", "-")
+
+
+class FeatureStore:
+    def __init__(self, root=DEFAULT_ROOT, rsi_periods: Iterable[int] = RSI_PERIODS, warmup: int = WARMUP):
+        self.root = Path(root)
+        self.rsi_periods = tuple(int(n) for n in rsi_periods)
+        self.warmup = warmup
+        self._lock = threading.RLock()
+
+    @property
+    def columns(self) -> List[str]:
+        return PRICE_COLUMNS + feature_columns(self.rsi_periods)
+
+    def _spec(self) -> dict:
+        return {"version": FORMAT_VERSION, "rsi_periods": list(self.rsi_periods)}
+
+    # ---------- 路徑 / 索引 ----------
+    def _folder(self, symbol: str, timeframe: str) -> Path:
+        return self.root / _safe_name(symbol) / _safe_name(timeframe)
+
+    def _load_meta(self, folder: Path) -> dict:
+        path = folder / "meta.json"
+        if not path.exists():
+            return {"rows": 0}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_meta(self, folder: Path, meta: dict):
+        tmp = folder / "meta.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, folder / "meta.json")
+
+    def _rows(self, folder: Path) -> int:
+        """meta 與規格相符時的有效列數 (欄位檔可能因中斷而比 meta 長，以 meta 為準)"""
+        meta = self._load_meta(folder)
+        return int(meta["rows"]) if meta.get("spec") == self._spec() else 0
+
+    # ---------- 讀取 ----------
+    def _memmap(self, folder: Path, name: str, rows: int) -> np.ndarray:
+        dtype = np.int64 if name == "timestamp" else np.float64
+        path = folder / f"{name}.bin"
+        if rows == 0 or not path.exists():
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+    def length(self, symbol: str, timeframe: str) -> int:
+        return self._rows(self._folder(symbol, timeframe))
+
+    def timestamps(self, symbol: str, timeframe: str) -> np.ndarray:
+        folder = self._folder(symbol, timeframe)
+        return self._memmap(folder, "timestamp", self._rows(folder))
+
+    def column(self, symbol: str, timeframe: str, name: str) -> np.ndarray:
+        """單一欄位的唯讀 memmap (全部列)"""
+        if name != "timestamp" and name not in self.columns:
+            raise KeyError(f"unknown feature column: {name}")
+        folder = self._folder(symbol, timeframe)
+        return self._memmap(folder, name, self._rows(folder))
+
+    def read(self, symbol: str, timeframe: str, columns: Optional[Sequence[str]] = None,
+             start: Optional[int] = None, end: Optional[int] = None) -> pd.DataFrame:
+        """[start, end] (毫秒, 含端點) 的 timestamp + 指定欄位 (預設全部)"""
+        ts = self.timestamps(symbol, timeframe)
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, end, side="right"))
+        cols = list(columns) if columns is not None else self.columns
+        data = {"timestamp": np.array(ts[lo:hi])}
+        for name in cols:
+            data[name] = np.array(self.column(symbol, timeframe, name)[lo:hi])
+        return pd.DataFrame(data)
+
+    def lookup(self, symbol: str, timeframe: str, timestamps,
+               columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """依開盤時間 (毫秒) 逐列取特徵；特徵庫沒有的時間為 NaN"""
+        want = np.asarray(timestamps, dtype=np.int64)
+        ts = self.timestamps(symbol, timeframe)
+        pos = np.searchsorted(ts, want)
+        found = pos < len(ts)
+        found[found] = ts[pos[found]] == want[found]
+        cols = list(columns) if columns is not None else feature_columns(self.rsi_periods)
+        out = {}
+        for name in cols:
+            values = np.full(len(want), np.nan)
+            values[found] = self.column(symbol, timeframe, name)[pos[found]]
+            out[name] = values
+        return pd.DataFrame(out)
+
+    def sync(self, symbol: str, timeframe: str, df: pd.DataFrame,
+             columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """update(df) 後回傳與 df 逐列對齊 (同 index) 的特徵欄位"""
+        self.update(symbol, timeframe, df)
+        out = self.lookup(symbol, timeframe, frame_timestamps(df), columns)
+        out.index = df.index
+        return out
+
+    # ---------- 寫入 ----------
+    def update(self, symbol: str, timeframe: str, data) -> int:
+        """
+        併入 K 線 (ccxt 列表或含 timestamp 欄 / DatetimeIndex 的 DataFrame)，
+        已存在的 timestamp 以新資料覆蓋。回傳重寫的列數 (資料完全相同時為 0)。
+        """
+        rec = _to_records(data)
+        if len(rec) == 0:
+            return 0
+        folder = self._folder(symbol, timeframe)
+        with self._lock:
+            folder.mkdir(parents=True, exist_ok=True)
+            meta = self._load_meta(folder)
+            rows = int(meta.get("rows", 0))
+            if rows:
+                old = np.empty(rows, dtype=rec.dtype)
+                for name in ["timestamp"] + PRICE_COLUMNS:
+                    old[name] = self._memmap(folder, name, rows)
+                merged = _to_records(np.concatenate([old, rec]))
+                # 第一根與既有資料不同的位置，之前的列 (含指標) 原樣保留
+                same = merged[:rows] == old
+                changed = int(np.argmin(same)) if not same.all() else rows
+                del old
+            else:
+                merged, changed = rec, 0
+            if meta.get("spec") != self._spec():
+                changed = 0                               # 指標規格改變：K 線沿用，指標全部重算
+            elif changed == rows == len(merged):
+                return 0
+
+            begin = max(0, changed - self.warmup)
+            window = pd.DataFrame({name: merged[name][begin:] for name in PRICE_COLUMNS})
+            features = compute_features(window, self.rsi_periods)
+            tail = {"timestamp": merged["timestamp"][changed:]}
+            tail.update({name: merged[name][changed:] for name in PRICE_COLUMNS})
+            tail.update({name: values[changed - begin:] for name, values in features.items()})
+
+            meta = {"rows": changed, "spec": self._spec(), "timeframe": timeframe}
+            self._save_meta(folder, meta)                 # 先縮短有效列數，寫到一半中斷也不會讀到混合資料
+            for name, values in tail.items():
+                dtype = np.int64 if name == "timestamp" else np.float64
+                with open(folder / f"{name}.bin", "r+b" if changed else "wb") as f:
+                    f.seek(changed * 8)
+                    f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+                    f.truncate()
+            meta["rows"] = len(merged)
+            self._save_meta(folder, meta)
+        return len(merged) - changed
+
+
+_default_store: Optional[FeatureStore] = None
+
+
+def default_store() -> FeatureStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = FeatureStore()
+    return _default_store
@@ -0,0 +1,134 @@
+# indicator_cache.py
+"""
+內容定址的指標快取 (LRU + 記憶體上限)
+
+鍵為 (資料指紋, 指標名稱, 參數)。指紋是輸入序列內容 (含 index) 的 blake2b 雜湊，
+與 symbol / 週期 / 呼叫端無關：同一段 K 線不論由實盤訊號、夜間最佳化或 tools 交易流程算過一次，
+其他模組再要同一個 (指標, 參數) 都直接命中。K 線更新後指紋改變，舊結果隨 LRU 淘汰。
+
+- IndicatorCache.get(fp, name, params, compute): 命中回傳快取結果，否則呼叫 compute() 後存入
+- cached_ta(name, *series, **params): pandas_ta 指標的快取版，例如 cached_ta("rsi", close, length=14)
+- CACHE: 行程內共用的快取實例
+
+回傳的是快取中的同一個物件，呼叫端不可原地修改 (指派成 DataFrame 欄位會複製，不受影響)。
+"""
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+# ========== 指紋 ==========
+def _index_bytes(index: pd.Index) -> bytes:
+    if isinstance(index, pd.RangeIndex):
+        return repr((index.start, index.stop, index.step)).encode()
+    if index.dtype.kind in "iufbmM":
+        return np.ascontiguousarray(index.to_numpy()).view(np.uint8).tobytes()
+    return pd.util.hash_pandas_object(index, index=False).to_numpy().tobytes()
+
+
+def fingerprint(*data) -> str:
+    """一個或多個 Series / ndarray 的內容雜湊；pandas 物件連同 index 一起計入 (結果會帶原 index)"""
+    h = hashlib.blake2b(digest_size=16)
+    for obj in data:
+        if isinstance(obj, pd.Series):
+            h.update(_index_bytes(obj.index))
+            values = obj.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            values = np.asarray(obj, dtype=np.float64)
+        h.update(repr(values.shape).encode())
+        h.update(np.ascontiguousarray(values).view(np.uint8).tobytes())
+    return h.hexdigest()
+
+
+def _nbytes(value: Any) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=False))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+def _params_key(params: Optional[dict]) -> tuple:
+    return tuple(sorted((params or {}).items()))
+
+
+# ========== 快取 ==========
+class IndicatorCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, fp: str, name: str, params: Optional[dict], compute: Callable[[], Any]) -> Any:
+        """fp: fingerprint(...) 的結果；compute 在鎖外執行，例外直接拋出且不寫入快取"""
+        key = (fp, name, _params_key(params))
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = compute()
+        size = _nbytes(value)
+        with self._lock:
+            if size > self.max_bytes:
+                return value            # 單一結果超過上限：不快取
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[0]
+            self._data[key] = (size, value)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (dropped, _) = self._data.popitem(last=False)
+                self.nbytes -= dropped
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._data),
+                "nbytes": self.nbytes,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+CACHE = IndicatorCache()
+
+
+def cached_ta(name: str, *series, fp: Optional[str] = None, cache: Optional[IndicatorCache] = None, **params):
+    """
+    pandas_ta.<name>(*series, **params) 的快取版。
+    fp: 同一批輸入要算多個指標時可先算好 fingerprint(*series) 傳入，省去重複雜湊。
+    """
+    import pandas_ta as ta
+
+    cache = cache or CACHE
+    fp = fp or fingerprint(*series)
+    return cache.get(fp, name, params, lambda: getattr(ta, name)(*series, **params))
@@ -0,0 +1,584 @@
+import math
+from collections import deque
+
+from ohlcv_resample import alignment
+from td_sequential import TDSequential
+
+# === 串流指標引擎 ===
+# 每根 K 線只更新 O(1) 狀態，數值與 signal_generator 內 talib / pandas 計算一致，
+# 讓回測不必每根 K 線都對整段前綴重算指標。
+
+# talib 的 TA_IS_ZERO / TA_IS_ZERO_OR_NEG 容差
+_TA_EPSILON = 0.00000000000001
+NAN = float("nan")
+
+# 多週期：每根高週期 K 線含幾根 1m (對齊一律依時間戳，見 ohlcv_resample.alignment)
+TF_STEPS = {"15m": 15, "1h": 60, "4h": 240, "1d": 1440}
+
+
+def _true_range(high, low, prev_close):
+    tr = high - low
+    tmp = abs(high - prev_close)
+    if tmp > tr:
+        tr = tmp
+    tmp = abs(low - prev_close)
+    if tmp > tr:
+        tr = tmp
+    return tr
+
+
+class _SMA:
+    """talib TA_INT_SMA：先加新值、取平均，再減去最舊值"""
+    def __init__(self, period):
+        self.period = period
+        self.window = deque()
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, x):
+        self.window.append(x)
+        self.total += x
+        if len(self.window) < self.period:
+            return NAN
+        self.value = self.total / self.period
+        self.total -= self.window.popleft()
+        return self.value
+
+
+class _EMA:
+    """talib TA_INT_EMA：以前 period 筆的 SMA 作為種子"""
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.seed = 0.0
+        self.count = 0
+        self.value = NAN
+
+    def update(self, x):
+        if self.count < self.period:
+            self.seed += x
+            self.count += 1
+            if self.count == self.period:
+                self.value = self.seed / self.period
+            return self.value
+        self.value = ((x - self.value) * self.k) + self.value
+        return self.value
+
+
+class _PandasEWM:
+    """pandas Series.ewm(com=...).mean() (adjust=True, ignore_na=False)"""
+    def __init__(self, com):
+        alpha = 1.0 / (1.0 + com)
+        self.factor = 1.0 - alpha
+        self.weighted = NAN
+        self.old_wt = 1.0
+
+    def update(self, x):
+        is_obs = x == x
+        if self.weighted == self.weighted:
+            self.old_wt *= self.factor
+            if is_obs:
+                if self.weighted != x:
+                    self.weighted = (self.old_wt * self.weighted + x) / (self.old_wt + 1.0)
+                self.old_wt += 1.0
+        elif is_obs:
+            self.weighted = x
+        return self.weighted
+
+
+class _RollingExtreme:
+    """固定視窗的滾動最大/最小值（單調佇列，攤銷 O(1)）"""
+    def __init__(self, window, is_max):
+        self.window = window
+        self.is_max = is_max
+        self.q = deque()
+        self.n = 0
+
+    def update(self, x):
+        q = self.q
+        if self.is_max:
+            while q and q[-1][1] <= x:
+                q.pop()
+        else:
+            while q and q[-1][1] >= x:
+                q.pop()
+        q.append((self.n, x))
+        self.n += 1
+        if q[0][0] <= self.n - 1 - self.window:
+            q.popleft()
+        return q[0][1] if self.n >= self.window else NAN
+
+
+class StreamMACD:
+    """talib.MACD：快線種子取與慢線對齊的同一根 K 線（SMA of in[slow-fast..slow-1]）"""
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast, self.slow = fast, slow
+        self.head = []
+        self.fast_ema = _EMA(fast)
+        self.slow_ema = _EMA(slow)
+        self.signal_ema = _EMA(signal)
+        self.macd = NAN
+        self.signal = NAN
+
+    def update(self, close):
+        if self.head is not None:
+            self.head.append(close)
+            self.slow_ema.update(close)
+            if len(self.head) < self.slow:
+                return self.macd, self.signal
+            for x in self.head[self.slow - self.fast:]:
+                self.fast_ema.update(x)
+            self.head = None
+        else:
+            self.slow_ema.update(close)
+            self.fast_ema.update(close)
+        line = self.fast_ema.value - self.slow_ema.value
+        sig = self.signal_ema.update(line)
+        if sig == sig:
+            self.macd, self.signal = line, sig
+        return self.macd, self.signal
+
+
+class StreamRSI:
+    def __init__(self, period=14):
+        self.period = period
+        self.prev = None
+        self.n = 0
+        self.gain = 0.0
+        self.loss = 0.0
+        self.value = NAN
+
+    def update(self, close):
+        if self.prev is None:
+            self.prev = close
+            return self.value
+        diff = close - self.prev
+        self.prev = close
+        self.n += 1
+        if self.n <= self.period:
+            if diff < 0:
+                self.loss -= diff
+            else:
+                self.gain += diff
+            if self.n < self.period:
+                return self.value
+            self.loss /= self.period
+            self.gain /= self.period
+        else:
+            self.loss *= (self.period - 1)
+            self.gain *= (self.period - 1)
+            if diff < 0:
+                self.loss -= diff
+            else:
+                self.gain += diff
+            self.loss /= self.period
+            self.gain /= self.period
+        total = self.gain + self.loss
+        self.value = 100.0 * (self.gain / total) if not (-_TA_EPSILON < total < _TA_EPSILON) else 0.0
+        return self.value
+
+
+class StreamVariance:
+    """talib TA_INT_VAR 的滾動平方和寫法；std() 對應 talib.STDDEV"""
+    def __init__(self, period=20):
+        self.period = period
+        self.window = deque()
+        self.total1 = 0.0
+        self.total2 = 0.0
+        self.value = NAN
+
+    def update(self, x):
+        self.window.append(x)
+        self.total1 += x
+        self.total2 += x * x
+        if len(self.window) < self.period:
+            return self.value
+        mean1 = self.total1 / self.period
+        mean2 = self.total2 / self.period
+        old = self.window.popleft()
+        self.total1 -= old
+        self.total2 -= old * old
+        self.value = mean2 - mean1 * mean1
+        return self.value
+
+    def std(self, nbdev=1.0):
+        v = self.value
+        if v != v:
+            return NAN
+        return math.sqrt(v) * nbdev if not v < _TA_EPSILON else 0.0
+
+
+class StreamBBands:
+    """talib.BBANDS (SMA 中軌 + stddev_using_precalc_ma)"""
+    def __init__(self, period=20, nbdev=2):
+        self.period = period
+        self.nbdev = nbdev
+        self.mid = _SMA(period)
+        self.window = deque()
+        self.total2 = 0.0
+        self.upper = self.lower = NAN
+
+    def update(self, close):
+        mid = self.mid.update(close)
+        self.window.append(close)
+        self.total2 += close * close
+        if len(self.window) < self.period:
+            return self.upper, self.lower
+        mean2 = self.total2 / self.period
+        old = self.window.popleft()
+        self.total2 -= old * old
+        mean2 -= mid * mid
+        std = math.sqrt(mean2) if not mean2 < _TA_EPSILON else 0.0
+        band = std * self.nbdev
+        self.upper = mid + band
+        self.lower = mid - band
+        return self.upper, self.lower
+
+
+class StreamATR:
+    def __init__(self, period=14):
+        self.period = period
+        self.prev_close = None
+        self.seed = _SMA(period)
+        self.value = NAN
+
+    def update(self, high, low, close):
+        if self.prev_close is None:
+            self.prev_close = close
+            return self.value
+        tr = _true_range(high, low, self.prev_close)
+        self.prev_close = close
+        if self.value != self.value:
+            self.value = self.seed.update(tr)
+        else:
+            self.value = (self.value * (self.period - 1) + tr) / self.period
+        return self.value
+
+
+class StreamADX:
+    """talib.ADX：前 period-1 根累加 DM/TR，接著 period 根累加 DX 作為種子"""
+    def __init__(self, period=14):
+        self.period = period
+        self.n = 0
+        self.prev = None
+        self.plus_dm = self.minus_dm = self.tr = 0.0
+        self.sum_dx = 0.0
+        self.value = NAN
+
+    def update(self, high, low, close):
+        if self.prev is None:
+            self.prev = (high, low, close)
+            return self.value
+        prev_high, prev_low, prev_close = self.prev
+        self.prev = (high, low, close)
+        self.n += 1
+        p = self.period
+        diff_p = high - prev_high
+        diff_m = prev_low - low
+        tr = _true_range(high, low, prev_close)
+
+        if self.n < p:
+            if diff_m > 0 and diff_p < diff_m:
+                self.minus_dm += diff_m
+            elif diff_p > 0 and diff_p > diff_m:
+                self.plus_dm += diff_p
+            self.tr += tr
+            return self.value
+
+        self.minus_dm -= self.minus_dm / p
+        self.plus_dm -= self.plus_dm / p
+        if diff_m > 0 and diff_p < diff_m:
+            self.minus_dm += diff_m
+        elif diff_p > 0 and diff_p > diff_m:
+            self.plus_dm += diff_p
+        self.tr = self.tr - self.tr / p + tr
+
+        dx = None
+        if not (-_TA_EPSILON < self.tr < _TA_EPSILON):
+            minus_di = 100.0 * (self.minus_dm / self.tr)
+            plus_di = 100.0 * (self.plus_dm / self.tr)
+            total = minus_di + plus_di
+            if not (-_TA_EPSILON < total < _TA_EPSILON):
+                dx = 100.0 * (abs(minus_di - plus_di) / total)
+
+        if self.n < 2 * p - 1:
+            if dx is not None:
+                self.sum_dx += dx
+        elif self.n == 2 * p - 1:
+            if dx is not None:
+                self.sum_dx += dx
+            self.value = self.sum_dx / p
+        elif dx is not None:
+            self.value = ((self.value * (p - 1)) + dx) / p
+        return self.value
+
+
+class StreamStoch:
+    """talib.STOCH (slowk/slowd 皆為 SMA)"""
+    def __init__(self, k=14, d=3):
+        self.hh = _RollingExtreme(k, True)
+        self.ll = _RollingExtreme(k, False)
+        self.slowk = _SMA(d)
+        self.slowd = _SMA(d)
+        self.k = self.d = NAN
+
+    def update(self, high, low, close):
+        hh = self.hh.update(high)
+        ll = self.ll.update(low)
+        if hh != hh:
+            return self.k, self.d
+        diff = hh - ll
+        fastk = (close - ll) / diff * 100.0 if diff != 0.0 else 0.0
+        k = self.slowk.update(fastk)
+        if k == k:
+            self.k = k
+            self.d = self.slowd.update(k)
+        return self.k, self.d
+
+
+class StreamSKDJ:
+    def __init__(self, k_period=9, d_period=3):
+        self.hh = _RollingExtreme(k_period, True)
+        self.ll = _RollingExtreme(k_period, False)
+        self.k_ewm = _PandasEWM(d_period - 1)
+        self.d_ewm = _PandasEWM(d_period - 1)
+        self.k = self.d = NAN
+
+    def update(self, high, low, close):
+        hh = self.hh.update(high)
+        ll = self.ll.update(low)
+        denom = hh - ll
+        if hh != hh or denom == 0:
+            rsv = NAN
+        else:
+            rsv = (close - ll) / denom * 100
+        self.k = self.k_ewm.update(rsv)
+        self.d = self.d_ewm.update(self.k)
+        return self.k, self.d
+
+
+class StreamLag:
+    """ROC / MOM 共用的 period 根前收盤"""
+    def __init__(self, period=10):
+        self.closes = deque(maxlen=period)
+        self.roc = self.mom = NAN
+
+    def update(self, close):
+        if len(self.closes) == self.closes.maxlen:
+            prev = self.closes[0]
+            self.roc = ((close / prev) - 1.0) * 100.0 if prev != 0.0 else 0.0
+            self.mom = close - prev
+        self.closes.append(close)
+        return self.roc, self.mom
+
+
+class StreamKAMA:
+    """talib.KAMA (fast=2, slow=30)"""
+    def __init__(self, period=10):
+        self.period = period
+        self.closes = deque(maxlen=period + 1)
+        self.sum_roc = 0.0
+        self.value = NAN
+        self._const_max = 2.0 / (30.0 + 1.0)
+        self._const_diff = 2.0 / (2.0 + 1.0) - self._const_max
+
+    def update(self, close):
+        c = self.closes
+        if len(c) < self.period:
+            if c:
+                self.sum_roc += abs(c[-1] - close)
+            c.append(close)
+            return self.value
+        if self.value != self.value:
+            self.sum_roc += abs(c[-1] - close)
+            prev_kama = c[-1]
+        else:
+            self.sum_roc -= abs(c[0] - c[1])
+            self.sum_roc += abs(close - c[-1])
+            prev_kama = self.value
+        c.append(close)
+        period_roc = close - c[0]
+        if self.sum_roc <= period_roc or (-_TA_EPSILON < self.sum_roc < _TA_EPSILON):
+            er = 1.0
+        else:
+            er = abs(period_roc / self.sum_roc)
+        sc = (er * self._const_diff) + self._const_max
+        sc *= sc
+        self.value = ((close - prev_kama) * sc) + prev_kama
+        return self.value
+
+
+class IndicatorStream:
+    """
+    單一週期的串流指標組
+    full=True: 1m 全套指標；full=False: 高週期只算 macd / rsi / adx
+    """
+    def __init__(self, full=True):
+        self.full = full
+        self.bars = 0
+        self.macd = StreamMACD()
+        self.rsi = StreamRSI()
+        self.adx = StreamADX()
+        if full:
+            self.boll = StreamBBands()
+            self.atr = StreamATR()
+            self.stoch = StreamStoch()
+            self.skdj = StreamSKDJ()
+            self.td = TDSequential()
+            self.lag = StreamLag()
+            self.stddev = StreamVariance()
+            self.kama = StreamKAMA()
+            self.tenkan_h = _RollingExtreme(9, True)
+            self.tenkan_l = _RollingExtreme(9, False)
+            self.kijun_h = _RollingExtreme(26, True)
+            self.kijun_l = _RollingExtreme(26, False)
+            self.obv = NAN
+            self.prev_obv = NAN
+            self.prev_close = None
+            self.pv_sum = 0.0
+            self.v_sum = 0.0
+            self.close = NAN
+            self.tenkan = self.kijun = NAN
+
+    def update(self, high, low, close, volume=0.0):
+        self.bars += 1
+        self.macd.update(close)
+        self.rsi.update(close)
+        self.adx.update(high, low, close)
+        if not self.full:
+            return
+        self.close = close
+        self.boll.update(close)
+        self.atr.update(high, low, close)
+        self.stoch.update(high, low, close)
+        self.skdj.update(high, low, close)
+        self.td.update(close, high, low)
+        self.lag.update(close)
+        self.stddev.update(close)
+        self.kama.update(close)
+        self.tenkan = (self.tenkan_h.update(high) + self.tenkan_l.update(low)) / 2
+        self.kijun = (self.kijun_h.update(high) + self.kijun_l.update(low)) / 2
+
+        self.prev_obv = self.obv
+        if self.prev_close is None:
+            self.obv = volume
+        elif close > self.prev_close:
+            self.obv += volume
+        elif close < self.prev_close:
+            self.obv -= volume
+        self.prev_close = close
+        self.pv_sum += close * volume
+        self.v_sum += volume
+
+    # --- 與 signal_generator.signal_* 相同的判斷規則 ---
+    def sig_macd(self):
+        return 1 if self.macd.macd > self.macd.signal else -1
+
+    def sig_rsi(self):
+        v = self.rsi.value
+        if v < 30: return 1
+        if v > 70: return -1
+        return 0
+
+    def sig_adx(self):
+        return 1 if self.adx.value > 25 else 0
+
+    def sig_boll(self):
+        if self.close > self.boll.upper: return -1
+        if self.close < self.boll.lower: return 1
+        return 0
+
+    def sig_stoch(self):
+        if self.stoch.k > self.stoch.d: return 1
+        if self.stoch.k < self.stoch.d: return -1
+        return 0
+
+    def sig_skdj(self):
+        return 1 if self.skdj.k > self.skdj.d else -1
+
+    def sig_td(self, length):
+        return 1 if self.td.buy_setup >= length else 0
+
+    def sig_td_countdown(self):
+        return 1 if self.td.buy_countdown_done else 0
+
+    def sig_obv(self):
+        return 1 if self.obv > self.prev_obv else -1
+
+    def sig_vwap(self):
+        vwap = self.pv_sum / self.v_sum if self.v_sum != 0 else NAN
+        return 1 if self.close > vwap else -1
+
+    def sig_ichimoku(self):
+        return 1 if self.tenkan > self.kijun else -1
+
+    def sig_kama(self):
+        return 1 if self.close > self.kama.value else -1
+
+
+class StreamingSignalEngine:
+    """
+    多週期串流信號引擎
+    對每個週期 push 新 K 線後，signals() 回傳與 generate_signal 相同鍵值的 dict
+    """
+    def __init__(self, timeframes=("15m", "1h", "4h", "1d")):
+        self.base = IndicatorStream(full=True)
+        self.higher = {tf: IndicatorStream(full=False) for tf in timeframes}
+
+    def push(self, tf, high, low, close, volume=0.0):
+        stream = self.base if tf == "1m" else self.higher[tf]
+        stream.update(high, low, close, volume)
+
+    def signals(self):
+        s = self.base
+        sigs = {
+            "macd": s.sig_macd(),
+            "rsi": s.sig_rsi(),
+            "boll": s.sig_boll(),
+            "skdj": s.sig_skdj(),
+            "td9": s.sig_td(9),
+            "td13": s.sig_td_countdown(),
+            "atr": s.atr.value,
+            "adx": s.sig_adx(),
+            "stoch": s.sig_stoch(),
+            "roc": 1 if s.lag.roc > 0 else -1,
+            "mom": 1 if s.lag.mom > 0 else -1,
+            "stddev": s.stddev.std(),
+            "obv": s.sig_obv(),
+            "vwap": s.sig_vwap(),
+            "ichimoku": s.sig_ichimoku(),
+            "kama": s.sig_kama(),
+        }
+        for tf, stream in self.higher.items():
+            if stream.bars:
+                sigs[f"macd_{tf}"] = stream.sig_macd()
+                sigs[f"rsi_{tf}"] = stream.sig_rsi()
+                sigs[f"adx_{tf}"] = stream.sig_adx()
+        return sigs
+
+
+def iter_signals(dfs: dict, align: dict = None):
+    """
+    依 1m K 線逐根產生信號，等同對 dfs 前綴 (1m[:i+1], 15m[:align["15m"][i]+1] ...) 呼叫 generate_signal
+    align: ohlcv_resample.alignment(dfs) 的結果 (依時間戳對齊)；未提供時在此計算
+    yield: (i, sigs)
+    """
+    tfs = [tf for tf in TF_STEPS if tf in dfs and len(dfs[tf])]
+    if align is None:
+        align = alignment(dfs)
+    engine = StreamingSignalEngine(tfs)
+    base = dfs["1m"][["high", "low", "close", "volume"]].to_numpy(dtype=float)
+    higher = {tf: dfs[tf][["high", "low", "close"]].to_numpy(dtype=float) for tf in tfs}
+    pushed = {tf: 0 for tf in tfs}
+
+    for i in range(len(base)):
+        h, l, c, v = base[i]
+        engine.push("1m", h, l, c, v)
+        for tf in tfs:
+            j = align[tf][i]
+            arr = higher[tf]
+            while pushed[tf] <= j and pushed[tf] < len(arr):
+                h2, l2, c2 = arr[pushed[tf]]
+                engine.push(tf, h2, l2, c2)
+                pushed[tf] += 1
+        yield i, engine.signals()
@@ -0,0 +1,287 @@
+# kline_downloader.py
+"""
+分段並行的歷史 K 線下載 (可續傳)
+
+[start, end] 先扣掉 ohlcv_store 已覆蓋的區間，剩下的切成每段 chunk_bars 根 (一個請求)，
+多個 (symbol, timeframe) 的所有分段丟進同一個執行緒池並行抓取；
+WeightBudget 以 token bucket 控制每分鐘的請求權重，吞吐量由交易所的權重上限決定，而非單次請求延遲。
+
+完成的分段依時間順序累積後寫入 ohlcv_store (檔尾附加)，並把該段標記為已覆蓋；
+store 的覆蓋索引即為 checkpoint，中斷後重跑只會抓尚未寫入的分段。
+失敗的分段不標記覆蓋，下次重跑時補抓。只下載已收盤的 K 線 (end 超過最後一根已收盤 K 線時截斷)。
+
+- download(jobs, ...): jobs 為 [(symbol, timeframe, start_ms, end_ms), ...]，回傳各 job 的統計
+- download_range(symbol, timeframe, start, end, ...): 單一標的，下載後回傳 store 內該區間的 DataFrame
+- BinanceKlines: 直接呼叫 /api/v3/klines 的分段抓取器 (依回應標頭同步已用權重，429 / 418 依 Retry-After 暫停)
+- ccxt_pages(exchange): 以 ccxt exchange.fetch_ohlcv 作為分段抓取器
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+from ohlcv_store import OHLCVStore, default_store, timeframe_ms
+
+BINANCE_KLINES_URL = "https://api.binance.com/api/v3/klines"
+BINANCE_WEIGHT_PER_MINUTE = 6000   # 現貨 REQUEST_WEIGHT 上限 (每 IP)
+BUDGET_FRACTION = 0.8              # 留兩成給同一 IP 上的其他程式
+KLINES_WEIGHT = 2                  # /api/v3/klines 每次請求的權重
+CHUNK_BARS = 1000                  # 單次請求最多 1000 根
+FLUSH_ROWS = 50_000                # 累積多少根寫入一次 store
+
+Job = Tuple[str, str, int, int]
+PageFetcher = Callable[[str, str, int, int, int], List[list]]
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# ========== 權重預算 ==========
+class WeightBudget:
+    """每分鐘權重上限的 token bucket，多個執行緒共用；acquire 在額度不足時阻塞"""
+
+    def __init__(self, per_minute: float = BINANCE_WEIGHT_PER_MINUTE * BUDGET_FRACTION):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, weight: float = KLINES_WEIGHT):
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = (weight - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def observe(self, used: float, limit: float = BINANCE_WEIGHT_PER_MINUTE):
+        """交易所回報本分鐘已用權重 (含同 IP 其他程式)，剩餘額度不得超過回報值"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, self.capacity - used * self.capacity / limit)
+
+    def pause(self, seconds: float):
+        """被限流時讓所有執行緒至少暫停 seconds 秒"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+# ========== 分段抓取器 ==========
+class BinanceKlines:
+    """Binance 現貨 /api/v3/klines；回傳 [[ts, o, h, l, c, v], ...]"""
+
+    def __init__(self, budget: Optional[WeightBudget] = None, url: str = BINANCE_KLINES_URL, timeout: float = 20):
+        self.budget = budget
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def __call__(self, symbol: str, timeframe: str, start: int, end: int, limit: int) -> List[list]:
+        params = {"symbol": symbol, "interval": timeframe, "startTime": int(start), "endTime": int(end),
+                  "limit": int(limit)}
+        resp = self._session().get(self.url, params=params, timeout=self.timeout)
+        used = resp.headers.get("X-MBX-USED-WEIGHT-1M")
+        if used is not None and self.budget is not None:
+            self.budget.observe(float(used))
+        if resp.status_code in (418, 429):
+            raise RateLimitError(float(resp.headers.get("Retry-After", 60)))
+        resp.raise_for_status()
+        data = resp.json()
+        if isinstance(data, dict):
+            raise RuntimeError(f"Binance API error: {data}")
+        return [row[:6] for row in data]
+
+
+def ccxt_pages(exchange: Any) -> PageFetcher:
+    """
+    以 ccxt exchange 作為分段抓取器 (symbol 為 ccxt 格式，如 BTC/USDT)。
+    單次上限低於 limit 的交易所 (例如 200 根) 在分段內繼續往後抓到 end，分段才會完整
+    """
+    def fetch(symbol: str, timeframe: str, start: int, end: int, limit: int) -> List[list]:
+        step = timeframe_ms(timeframe)
+        out: List[list] = []
+        since = int(start)
+        while since <= end:
+            rows = [row[:6] for row in exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=int(limit))
+                    if since <= row[0] <= end]
+            if not rows:
+                break
+            out.extend(rows)
+            since = int(rows[-1][0]) + step
+        return out
+    return fetch
+
+
+# ========== 分段 ==========
+def plan_chunks(store: OHLCVStore, exchange_id: str, symbol: str, timeframe: str,
+                start: int, end: int, chunk_bars: int = CHUNK_BARS) -> List[Tuple[int, int]]:
+    """[start, end] 中尚未覆蓋的部分切成每段最多 chunk_bars 根的 (開始, 結束) 開盤時間"""
+    step = timeframe_ms(timeframe)
+    chunks = []
+    for lo, hi in store.missing_ranges(exchange_id, symbol, timeframe, start, end):
+        for s in range(lo, hi + 1, chunk_bars * step):
+            chunks.append((s, min(s + (chunk_bars - 1) * step, hi)))
+    return chunks
+
+
+def _fetch_chunk(fetch_page: PageFetcher, budget: WeightBudget, weight: float, retries: int,
+                 symbol: str, timeframe: str, start: int, end: int, limit: int) -> List[list]:
+    error: Optional[Exception] = None
+    for attempt in range(retries + 1):
+        budget.acquire(weight)
+        try:
+            rows = fetch_page(symbol, timeframe, start, end, limit)
+            return [r for r in rows if start <= r[0] <= end]
+        except RateLimitError as e:
+            budget.pause(e.retry_after)
+            error = e
+        except Exception as e:
+            error = e
+            time.sleep(0.5 * (2 ** attempt))
+    raise error
+
+
+class _JobWriter:
+    """單一 (symbol, timeframe) 的分段依時間順序寫入 store；失敗的分段跳過且不標記覆蓋"""
+
+    def __init__(self, store: OHLCVStore, exchange_id: str, symbol: str, timeframe: str,
+                 chunks: List[Tuple[int, int]], flush_rows: int):
+        self.store = store
+        self.exchange_id = exchange_id
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.step = timeframe_ms(timeframe)
+        self.chunks = chunks
+        self.flush_rows = flush_rows
+        self.results: Dict[int, Optional[List[list]]] = {}
+        self.next = 0
+        self.batch: List[list] = []
+        self.batch_start: Optional[int] = None
+        self.batch_end: Optional[int] = None
+        self.rows = 0
+        self.failed = 0
+
+    def done(self, i: int, rows: Optional[List[list]]):
+        self.results[i] = rows
+        while self.next in self.results:
+            rows = self.results.pop(self.next)
+            s, e = self.chunks[self.next]
+            self.next += 1
+            if rows is None:
+                self.failed += 1
+                self.flush()
+                continue
+            if self.batch_start is not None and s != self.batch_end + self.step:
+                self.flush()                  # 不相連的分段 (同一序列的多個缺口) 分開標記覆蓋
+            if self.batch_start is None:
+                self.batch_start = s
+            self.batch_end = e
+            self.batch.extend(rows)
+            if len(self.batch) >= self.flush_rows:
+                self.flush()
+
+    def flush(self):
+        if self.batch_start is None:
+            return
+        # 沒有資料的分段 (例如上架前) 也標記為已覆蓋，避免重抓
+        self.store.append(self.exchange_id, self.symbol, self.timeframe, self.batch,
+                          start=self.batch_start, end=self.batch_end)
+        self.rows += len(self.batch)
+        self.batch, self.batch_start, self.batch_end = [], None, None
+
+
+# ========== 下載 ==========
+def download(jobs: Iterable[Job], fetch_page: Optional[PageFetcher] = None, exchange_id: str = "binance",
+             store: Optional[OHLCVStore] = None, budget: Optional[WeightBudget] = None,
+             max_workers: int = 16, chunk_bars: int = CHUNK_BARS, weight: float = KLINES_WEIGHT,
+             retries: int = 3, flush_rows: int = FLUSH_ROWS,
+             on_chunk: Optional[Callable] = None) -> Dict[Tuple[str, str], dict]:
+    """
+    jobs: [(symbol, timeframe, start_ms, end_ms), ...]；fetch_page 預設為 BinanceKlines (symbol 如 BTCUSDT)。
+    on_chunk(symbol, timeframe, start, n_rows, error) 於每個分段完成時呼叫。
+    回傳 { (symbol, timeframe): {"chunks", "failed", "rows"} }
+    """
+    store = store or default_store()
+    budget = budget or WeightBudget()
+    fetch_page = fetch_page or BinanceKlines(budget)
+    now = int(time.time() * 1000)
+
+    # 同一 (symbol, timeframe) 的多個區間 (例如驗證後的缺口重抓) 共用一個 writer，分段依時間排序
+    planned: Dict[Tuple[str, str], set] = {}
+    for symbol, timeframe, start, end in jobs:
+        step = timeframe_ms(timeframe)
+        end = min(int(end), now - now % step - step)     # 最後一根已收盤 K 線
+        chunks = planned.setdefault((symbol, timeframe), set())
+        if int(start) <= end:
+            chunks.update(plan_chunks(store, exchange_id, symbol, timeframe, int(start), end, chunk_bars))
+
+    writers: Dict[Tuple[str, str], _JobWriter] = {}
+    tasks = []
+    for (symbol, timeframe), chunks in planned.items():
+        chunks = sorted(chunks)
+        writers[(symbol, timeframe)] = _JobWriter(store, exchange_id, symbol, timeframe, chunks, flush_rows)
+        tasks.extend((symbol, timeframe, i, s, e) for i, (s, e) in enumerate(chunks))
+
+    if tasks:
+        pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)))
+        futures = {pool.submit(_fetch_chunk, fetch_page, budget, weight, retries, sym, tf, s, e, chunk_bars):
+                   (sym, tf, i, s) for sym, tf, i, s, e in tasks}
+        try:
+            for fut in as_completed(futures):
+                sym, tf, i, s = futures[fut]
+                try:
+                    rows, error = fut.result(), None
+                except Exception as e:
+                    rows, error = None, e
+                writers[(sym, tf)].done(i, rows)
+                if on_chunk is not None:
+                    on_chunk(sym, tf, s, len(rows) if rows is not None else 0, error)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            # 中斷時已依序完成的分段仍寫入，續跑從這裡接上
+            for writer in writers.values():
+                writer.flush()
+
+    return {key: {"chunks": len(w.chunks), "failed": w.failed, "rows": w.rows} for key, w in writers.items()}
+
+
+def to_ms(value) -> int:
+    """毫秒整數 / 日期字串 / datetime -> 毫秒 (UTC)"""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    return int(ts.value // 1_000_000)
+
+
+def download_range(symbol: str, timeframe: str, start, end=None, exchange_id: str = "binance",
+                   store: Optional[OHLCVStore] = None, **kwargs) -> pd.DataFrame:
+    """下載 [start, end] (預設到現在) 後回傳 store 內該區間 (ccxt 欄位格式，timestamp 為毫秒)"""
+    store = store or default_store()
+    start_ms = to_ms(start)
+    end_ms = to_ms(end) if end is not None else int(time.time() * 1000)
+    download([(symbol, timeframe, start_ms, end_ms)], exchange_id=exchange_id, store=store, **kwargs)
+    return store.read(exchange_id, symbol, timeframe, start=start_ms, end=end_ms)
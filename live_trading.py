@@ -1,6 +1,4 @@
-import ccxt
 import pandas as pd
-import pandas_ta as ta
 import json
 import csv
 import time
@@ -8,6 +6,10 @@ import os
 from datetime import datetime
 import platform
 
+from async_fetcher import fetch_many
+from exchange_registry import get_exchange
+from indicator_cache import cached_ta, fingerprint
+
 # === 讀取 config.json ===
 with open("C:/Users/unive/Desktop/v_infinity/adaptive_dca_ai/config.json", "r", encoding="utf-8") as f:
     config = json.load(f)
@@ -16,15 +18,13 @@ with open("C:/Users/unive/Desktop/v_infinity/adaptive_dca_ai/config.json", "r",
 with open("C:/Users/unive/Desktop/v_infinity/adaptive_dca_ai/allocation.json", "r", encoding="utf-8") as f:
     allocation = json.load(f)
 
-exchange = ccxt.binance({
-    "apiKey": config["apiKey"],
-    "secret": config["secret"],
-    "enableRateLimit": True,
-    "options": {"defaultType": "future"} if config["mode"] == "futures" else {}
-})
-
-if config.get("testnet", False):
-    exchange.set_sandbox_mode(True)
+exchange = get_exchange(
+    "binance",
+    market_type="future" if config["mode"] == "futures" else "spot",
+    testnet=config.get("testnet", False),
+    api_key=config["apiKey"],
+    secret=config["secret"],
+)
 
 symbols = config["symbols"]
 timeframe = config["timeframe"]
@@ -126,24 +126,25 @@ def show_realtime_performance():
     print(f"💹 今日累積盈虧: {total_pnl} USDT")
     return total_pnl
 
-# === 策略函數 ===
-def rsi_macd_signal(series):
-    rsi = ta.rsi(series, length=14)
-    macd = ta.macd(series, fast=12, slow=26, signal=9)
+# === 策略函數 (指標走 indicator_cache，同一段價格在 COMBO / WEIGHTED 下各指標只算一次) ===
+def rsi_macd_signal(series, fp=None):
+    fp = fp or fingerprint(series)
+    rsi = cached_ta("rsi", series, fp=fp, length=14)
+    macd = cached_ta("macd", series, fp=fp, fast=12, slow=26, signal=9)
     if rsi.iloc[-1]<30 and macd["MACD_12_26_9"].iloc[-1]>macd["MACDs_12_26_9"].iloc[-1]:
         return "buy"
     elif rsi.iloc[-1]>70 and macd["MACD_12_26_9"].iloc[-1]<macd["MACDs_12_26_9"].iloc[-1]:
         return "sell"
     return None
 
-def bollinger_signal(series):
-    bb = ta.bbands(series, length=20, std=2)
+def bollinger_signal(series, fp=None):
+    bb = cached_ta("bbands", series, fp=fp, length=20, std=2)
     if series.iloc[-1] < bb["BBL_20_2.0"].iloc[-1]: return "buy"
     if series.iloc[-1] > bb["BBU_20_2.0"].iloc[-1]: return "sell"
     return None
 
-def kdj_signal(series):
-    kdj = ta.kdj(series, length=14, signal=3)
+def kdj_signal(series, fp=None):
+    kdj = cached_ta("kdj", series, fp=fp, length=14, signal=3)
     k, d = kdj["K_14_3"], kdj["D_14_3"]
     if len(series)<2: return None
     if k.iloc[-1]<20 and d.iloc[-1]<20 and k.iloc[-2]<d.iloc[-2] and k.iloc[-1]>d.iloc[-1]:
@@ -176,14 +177,15 @@ def generate_signal(df, use_heikin_ashi=False, force_signal=None, signal_mode="R
         price_series = ha_df["ha_close"]
     else:
         price_series = df["close"]
+    fp = fingerprint(price_series)
 
     # 單策略
     if signal_mode in STRATEGIES:
-        return STRATEGIES[signal_mode](price_series)
+        return STRATEGIES[signal_mode](price_series, fp)
 
     # COMBO：全部一致才下單
     elif signal_mode=="COMBO":
-        sigs = [fn(price_series) for fn in STRATEGIES.values()]
+        sigs = [fn(price_series, fp) for fn in STRATEGIES.values()]
         if all(s=="buy" for s in sigs if s is not None): return "buy"
         if all(s=="sell" for s in sigs if s is not None): return "sell"
         return None
@@ -194,7 +196,7 @@ def generate_signal(df, use_heikin_ashi=False, force_signal=None, signal_mode="R
             weights = {k:1/len(STRATEGIES) for k in STRATEGIES}
         score=0
         for name,fn in STRATEGIES.items():
-            sig=fn(price_series)
+            sig=fn(price_series, fp)
             if sig=="buy": score+=weights.get(name,0)
             elif sig=="sell": score-=weights.get(name,0)
         if score>0.5: return "buy"
@@ -210,6 +212,20 @@ def fetch_data(symbol, timeframe="1h", limit=100):
     df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
     return df
 
+def fetch_all(symbols, timeframe="1h", limit=100):
+    """所有標的同時抓取；並行抓取失敗的標的在主迴圈中退回 fetch_data"""
+    frames = fetch_many(
+        [(s, timeframe, limit) for s in symbols],
+        exchange_id="binance",
+        market_type="future" if config["mode"] == "futures" else "spot",
+        testnet=config.get("testnet", False),
+    )
+    out = {}
+    for (sym, _), df in frames.items():
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
+        out[sym] = df
+    return out
+
 # === 下單邏輯 ===
 def place_order(symbol, signal, capital_share):
     ticker = exchange.fetch_ticker(symbol)
@@ -280,8 +296,15 @@ if __name__=="__main__":
         capital_allocation=get_capital_allocation(symbols, capital_usdt)
 
         last_signal="無"
+        try:
+            frames=fetch_all(symbols,timeframe)
+        except Exception as e:
+            print(f"⚠️ 並行抓取失敗，改為逐一抓取: {e}")
+            frames={}
         for sym in symbols:
-            df=fetch_data(sym,timeframe)
+            df=frames.get(sym)
+            if df is None:
+                df=fetch_data(sym,timeframe)
             signal=generate_signal(
                 df,
                 use_heikin_ashi=config.get("use_heikin_ashi",False),
@@ -0,0 +1,171 @@
+# monte_carlo.py
+"""
+回測結果的 Monte Carlo 穩健度評估
+
+單一歷史路徑的 PnL / 回撤 / Sharpe 排名容易被運氣左右；這裡對每個候選重抽上千條路徑，
+回傳各指標的信賴區間 (分位數)，排名改看悲觀端 (例如 Sharpe 的 5% 分位)。
+
+method:
+- "block":   對逐根報酬做 moving-block bootstrap (保留短期自相關)，適用 simulate_trades 的 equity_curve
+- "trades":  對逐筆交易報酬有放回重抽，適用 tools/backtester.Backtester.run 的 trades (return_pct)
+- "shuffle": 逐筆交易報酬重新排列 (最終 PnL 不變，只看順序對回撤的影響)
+
+所有路徑以 (n_paths, n) 矩陣一次計算；多個候選以 process pool 分散到各核心。
+"""
+import os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = (0.05, 0.5, 0.95)
+PERIODS_PER_YEAR = 252 * 24   # 與 backtester.calculate_sharpe_ratio 相同 (小時線)
+_CHUNK_ELEMENTS = 4_000_000    # 每批路徑矩陣的元素上限，控制記憶體
+
+
+# ========== 輸入整理 ==========
+def extract_returns(result: Any, method: str = "block") -> Tuple[np.ndarray, float]:
+    """
+    result: simulate_trades / Backtester.run 的 dict，或直接傳權益序列。
+    回傳 (報酬序列, 起始資金)
+    """
+    if isinstance(result, dict):
+        curve = result.get("equity_curve")
+        curve = np.asarray(curve if curve is not None else [], dtype=float)
+        trades = result.get("trades")
+    else:
+        curve = np.asarray(result, dtype=float)
+        trades = None
+    initial = float(curve[0]) if curve.size else 1.0
+
+    if method in ("trades", "shuffle"):
+        if not isinstance(trades, (list, tuple)):
+            raise ValueError(f"method={method} requires a result with a trades list")
+        r = [t["return_pct"] for t in trades if isinstance(t, dict) and t.get("reason") != "open"]
+        return np.asarray(r, dtype=float), initial
+
+    if curve.size < 2:
+        return np.empty(0), initial
+    r = np.diff(curve) / (curve[:-1] + 1e-12)
+    return r[np.isfinite(r)], initial
+
+
+# ========== 抽樣 ==========
+def _sample_indices(rng: np.random.Generator, n_paths: int, n: int, method: str, block: int) -> np.ndarray:
+    if method == "shuffle":
+        return np.argsort(rng.random((n_paths, n)), axis=1)
+    if method == "trades" or block <= 1:
+        return rng.integers(0, n, size=(n_paths, n))
+    # moving-block bootstrap：每條路徑由 ceil(n / block) 個隨機起點的連續區塊接成 (循環取值)
+    n_blocks = -(-n // block)
+    starts = rng.integers(0, n, size=(n_paths, n_blocks))
+    idx = (starts[:, :, None] + np.arange(block)).reshape(n_paths, -1)[:, :n]
+    return idx % n
+
+
+def _path_metrics(r: np.ndarray, initial: float, periods_per_year: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """r: (n_paths, n) 報酬矩陣 (會被就地覆寫) -> 每條路徑的 (pnl, max_drawdown, sharpe)"""
+    if r.shape[1] > 1:
+        std = r.std(axis=1, ddof=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sharpe = np.where(std > 0, r.mean(axis=1) / std * np.sqrt(periods_per_year), 0.0)
+    else:
+        sharpe = np.zeros(r.shape[0])
+
+    # 權益 = initial * cumprod(1 + r)，就地計算以免多配置幾份 (n_paths, n) 矩陣
+    equity = np.add(r, 1.0, out=r)
+    np.cumprod(equity, axis=1, out=equity)
+    equity *= initial
+    pnl = equity[:, -1] - initial
+
+    if initial > 0:
+        peak = np.maximum.accumulate(equity, axis=1)
+        np.maximum(peak, initial, out=peak)
+        np.divide(equity, peak, out=peak)
+        max_dd = 1.0 - peak.min(axis=1)
+    else:
+        max_dd = np.zeros(r.shape[0])
+    return pnl, max_dd, sharpe
+
+
+def simulate(returns: np.ndarray, initial: float = 1.0, n_paths: int = 10000, method: str = "block",
+             block: Optional[int] = None, seed: Any = None,
+             periods_per_year: float = PERIODS_PER_YEAR) -> Dict[str, np.ndarray]:
+    """回傳 {"pnl", "max_drawdown", "sharpe"}，各為長度 n_paths 的陣列"""
+    returns = np.asarray(returns, dtype=float)
+    n = returns.size
+    if n == 0:
+        zeros = np.zeros(n_paths)
+        return {"pnl": zeros, "max_drawdown": zeros, "sharpe": zeros}
+    if block is None:
+        block = max(1, int(round(n ** (1 / 3))))
+    rng = np.random.default_rng(seed)
+
+    pnl = np.empty(n_paths)
+    max_dd = np.empty(n_paths)
+    sharpe = np.empty(n_paths)
+    chunk = max(1, _CHUNK_ELEMENTS // n)
+    for lo in range(0, n_paths, chunk):
+        hi = min(n_paths, lo + chunk)
+        idx = _sample_indices(rng, hi - lo, n, method, block)
+        pnl[lo:hi], max_dd[lo:hi], sharpe[lo:hi] = _path_metrics(returns[idx], initial, periods_per_year)
+    return {"pnl": pnl, "max_drawdown": max_dd, "sharpe": sharpe}
+
+
+def summarize(paths: Dict[str, np.ndarray], quantiles: Sequence[float] = QUANTILES) -> Dict[str, float]:
+    """各指標的分位數 (欄名如 sharpe_p5)，另附虧損機率 prob_loss"""
+    out = {}
+    for name, values in paths.items():
+        for q, v in zip(quantiles, np.quantile(values, quantiles)):
+            out[f"{name}_p{int(round(q * 100))}"] = float(v)
+    out["prob_loss"] = float(np.mean(paths["pnl"] < 0))
+    return out
+
+
+def robustness(result: Any, n_paths: int = 10000, method: str = "block", block: Optional[int] = None,
+               seed: Any = None, periods_per_year: float = PERIODS_PER_YEAR,
+               quantiles: Sequence[float] = QUANTILES) -> Dict[str, float]:
+    """單一候選：回傳 PnL / 最大回撤 / Sharpe 的信賴區間"""
+    returns, initial = extract_returns(result, method)
+    paths = simulate(returns, initial, n_paths=n_paths, method=method, block=block, seed=seed,
+                     periods_per_year=periods_per_year)
+    return summarize(paths, quantiles)
+
+
+# ========== 多候選平行 ==========
+def _robustness_task(returns: np.ndarray, initial: float, kwargs: Dict[str, Any]) -> Dict[str, float]:
+    quantiles = kwargs.pop("quantiles")
+    return summarize(simulate(returns, initial, **kwargs), quantiles)
+
+
+def robustness_many(candidates: Dict[Hashable, Any], n_paths: int = 10000, method: str = "block",
+                    block: Optional[int] = None, seed: Optional[int] = None,
+                    periods_per_year: float = PERIODS_PER_YEAR, quantiles: Sequence[float] = QUANTILES,
+                    n_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    candidates: { key: simulate_trades / Backtester.run 結果或權益序列 }
+    回傳以 key 為 index 的 DataFrame (pnl_p5 ... sharpe_p95, prob_loss)。
+    每個候選有獨立的亂數串流 (SeedSequence.spawn)，結果與 worker 數無關。
+    """
+    keys = list(candidates)
+    if not keys:
+        return pd.DataFrame()
+    seeds = np.random.SeedSequence(seed).spawn(len(keys))
+    tasks = []
+    for key, ss in zip(keys, seeds):
+        returns, initial = extract_returns(candidates[key], method)
+        kwargs = {"n_paths": n_paths, "method": method, "block": block, "seed": ss,
+                  "periods_per_year": periods_per_year, "quantiles": tuple(quantiles)}
+        tasks.append((returns, initial, kwargs))
+
+    n_workers = max(1, min(int(n_workers or os.cpu_count() or 1), len(tasks)))
+    if n_workers == 1:
+        rows = [_robustness_task(*t) for t in tasks]
+    else:
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx) as pool:
+            rows = list(pool.map(_robustness_task, *zip(*tasks)))
+    index = pd.MultiIndex.from_tuples(keys) if all(isinstance(k, tuple) for k in keys) else keys
+    return pd.DataFrame(rows, index=index)
@@ -1,11 +1,10 @@
-import ccxt
 import json
 import random
 
+from exchange_registry import get_exchange
+
 # === 初始化交易所 (Binance) ===
-exchange = ccxt.binance({
-    "enableRateLimit": True
-})
+exchange = get_exchange("binance")
 
 # === 抓取成交額前 50 幣種 ===
 def get_top_50_symbols():
@@ -4,7 +4,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 from data_fetch import fetch_multi_timeframes
-from signal_generator import generate_signal
+from indicator_stream import iter_signals
+from ohlcv_resample import alignment
 from strategies import run_strategy
 
 BEST_PATH = "best_params.json"
@@ -21,7 +22,8 @@ def load_selected():
             return json.load(f)
     return None
 
-def backtest_equity(symbol, strategy_name, params, dfs):
+def backtest_equity(symbol, strategy_name, params, dfs, align=None):
+    # align: ohlcv_resample.alignment(dfs)，多個策略共用同一份對齊索引
     df_1m = dfs["1m"]
     balance = 10000
     position = 0
@@ -33,16 +35,10 @@ def backtest_equity(symbol, strategy_name, params, dfs):
     tp_pct = params.get("take_profit_pct", 0.05)
     sl_pct = params.get("stop_loss_pct", -0.03)
 
-    for i in range(len(df_1m)):
-        price = df_1m["close"].iloc[i]
-        dfs_slice = {
-            "1m": df_1m.iloc[:i+1],
-            "15m": dfs["15m"].iloc[:i//15+1],
-            "1h": dfs["1h"].iloc[:i//60+1],
-            "4h": dfs["4h"].iloc[:i//240+1],
-            "1d": dfs["1d"].iloc[:i//1440+1],
-        }
-        sigs = generate_signal(dfs_slice)
+    closes = df_1m["close"].to_numpy(dtype=float)
+    # 串流指標：每根 K 線 O(1) 更新，等同對前綴呼叫 generate_signal
+    for i, sigs in iter_signals(dfs, align):
+        price = closes[i]
         decision = run_strategy(strategy_name, sigs)
 
         if decision == 1 and position == 0:
@@ -94,6 +90,7 @@ def plot_report(equity_curves):
 if __name__ == "__main__":
     symbol = "BTCUSDT"
     dfs = fetch_multi_timeframes(symbol, limit=1000)
+    align = alignment(dfs)
     strategies = load_strategies()
     old_selected = load_selected()
 
@@ -102,7 +99,7 @@ if __name__ == "__main__":
 
     for name, cfg in strategies.items():
         params = cfg["params"]
-        curve = backtest_equity(symbol, name, params, dfs)
+        curve = backtest_equity(symbol, name, params, dfs, align)
         equity_curves[name] = curve
 
         final_balance = curve.iloc[-1]
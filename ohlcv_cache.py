@@ -0,0 +1,82 @@
+# ohlcv_cache.py
+"""
+記憶體內 OHLCV 快取 (TTL + LRU)
+
+鍵為 (exchange, symbol, timeframe)。TTL 內重複要求直接命中，不碰交易所也不讀磁碟；
+過期時交給 loader 補抓：loader 走 ohlcv_store.fetch_through，只抓最後一根快取 K 線之後的資料。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import pandas as pd
+
+Loader = Callable[[str, str, int], pd.DataFrame]
+
+
+class OHLCVCache:
+    def __init__(self, maxsize: int = 128, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def get(self, exchange_id: str, symbol: str, timeframe: str, limit: int, loader: Loader) -> pd.DataFrame:
+        """
+        回傳最近 limit 根 (ccxt 欄位格式)。
+        hit: TTL 內且筆數足夠；refresh: 已過期，補抓新 K 線；miss: 沒有快取或筆數不足。
+        """
+        key = (exchange_id, symbol, timeframe)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                fetched_at, df = entry
+                if time.monotonic() - fetched_at < self.ttl and len(df) >= limit:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return df.tail(limit).reset_index(drop=True)
+                if len(df) >= limit:
+                    self.refreshes += 1
+                else:
+                    self.misses += 1
+            else:
+                self.misses += 1
+
+        want = max(limit, len(entry[1])) if entry is not None else limit
+        df = loader(symbol, timeframe, want)
+
+        with self._lock:
+            if not df.empty:
+                self._data[key] = (time.monotonic(), df)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+        return df.tail(limit).reset_index(drop=True)
+
+    def invalidate(self, exchange_id: Optional[str] = None, symbol: Optional[str] = None):
+        with self._lock:
+            for key in list(self._data):
+                if (exchange_id is None or key[0] == exchange_id) and (symbol is None or key[1] == symbol):
+                    del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses + self.refreshes
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "evictions": self.evictions,
+                "entries": len(self._data),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
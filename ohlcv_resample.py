@@ -0,0 +1,150 @@
+# ohlcv_resample.py
+"""
+由最細週期 K 線在本地合成高週期 K 線，並提供以 searchsorted 建立的多週期對齊索引
+
+- resample_ohlcv(df, timeframe): 分桶邊界與交易所相同 (UTC epoch 對齊；1w 自週一 00:00 起、1M 為自然月)，
+  open=第一根、high=最高、low=最低、close=最後一根、volume=加總，以 np.*.reduceat 一次完成
+- derive_timeframes(base, timeframes): 只抓最細週期一次，其餘週期在本地合成
+- align_index(ts_high, ts_low): 每根低週期 K 線對應的高週期 K 線索引 (開盤時間 <= 低週期開盤時間的最後一根，
+  -1 表示尚無)；closed_only=True 時只對應已收盤的高週期 K 線
+- alignment(dfs): 對一組多週期資料一次算好所有週期相對於基準週期的對齊索引，供多週期消費者共用
+
+以時間戳對齊取代 i // 15、i // 60 這類假設「基準序列從整點開始且沒有缺口」的索引運算。
+"""
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from ohlcv_store import timeframe_ms
+
+DAY_MS = 86_400_000
+WEEK_ORIGIN_MS = 4 * DAY_MS  # 1970-01-05 (週一)，交易所週線的起點
+
+
+# ========== 時間戳 ==========
+def to_ms(ts) -> np.ndarray:
+    """毫秒整數 / datetime (含時區) 的序列 -> int64 毫秒陣列 (UTC)"""
+    if isinstance(ts, (pd.Series, pd.Index)) and pd.api.types.is_numeric_dtype(ts.dtype):
+        return np.asarray(ts, dtype=np.int64)
+    arr = np.asarray(ts)
+    if arr.dtype.kind in "iuf":
+        return arr.astype(np.int64)
+    dt = pd.DatetimeIndex(pd.to_datetime(ts))
+    if dt.tz is not None:
+        dt = dt.tz_convert("UTC").tz_localize(None)
+    return dt.values.astype("datetime64[ms]").astype(np.int64)
+
+
+def frame_timestamps(df: pd.DataFrame) -> np.ndarray:
+    """K 線 DataFrame 的開盤時間 (毫秒)：優先 timestamp 欄位，其次 DatetimeIndex"""
+    if "timestamp" in df.columns:
+        return to_ms(df["timestamp"])
+    if isinstance(df.index, pd.DatetimeIndex):
+        return to_ms(df.index)
+    raise ValueError("OHLCV frame needs a timestamp column or a DatetimeIndex")
+
+
+def bucket_start(ts_ms: np.ndarray, timeframe: str) -> np.ndarray:
+    """每個時間戳所屬高週期 K 線的開盤時間 (毫秒)"""
+    ts_ms = np.asarray(ts_ms, dtype=np.int64)
+    tf = str(timeframe).strip()
+    if tf.endswith("M"):
+        # 自然月 (ohlcv_store.timeframe_ms 不分大小寫，"1M" 會被當成 1 分鐘，這裡先攔下)
+        n = int(tf[:-1] or 1)
+        months = ts_ms.astype("datetime64[ms]").astype("datetime64[M]").astype(np.int64)
+        months -= months % n
+        return months.astype("datetime64[M]").astype("datetime64[ms]").astype(np.int64)
+    step = timeframe_ms(tf)
+    origin = WEEK_ORIGIN_MS if tf.lower().endswith("w") else 0
+    return ts_ms - (ts_ms - origin) % step
+
+
+# ========== 合成 ==========
+def resample_ohlcv(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """
+    把較細週期的 K 線合成 timeframe 週期；輸出的時間格式與輸入相同
+    (timestamp 欄位維持毫秒整數或 datetime，DatetimeIndex 維持原時區)。
+    最後一根若尚未走完 (與交易所回傳的最新 K 線相同) 仍會輸出。
+    """
+    cols = ["open", "high", "low", "close", "volume"]
+    if df is None or df.empty:
+        return pd.DataFrame(columns=(["timestamp"] if "timestamp" in getattr(df, "columns", []) else []) + cols)
+
+    ts = frame_timestamps(df)
+    order = None
+    if len(ts) > 1 and np.any(np.diff(ts) <= 0):
+        order = np.argsort(ts, kind="stable")
+        ts = ts[order]
+        keep = np.r_[True, ts[1:] != ts[:-1]]
+        order, ts = order[keep], ts[keep]
+
+    def col(name):
+        arr = df[name].to_numpy(dtype=float)
+        return arr[order] if order is not None else arr
+
+    buckets = bucket_start(ts, timeframe)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(ts)] - 1
+
+    out = {
+        "open": col("open")[starts],
+        "high": np.maximum.reduceat(col("high"), starts),
+        "low": np.minimum.reduceat(col("low"), starts),
+        "close": col("close")[ends],
+        "volume": np.add.reduceat(col("volume"), starts),
+    }
+    opens = buckets[starts]
+
+    if "timestamp" in df.columns:
+        src = df["timestamp"]
+        if pd.api.types.is_numeric_dtype(src.dtype):
+            stamp = opens
+        else:
+            stamp = pd.to_datetime(opens, unit="ms", utc=True)
+            tz = getattr(src.dt, "tz", None)
+            stamp = stamp.tz_convert(tz) if tz is not None else stamp.tz_localize(None)
+        return pd.DataFrame({"timestamp": stamp, **out})
+
+    index = pd.to_datetime(opens, unit="ms", utc=True)
+    tz = df.index.tz
+    index = index.tz_convert(tz) if tz is not None else index.tz_localize(None)
+    return pd.DataFrame(out, index=pd.DatetimeIndex(index, name=df.index.name))
+
+
+def derive_timeframes(base: pd.DataFrame, timeframes: Iterable[str],
+                      base_timeframe: str = "1m") -> Dict[str, pd.DataFrame]:
+    """{ tf: df }，基準週期原樣放入，其餘由 base 合成"""
+    out = {}
+    for tf in timeframes:
+        out[tf] = base if tf == base_timeframe else resample_ohlcv(base, tf)
+    return out
+
+
+# ========== 對齊 ==========
+def align_index(ts_high, ts_low, high_tf: Optional[str] = None, low_tf: Optional[str] = None,
+                closed_only: bool = False) -> np.ndarray:
+    """
+    對每根低週期 K 線回傳高週期 K 線的位置索引 (int64，-1 = 尚無對應)。
+    預設：高週期開盤時間 <= 低週期開盤時間的最後一根 (即包含該根的高週期 K 線)。
+    closed_only=True (需 high_tf / low_tf)：高週期收盤時間 <= 低週期收盤時間的最後一根，不含未收盤的高週期 K 線。
+    """
+    hi = to_ms(ts_high)
+    lo = to_ms(ts_low)
+    if closed_only:
+        if high_tf is None or low_tf is None:
+            raise ValueError("closed_only alignment needs high_tf and low_tf")
+        hi = hi + timeframe_ms(high_tf)
+        lo = lo + timeframe_ms(low_tf)
+    return np.searchsorted(hi, lo, side="right").astype(np.int64) - 1
+
+
+def alignment(dfs: Dict[str, pd.DataFrame], base: str = "1m", closed_only: bool = False) -> Dict[str, np.ndarray]:
+    """{ tf: 基準週期每根 K 線對應的 tf 索引 }，空的週期略過"""
+    base_ts = frame_timestamps(dfs[base])
+    out = {}
+    for tf, df in dfs.items():
+        if tf == base or df is None or df.empty:
+            continue
+        out[tf] = align_index(frame_timestamps(df), base_ts, high_tf=tf, low_tf=base, closed_only=closed_only)
+    return out
@@ -0,0 +1,321 @@
+# ohlcv_store.py
+"""
+本地 OHLCV 欄式儲存
+
+每個 (exchange, symbol, timeframe) 一個固定長度紀錄的二進位檔 (numpy 結構陣列，
+可直接 memmap)，旁邊一個 json 索引記錄已覆蓋的時間區間。
+- append: 新資料比最後一根新時直接附加到檔尾；否則合併後原子性重寫
+- read(start, end): memmap + searchsorted 切片，不需解析文字
+- missing_ranges(start, end): 回傳尚未覆蓋的區間，供只抓缺口使用
+- 交易所鍵含市場類型 (market_key："bybit" / "bybit:future")，同一交易所的現貨與合約 K 線不混存
+- uncover / known_gaps: 驗證發現缺口時移除覆蓋標記以便重抓；重抓後仍缺的 (交易所本身沒有) 記為已知缺口
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+OHLCV_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+DEFAULT_ROOT = Path(os.environ.get("OHLCV_STORE_DIR", Path(__file__).parent / "data" / "store"))
+PAGE_BARS = 1000       # fetch_through 單次請求的根數 (交易所上限)
+
+_UNIT_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+
+
+def timeframe_ms(timeframe: str) -> int:
+    """'1m' / '15m' / '4h' / '1d' / '1w' -> 每根 K 線毫秒數"""
+    tf = str(timeframe).strip()
+    unit = tf[-1].lower()
+    if unit not in _UNIT_MS:
+        raise ValueError(f"unsupported timeframe: {timeframe}")
+    return int(tf[:-1] or 1) * _UNIT_MS[unit]
+
+
+def market_key(exchange_id: str, market_type: Optional[str] = None) -> str:
+    """
+    store / 快取用的交易所鍵：現貨為交易所 id，其他市場加上 ":<市場類型>" (例如 "bybit:future")，
+    同一交易所的現貨與合約 K 線 (id 形式的代號如 BTCUSDT 依 defaultType 解析) 分開存放
+    """
+    if ":" in exchange_id or market_type in (None, "", "spot"):
+        return exchange_id
+    return f"{exchange_id}:{market_type}"
+
+
+def split_market_key(key: str) -> Tuple[str, str]:
+    """market_key 的反向：(交易所 id, 市場類型)"""
+    exchange_id, _, market_type = str(key).partition(":")
+    return exchange_id, market_type or "spot"
+
+
+def client_key(exchange: Any) -> str:
+    """ccxt client 對應的 store 鍵 (依實際的 options.defaultType)"""
+    return market_key(exchange.id, (getattr(exchange, "options", None) or {}).get("defaultType"))
+
+
+def _safe_name(s: str) -> str:
+    return str(s).replace("/", "_").replace(":", "-")
+
+
+def _to_records(data) -> np.ndarray:
+    """ccxt 的 [[ts, o, h, l, c, v], ...] 或含 timestamp 欄/索引的 DataFrame -> 排序去重的結構陣列"""
+    if isinstance(data, np.ndarray) and data.dtype == RECORD_DTYPE:
+        rec = data.copy()
+    elif isinstance(data, pd.DataFrame):
+        df = data
+        if "timestamp" not in df.columns:
+            df = df.reset_index().rename(columns={df.index.name or "index": "timestamp"})
+        ts = df["timestamp"]
+        if not np.issubdtype(ts.dtype, np.number):
+            ts = (pd.to_datetime(ts, utc=True) - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(milliseconds=1)
+        rec = np.empty(len(df), dtype=RECORD_DTYPE)
+        rec["timestamp"] = np.asarray(ts, dtype=np.int64)
+        for col in OHLCV_COLUMNS[1:]:
+            rec[col] = df[col].to_numpy(dtype=np.float64)
+    else:
+        arr = np.asarray(list(data), dtype=np.float64).reshape(-1, 6)
+        rec = np.empty(len(arr), dtype=RECORD_DTYPE)
+        rec["timestamp"] = arr[:, 0].astype(np.int64)
+        for k, col in enumerate(OHLCV_COLUMNS[1:], start=1):
+            rec[col] = arr[:, k]
+    if len(rec) == 0:
+        return rec
+    # 排序後同一 timestamp 保留最後一筆（較新的回應覆蓋舊值）
+    rec = rec[np.argsort(rec["timestamp"], kind="stable")]
+    keep = np.ones(len(rec), dtype=bool)
+    keep[:-1] = rec["timestamp"][1:] != rec["timestamp"][:-1]
+    return rec[keep]
+
+
+def _merge_ranges(ranges: List[List[int]], step: int) -> List[List[int]]:
+    """合併重疊或相鄰 (間隔 <= 一根 K 線) 的覆蓋區間"""
+    out: List[List[int]] = []
+    for s, e in sorted(ranges):
+        if out and s <= out[-1][1] + step:
+            out[-1][1] = max(out[-1][1], e)
+        else:
+            out.append([s, e])
+    return out
+
+
+class OHLCVStore:
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = Path(root)
+        self._lock = threading.RLock()
+
+    # ---------- 路徑 / 索引 ----------
+    def _paths(self, exchange: str, symbol: str, timeframe: str) -> Tuple[Path, Path]:
+        folder = self.root / _safe_name(exchange) / _safe_name(symbol)
+        return folder / f"{timeframe}.bin", folder / f"{timeframe}.json"
+
+    def _load_index(self, path: Path) -> dict:
+        if not path.exists():
+            return {"ranges": []}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_index(self, path: Path, index: dict):
+        tmp = path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp, path)
+
+    def covered_ranges(self, exchange: str, symbol: str, timeframe: str) -> List[Tuple[int, int]]:
+        _, idx_path = self._paths(exchange, symbol, timeframe)
+        return [tuple(r) for r in self._load_index(idx_path)["ranges"]]
+
+    def list_series(self, exchange: Optional[str] = None) -> List[Tuple[str, str, str]]:
+        """store 內所有 (exchange, symbol, timeframe)；舊索引沒有記錄 symbol 時以資料夾名稱代替"""
+        out = []
+        for idx_path in sorted(self.root.glob("*/*/*.json")):
+            index = self._load_index(idx_path)
+            ex = index.get("exchange", idx_path.parent.parent.name)
+            if exchange is not None and ex != exchange:
+                continue
+            out.append((ex, index.get("symbol", idx_path.parent.name), index.get("timeframe", idx_path.stem)))
+        return out
+
+    def uncover(self, exchange: str, symbol: str, timeframe: str, start: int, end: int):
+        """把 [start, end] 自覆蓋區間移除，下次 missing_ranges 會回報為缺少"""
+        step = timeframe_ms(timeframe)
+        _, idx_path = self._paths(exchange, symbol, timeframe)
+        with self._lock:
+            index = self._load_index(idx_path)
+            ranges = []
+            for s, e in index["ranges"]:
+                if e < start or s > end:
+                    ranges.append([s, e])
+                    continue
+                if s < start:
+                    ranges.append([s, start - step])
+                if e > end:
+                    ranges.append([end + step, e])
+            index["ranges"] = ranges
+            self._save_index(idx_path, index)
+
+    def known_gaps(self, exchange: str, symbol: str, timeframe: str) -> List[Tuple[int, int]]:
+        _, idx_path = self._paths(exchange, symbol, timeframe)
+        return [tuple(r) for r in self._load_index(idx_path).get("known_gaps", [])]
+
+    def add_known_gaps(self, exchange: str, symbol: str, timeframe: str, gaps: List[Tuple[int, int]]):
+        """重抓後交易所仍沒有資料的區間，之後驗證不再排入重抓"""
+        _, idx_path = self._paths(exchange, symbol, timeframe)
+        with self._lock:
+            index = self._load_index(idx_path)
+            merged = {tuple(g) for g in index.get("known_gaps", [])} | {(int(s), int(e)) for s, e in gaps}
+            index["known_gaps"] = [list(g) for g in sorted(merged)]
+            self._save_index(idx_path, index)
+
+    # ---------- 讀取 ----------
+    def read_array(self, exchange: str, symbol: str, timeframe: str,
+                   start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        """回傳 [start, end] (毫秒, 含端點) 的結構陣列；底層為唯讀 memmap，不複製資料"""
+        bin_path, _ = self._paths(exchange, symbol, timeframe)
+        if not bin_path.exists() or bin_path.stat().st_size == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        arr = np.memmap(bin_path, dtype=RECORD_DTYPE, mode="r")
+        ts = arr["timestamp"]
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+        hi = len(arr) if end is None else int(np.searchsorted(ts, end, side="right"))
+        return arr[lo:hi]
+
+    def read(self, exchange: str, symbol: str, timeframe: str,
+             start: Optional[int] = None, end: Optional[int] = None) -> pd.DataFrame:
+        """同 ccxt fetch_ohlcv 的欄位 (timestamp 為毫秒整數)"""
+        arr = self.read_array(exchange, symbol, timeframe, start, end)
+        return pd.DataFrame({col: np.array(arr[col]) for col in OHLCV_COLUMNS})
+
+    def last_timestamp(self, exchange: str, symbol: str, timeframe: str) -> Optional[int]:
+        arr = self.read_array(exchange, symbol, timeframe)
+        return int(arr["timestamp"][-1]) if len(arr) else None
+
+    def missing_ranges(self, exchange: str, symbol: str, timeframe: str,
+                       start: int, end: int) -> List[Tuple[int, int]]:
+        """[start, end] 內尚未覆蓋的 K 線區間 (以 bar 開盤時間表示，含端點)"""
+        step = timeframe_ms(timeframe)
+        start = start - start % step
+        end = end - end % step
+        missing = []
+        cursor = start
+        for s, e in self.covered_ranges(exchange, symbol, timeframe):
+            if e < cursor:
+                continue
+            if s > end:
+                break
+            if s > cursor:
+                missing.append((cursor, min(s - step, end)))
+            cursor = max(cursor, e + step)
+            if cursor > end:
+                break
+        if cursor <= end:
+            missing.append((cursor, end))
+        return missing
+
+    # ---------- 寫入 ----------
+    def append(self, exchange: str, symbol: str, timeframe: str, data,
+               start: Optional[int] = None, end: Optional[int] = None) -> int:
+        """
+        寫入 K 線並把 [start, end] 標記為已覆蓋 (預設為資料本身的首尾時間)。
+        已存在的 timestamp 以新資料覆蓋。回傳寫入筆數。
+        """
+        rec = _to_records(data)
+        if len(rec) == 0 and (start is None or end is None):
+            return 0
+        step = timeframe_ms(timeframe)
+        bin_path, idx_path = self._paths(exchange, symbol, timeframe)
+        with self._lock:
+            bin_path.parent.mkdir(parents=True, exist_ok=True)
+            if len(rec):
+                old = self.read_array(exchange, symbol, timeframe)
+                if len(old) == 0 or rec["timestamp"][0] > old["timestamp"][-1]:
+                    with open(bin_path, "ab") as f:
+                        f.write(rec.tobytes())
+                elif rec["timestamp"][0] == old["timestamp"][-1]:
+                    # 最後一根 (可能尚未收盤) 原地覆寫，其餘附加
+                    with open(bin_path, "r+b") as f:
+                        f.seek((len(old) - 1) * RECORD_DTYPE.itemsize)
+                        f.write(rec.tobytes())
+                else:
+                    merged = _to_records(np.concatenate([np.array(old), rec]))
+                    del old
+                    tmp = bin_path.with_suffix(".bin.tmp")
+                    with open(tmp, "wb") as f:
+                        f.write(merged.tobytes())
+                    os.replace(tmp, bin_path)
+
+            index = self._load_index(idx_path)
+            s = int(rec["timestamp"][0]) if start is None else int(start)
+            e = int(rec["timestamp"][-1]) if end is None else int(end)
+            index["ranges"] = _merge_ranges(index["ranges"] + [[s - s % step, e - e % step]], step)
+            index["timeframe"] = timeframe
+            index["symbol"] = symbol
+            index["exchange"] = exchange
+            self._save_index(idx_path, index)
+        return len(rec)
+
+
+_default_store: Optional[OHLCVStore] = None
+
+
+def default_store() -> OHLCVStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = OHLCVStore()
+    return _default_store
+
+
+def fetch_through(exchange: Any, symbol: str, timeframe: str = "1h", limit: int = 1000,
+                  store: Optional[OHLCVStore] = None,
+                  exchange_factory: Optional[Callable[[], Any]] = None,
+                  exchange_id: Optional[str] = None) -> pd.DataFrame:
+    """
+    讀穿式取數：只向交易所抓 store 缺少的區間 (加上最後一根可能未收盤的 K 線)，
+    分頁寫回 store 後回傳最近 limit 根 (ccxt 欄位格式)。
+    exchange 可為 None，需要連線時才呼叫 exchange_factory() 建立 (此時以 exchange_id 作為 store 鍵，
+    應含市場類型，見 market_key)；抓取失敗時退回既有資料。
+    """
+    store = store or default_store()
+    ex_id = exchange_id or (client_key(exchange) if exchange is not None else "bybit")
+    step = timeframe_ms(timeframe)
+    now = int(time.time() * 1000)
+    end = now - now % step
+    start = end - (limit - 1) * step
+
+    missing = store.missing_ranges(ex_id, symbol, timeframe, start, end)
+    last_ts = store.last_timestamp(ex_id, symbol, timeframe)
+    since = missing[0][0] if missing else None
+    if last_ts is not None and start <= last_ts <= end:
+        since = last_ts if since is None else min(since, last_ts)
+
+    if since is not None:
+        try:
+            if exchange is None and exchange_factory is not None:
+                exchange = exchange_factory()
+            # 交易所單次最多回傳約 PAGE_BARS 根 (有些更少)，從 since 逐頁往後抓到 end
+            cursor = int(since)
+            while cursor <= end:
+                page = exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=cursor, limit=PAGE_BARS)
+                page = [row for row in page if cursor <= row[0] <= end]
+                if not page:
+                    break
+                last = int(page[-1][0])
+                # 只標記這一頁實際涵蓋的 [cursor, last]；cursor 到第一根之間無資料 (例如尚未上架) 也視為已覆蓋
+                store.append(ex_id, symbol, timeframe, page, start=cursor, end=last)
+                cursor = last + step
+        except Exception:
+            pass                       # 已寫入的頁保留，其餘下次再補
+
+    df = store.read(ex_id, symbol, timeframe, start=start)
+    return df.tail(limit).reset_index(drop=True)
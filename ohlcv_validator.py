@@ -0,0 +1,285 @@
+# ohlcv_validator.py
+"""
+OHLCV 資料驗證 (向量化，整段序列一次掃描)
+
+- 時間戳：int64 差分找出重複 (diff == 0)、亂序 (diff < 0)、未對齊 K 線邊界、缺口 (diff > 一根)
+- 價格：開高低收 <= 0 或非有限值、成交量 < 0、high / low 與開收盤矛盾
+- 異常跳動：收盤 log 報酬與 log(high / low) 的穩健 z-score (中位數 / MAD) 超過門檻
+
+validate_frame / validate_series 回傳單一序列的報告 (dict)；validate_store 掃描整個 ohlcv_store，
+回傳 (摘要表, 缺口表)。refetch_jobs 把缺口轉成 kline_downloader.download 的 jobs，
+repair 移除缺口的覆蓋標記後只重抓這些區間，重抓後仍缺的記為已知缺口 (交易所本身沒有資料)。
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ohlcv_resample import bucket_start, frame_timestamps
+from ohlcv_store import OHLCVStore, default_store, split_market_key, timeframe_ms
+
+Z_THRESHOLD = 10.0     # 穩健 z-score 門檻 (1.4826 * MAD 視為一個標準差)
+MAD_SCALE = 1.4826
+SUMMARY_COLUMNS = ["exchange", "symbol", "timeframe", "bars", "start", "end", "gaps", "missing_bars",
+                   "known_gaps", "duplicates", "unordered", "misaligned", "bad_price", "bad_volume",
+                   "bad_ohlc", "spikes", "coverage"]
+GAP_COLUMNS = ["exchange", "symbol", "timeframe", "start", "end", "missing_bars", "known"]
+
+
+# ========== 單一序列 ==========
+def _robust_z(x: np.ndarray) -> np.ndarray:
+    finite = np.isfinite(x)
+    if finite.sum() < 3:
+        return np.zeros_like(x)
+    med = np.median(x[finite])
+    mad = np.median(np.abs(x[finite] - med)) * MAD_SCALE
+    if mad <= 0:
+        return np.zeros_like(x)
+    with np.errstate(invalid="ignore"):
+        return np.where(finite, (x - med) / mad, 0.0)
+
+
+def _in_ranges(starts: np.ndarray, ends: np.ndarray, ranges: Iterable[Tuple[int, int]]) -> np.ndarray:
+    """每個 [start, end] 是否完全落在 ranges 任一區間內"""
+    ranges = sorted(ranges)
+    if not ranges or len(starts) == 0:
+        return np.zeros(len(starts), dtype=bool)
+    lo = np.array([r[0] for r in ranges], dtype=np.int64)
+    hi = np.array([r[1] for r in ranges], dtype=np.int64)
+    k = np.searchsorted(lo, starts, side="right") - 1
+    ok = k >= 0
+    out = np.zeros(len(starts), dtype=bool)
+    out[ok] = hi[k[ok]] >= ends[ok]
+    return out
+
+
+def validate_arrays(ts, open_, high, low, close, volume, timeframe: str,
+                    z_threshold: float = Z_THRESHOLD,
+                    known_gaps: Iterable[Tuple[int, int]] = ()) -> dict:
+    """
+    ts 為毫秒 int64 (依原順序)，回傳：
+    counts (各項問題的根數)、gaps (缺口的 start / end / missing_bars / known 陣列，以缺少的 K 線開盤時間表示)、
+    bad_index (價格 / 成交量 / OHLC 矛盾 / 異常跳動任一成立的位置)
+    """
+    ts = np.asarray(ts, dtype=np.int64)
+    o, h, l, c, v = (np.asarray(x, dtype=np.float64) for x in (open_, high, low, close, volume))
+    n = len(ts)
+    step = timeframe_ms(timeframe)
+
+    diff = np.diff(ts)
+    duplicates = int((diff == 0).sum())
+    unordered = int((diff < 0).sum())
+    misaligned = int((bucket_start(ts, timeframe) != ts).sum()) if n else 0
+
+    # 缺口：只看遞增的相鄰兩根；以缺少的 K 線開盤時間 [start, end] 表示 (與 store 覆蓋區間同格式)
+    tf = str(timeframe).strip()
+    if tf.endswith("M"):
+        # 自然月長度不一，以月份序號計算
+        months = ts.astype("datetime64[ms]").astype("datetime64[M]").astype(np.int64) // int(tf[:-1] or 1)
+        gap_at = np.flatnonzero(np.diff(months) > 1)
+        missing = months[gap_at + 1] - months[gap_at] - 1
+        gap_start = bucket_start(ts[gap_at] + 32 * 86_400_000 * int(tf[:-1] or 1), tf)
+        gap_end = bucket_start(ts[gap_at + 1] - 1, tf)
+    else:
+        gap_at = np.flatnonzero(diff > step)
+        missing = diff[gap_at] // step - 1
+        gap_start = ts[gap_at] + step
+        gap_end = ts[gap_at + 1] - step
+    known = _in_ranges(gap_start, gap_end, known_gaps)
+
+    finite = np.isfinite(o) & np.isfinite(h) & np.isfinite(l) & np.isfinite(c)
+    bad_price = ~finite | (o <= 0) | (h <= 0) | (l <= 0) | (c <= 0)
+    bad_volume = ~np.isfinite(v) | (v < 0)
+    with np.errstate(invalid="ignore"):
+        bad_ohlc = finite & ((h < np.maximum(o, c)) | (l > np.minimum(o, c)) | (h < l))
+
+    # 異常跳動：收盤 log 報酬 / 單根振幅的穩健 z-score
+    spikes = np.zeros(n, dtype=bool)
+    if n > 1:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            logc = np.where(bad_price, np.nan, np.log(np.where(c > 0, c, np.nan)))
+            ret = np.diff(logc)
+            spread = np.log(np.where(bad_price, np.nan, h / l))
+        spikes[1:] |= np.abs(_robust_z(ret)) > z_threshold
+        spikes |= _robust_z(spread) > z_threshold
+
+    bad = bad_price | bad_volume | bad_ohlc | spikes
+    return {
+        "bars": n,
+        "start": int(ts.min()) if n else None,
+        "end": int(ts.max()) if n else None,
+        "counts": {
+            "gaps": int(len(gap_at)),
+            "missing_bars": int(missing.sum()),
+            "known_gaps": int(known.sum()),
+            "duplicates": duplicates,
+            "unordered": unordered,
+            "misaligned": misaligned,
+            "bad_price": int(bad_price.sum()),
+            "bad_volume": int(bad_volume.sum()),
+            "bad_ohlc": int(bad_ohlc.sum()),
+            "spikes": int(spikes.sum()),
+        },
+        "gaps": {"start": gap_start, "end": gap_end, "missing_bars": missing, "known": known},
+        "bad_index": np.flatnonzero(bad),
+    }
+
+
+def validate_frame(df: pd.DataFrame, timeframe: str, **kwargs) -> dict:
+    """K 線 DataFrame (timestamp 欄或 DatetimeIndex) 的驗證報告，依原列順序檢查"""
+    return validate_arrays(frame_timestamps(df), df["open"], df["high"], df["low"], df["close"],
+                           df["volume"], timeframe, **kwargs)
+
+
+def validate_series(store: OHLCVStore, exchange: str, symbol: str, timeframe: str, **kwargs) -> dict:
+    """store 內整段序列 (memmap，不複製) 的驗證報告"""
+    arr = store.read_array(exchange, symbol, timeframe)
+    kwargs.setdefault("known_gaps", store.known_gaps(exchange, symbol, timeframe))
+    return validate_arrays(arr["timestamp"], arr["open"], arr["high"], arr["low"], arr["close"],
+                           arr["volume"], timeframe, **kwargs)
+
+
+# ========== 整個 store ==========
+def _coverage(report: dict) -> float:
+    if not report["bars"]:
+        return 0.0
+    expected = report["bars"] + report["counts"]["missing_bars"] - report["counts"]["duplicates"]
+    return (report["bars"] - report["counts"]["duplicates"]) / expected if expected else 0.0
+
+
+def validate_store(store: Optional[OHLCVStore] = None, exchange: Optional[str] = None,
+                   symbols: Optional[Iterable[str]] = None, timeframes: Optional[Iterable[str]] = None,
+                   max_workers: int = 8, **kwargs) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """回傳 (每個序列一列的摘要表, 每個缺口一列的缺口表)；各序列以執行緒並行 (numpy 運算不持有 GIL)"""
+    store = store or default_store()
+    symbols = set(symbols) if symbols is not None else None
+    timeframes = set(timeframes) if timeframes is not None else None
+    series = [(ex, sym, tf) for ex, sym, tf in store.list_series(exchange)
+              if (symbols is None or sym in symbols) and (timeframes is None or tf in timeframes)]
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as pool:
+        reports = list(pool.map(lambda key: validate_series(store, *key, **kwargs), series))
+
+    summary, gaps = [], []
+    for (ex, sym, tf), report in zip(series, reports):
+        summary.append({"exchange": ex, "symbol": sym, "timeframe": tf, "bars": report["bars"],
+                        "start": report["start"], "end": report["end"], **report["counts"],
+                        "coverage": _coverage(report)})
+        g = report["gaps"]
+        if len(g["start"]):
+            gaps.append(pd.DataFrame({"exchange": ex, "symbol": sym, "timeframe": tf, "start": g["start"],
+                                      "end": g["end"], "missing_bars": g["missing_bars"], "known": g["known"]}))
+    summary = pd.DataFrame(summary, columns=SUMMARY_COLUMNS)
+    gaps = pd.concat(gaps, ignore_index=True) if gaps else pd.DataFrame(columns=GAP_COLUMNS)
+    return summary, gaps
+
+
+# ========== 重抓 ==========
+def refetch_jobs(gaps: pd.DataFrame, include_known: bool = False) -> Dict[str, List[Tuple[str, str, int, int]]]:
+    """缺口表 -> { exchange: [(symbol, timeframe, start, end), ...] }，只含缺少的區間"""
+    if not include_known and len(gaps):
+        gaps = gaps[~gaps["known"].astype(bool)]
+    jobs: Dict[str, List[Tuple[str, str, int, int]]] = {}
+    for ex, sym, tf, s, e in gaps[["exchange", "symbol", "timeframe", "start", "end"]].itertuples(index=False):
+        jobs.setdefault(ex, []).append((sym, tf, int(s), int(e)))
+    return jobs
+
+
+def _is_rest_symbol(exchange_id: str, symbol: str) -> bool:
+    """kline_downloader 預設 (BinanceKlines) 寫入的序列：binance + REST 代號 (BTCUSDT)"""
+    return exchange_id == "binance" and "/" not in symbol
+
+
+def repair(gaps: pd.DataFrame, store: Optional[OHLCVStore] = None, fetch_pages: Optional[dict] = None,
+           **download_kwargs) -> pd.DataFrame:
+    """
+    重抓缺口：移除缺口的覆蓋標記，交給 kline_downloader.download 只抓這些區間，再驗證一次；
+    請求成功但仍缺少的區間記為已知缺口。
+    fetch_pages: { exchange: 分段抓取器 }；未提供時 binance REST 代號用 BinanceKlines，
+    其餘 (fetch_through / code.download_ohlcv 寫入的 ccxt 代號) 用 ccxt_pages(get_exchange(...))，
+    市場類型取自 store 鍵 (例如 "bybit:future" -> get_exchange("bybit", market_type="future"))；
+    建立不了 client 的交易所略過並保留原覆蓋標記。
+    回傳重抓後仍存在的缺口表 (known=False 表示未修復，下次再重抓)。
+    """
+    from kline_downloader import ccxt_pages, download
+
+    store = store or default_store()
+    fetch_pages = fetch_pages or {}
+    groups: Dict[Tuple[str, bool], List[Tuple[str, str, int, int]]] = {}
+    for ex, ex_jobs in refetch_jobs(gaps).items():
+        for job in ex_jobs:
+            rest = ex not in fetch_pages and _is_rest_symbol(ex, job[0])
+            groups.setdefault((ex, rest), []).append(job)
+
+    attempted, remaining = [], []
+    for (ex, rest), group in groups.items():
+        fetch_page = fetch_pages.get(ex)
+        if fetch_page is None and not rest:
+            try:
+                from exchange_registry import get_exchange
+                exchange_id, market_type = split_market_key(ex)
+                fetch_page = ccxt_pages(get_exchange(exchange_id, market_type=market_type))
+            except Exception as e:
+                print(f"skip refetch for {ex} ({len(group)} gaps): {e}")
+                symbols = {sym for sym, _, _, _ in group}
+                remaining.append(gaps[(gaps["exchange"] == ex) & gaps["symbol"].isin(symbols)
+                                      & ~gaps["known"].astype(bool)])
+                continue
+        for sym, tf, s, e in group:
+            store.uncover(ex, sym, tf, s, e)
+        download(group, fetch_page=fetch_page, exchange_id=ex, store=store, **download_kwargs)
+        attempted.extend((ex, sym, tf) for sym, tf, _, _ in group)
+
+    for ex, sym, tf in sorted(set(attempted)):
+        g = validate_series(store, ex, sym, tf)["gaps"]
+        new = ~g["known"]
+        # 已重新標記覆蓋 (請求成功) 卻仍沒有資料：交易所本身的缺口；請求失敗的留待下次重抓
+        known = np.array([new[i] and not store.missing_ranges(ex, sym, tf, int(g["start"][i]), int(g["end"][i]))
+                          for i in range(len(new))], dtype=bool)
+        if known.any():
+            store.add_known_gaps(ex, sym, tf, list(zip(g["start"][known].tolist(), g["end"][known].tolist())))
+        if new.any():
+            remaining.append(pd.DataFrame({"exchange": ex, "symbol": sym, "timeframe": tf,
+                                           "start": g["start"][new], "end": g["end"][new],
+                                           "missing_bars": g["missing_bars"][new], "known": known[new]}))
+    remaining = [r for r in remaining if len(r)]
+    return pd.concat(remaining, ignore_index=True) if remaining else pd.DataFrame(columns=GAP_COLUMNS)
+
+
+def format_gaps(gaps: pd.DataFrame, limit: int = 50) -> str:
+    """精簡缺口報告：每個缺口一行 (UTC 時間)"""
+    if gaps.empty:
+        return "no gaps"
+    out = gaps.head(limit).copy()
+    for col in ("start", "end"):
+        out[col] = pd.to_datetime(out[col].astype("int64"), unit="ms").dt.strftime("%Y-%m-%d %H:%M")
+    text = out.to_string(index=False)
+    if len(gaps) > limit:
+        text += f"\n... {len(gaps) - limit} more"
+    return text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="驗證本地 OHLCV store 的缺口 / 重複 / 異常值")
+    parser.add_argument("--exchange")
+    parser.add_argument("--symbols", nargs="*")
+    parser.add_argument("--timeframes", nargs="*")
+    parser.add_argument("--z", type=float, default=Z_THRESHOLD, help="異常跳動的穩健 z-score 門檻")
+    parser.add_argument("--refetch", action="store_true", help="只重抓缺口區間 (已知缺口除外)")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    summary, gaps = validate_store(exchange=args.exchange, symbols=args.symbols, timeframes=args.timeframes,
+                                   z_threshold=args.z)
+    print(summary.to_string(index=False))
+    print(f"\n{len(summary)} series, {int(summary['bars'].sum()) if len(summary) else 0} bars "
+          f"validated in {time.time() - t0:.2f}s\n")
+    print(format_gaps(gaps))
+    if args.refetch and not gaps.empty:
+        remaining = repair(gaps)
+        known = int(remaining["known"].sum()) if len(remaining) else 0
+        print(f"\nrefetched: {len(remaining)} gaps remain ({known} missing on the exchange, recorded as known; "
+              f"{len(remaining) - known} failed, retry later)")
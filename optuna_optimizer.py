@@ -1,14 +1,22 @@
-import optuna
 import numpy as np
+from datetime import datetime
+from ohlcv_resample import alignment
+from optuna_pruning import Checkpoints, make_pruner
+from parallel_optuna import run_parallel
 from strategies import STRATEGY_CONFIGS, run_strategy
 from signal_generator import generate_signal
 
 # 假設你有一個回測函數
-def backtest(strategy_name, weights, threshold, df_1m, df_15m, df_1h):
+def backtest(strategy_name, weights, threshold, df_1m, df_15m, df_1h, checkpoints=None, align=None):
     """
     回測策略績效
+    checkpoints: optuna_pruning.Checkpoints，於檢查點回報當下報酬率以便剪枝
+    align: ohlcv_resample.alignment 的結果 (1m 每根對應的 15m / 1h 索引)；未提供時在此計算
     return: 總收益率 或 Sharpe Ratio
     """
+    if align is None:
+        align = alignment({"1m": df_1m, "15m": df_15m, "1h": df_1h})
+    idx_15m, idx_1h = align["15m"], align["1h"]
     # 更新策略配置
     STRATEGY_CONFIGS[strategy_name]["weights"] = weights
     STRATEGY_CONFIGS[strategy_name]["threshold"] = threshold
@@ -18,7 +26,12 @@ def backtest(strategy_name, weights, threshold, df_1m, df_15m, df_1h):
     pnl_history = []
 
     for i in range(50, len(df_1m)):  # 從第50根開始，避免指標計算不完整
-        sigs = generate_signal(df_1m.iloc[:i], df_15m.iloc[:i//15], df_1h.iloc[:i//60])
+        # 1m 前綴 [:i] 的最後一根為 i-1，高週期取到包含該根的 K 線為止
+        sigs = generate_signal({
+            "1m": df_1m.iloc[:i],
+            "15m": df_15m.iloc[:idx_15m[i - 1] + 1],
+            "1h": df_1h.iloc[:idx_1h[i - 1] + 1],
+        })
         decision = run_strategy(strategy_name, sigs)
 
         price = df_1m["close"].iloc[i]
@@ -31,6 +44,9 @@ def backtest(strategy_name, weights, threshold, df_1m, df_15m, df_1h):
             pnl_history.append(balance)
             position = 0
 
+        if checkpoints is not None and checkpoints.due(i - 50):
+            checkpoints.report(i - 50, (balance + position * price) / 10000 - 1)
+
     # 最後平倉
     if position > 0:
         balance = position * df_1m["close"].iloc[-1]
@@ -46,6 +62,15 @@ def backtest(strategy_name, weights, threshold, df_1m, df_15m, df_1h):
 
     return sharpe
 
+# worker 行程啟動時由 run_parallel 注入 (memmap 共享的 K 線)，對齊索引也只算一次
+df_1m = df_15m = df_1h = None
+align = None
+
+def attach_data(frames):
+    global df_1m, df_15m, df_1h, align
+    df_1m, df_15m, df_1h = frames["1m"], frames["15m"], frames["1h"]
+    align = alignment(frames)
+
 # Optuna 目標函數
 def objective(trial):
     strategy_name = trial.suggest_categorical("strategy", ["trend_mix", "osc_mix", "hybrid_mix"])
@@ -58,12 +83,25 @@ def objective(trial):
     threshold = trial.suggest_float("threshold", 0.1, 0.5)
 
     # 假設你已經有 df_1m, df_15m, df_1h
-    score = backtest(strategy_name, weights, threshold, df_1m, df_15m, df_1h)
+    checkpoints = Checkpoints(trial, n_bars=len(df_1m) - 50)
+    score = backtest(strategy_name, weights, threshold, df_1m, df_15m, df_1h, checkpoints=checkpoints, align=align)
     return score
 
 if __name__ == "__main__":
-    study = optuna.create_study(direction="maximize")
-    study.optimize(objective, n_trials=50)
+    from data_fetch import fetch_multi_timeframes
+
+    dfs = fetch_multi_timeframes("BTC/USDT")
+    # 多行程共同跑同一個 study；當天重跑會接續未完成的 trial
+    study = run_parallel(
+        objective,
+        study_name=f"strategy_weights_{datetime.now():%Y%m%d}",
+        storage="sqlite:///optuna_optimizer.db",
+        n_trials=50,
+        direction="maximize",
+        pruner=make_pruner(),
+        shared={tf: dfs[tf] for tf in ("1m", "15m", "1h")},
+        setup=attach_data,
+    )
 
     print("最佳參數:", study.best_params)
     print("最佳績效:", study.best_value)
\ No newline at end of file
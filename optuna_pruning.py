@@ -0,0 +1,104 @@
+# optuna_pruning.py
+"""
+Optuna 剪枝 (pruning) 工具
+
+- make_pruner(name): "median" / "hyperband" / "sha" (successive halving) / "none"，
+  未指定時讀環境變數 OPTUNA_PRUNER (預設 median)
+- Checkpoints: 回測迴圈在固定檢查點回報中間報酬率 (trial.report)，
+  該剪時丟出 optuna.TrialPruned，差的參數組不必跑完整段回測
+
+多目標 study 不支援 trial.report：改把檢查點值記在 trial user attr，
+與已完成 trial 在同一檢查點的中位數比較 (median stopping rule)；study 的 pruner 為 NopPruner 時不剪。
+檢查點只有報酬率，報酬低的 trial 仍可能在其他目標 (Sharpe、回撤) 上位於 Pareto 前緣，
+因此 make_pruner(multi_objective=True) 預設回傳 NopPruner，需明確指定 name 或 OPTUNA_PRUNER 才剪。
+"""
+import os
+from typing import Any, Optional
+
+import numpy as np
+import optuna
+from optuna.study import StudyDirection
+from optuna.trial import TrialState
+
+PRUNER_ENV = "OPTUNA_PRUNER"
+N_STARTUP_TRIALS = 5
+N_WARMUP_STEPS = 2
+
+
+def make_pruner(name: Optional[str] = None, n_startup_trials: int = N_STARTUP_TRIALS,
+                n_warmup_steps: int = N_WARMUP_STEPS, max_resource: Any = "auto",
+                multi_objective: bool = False) -> optuna.pruners.BasePruner:
+    """multi_objective=True 時未指定 name / OPTUNA_PRUNER 即不剪 (只看報酬率剪枝會讓 Pareto 前緣偏向報酬)"""
+    default = "none" if multi_objective else "median"
+    name = (name or os.environ.get(PRUNER_ENV) or default).strip().lower()
+    if name == "median":
+        return optuna.pruners.MedianPruner(n_startup_trials=n_startup_trials, n_warmup_steps=n_warmup_steps)
+    if name == "hyperband":
+        return optuna.pruners.HyperbandPruner(min_resource=1, max_resource=max_resource, reduction_factor=3)
+    if name in ("sha", "successive_halving", "successivehalving"):
+        return optuna.pruners.SuccessiveHalvingPruner(min_resource=1, reduction_factor=3)
+    if name in ("none", "nop", "off"):
+        return optuna.pruners.NopPruner()
+    raise ValueError(f"unknown pruner: {name}")
+
+
+def _should_prune_multi(trial, step: int, value: float) -> bool:
+    """多目標 study 的中位數規則 (需明確啟用)：低於已完成 trial 同一檢查點的中位數即剪"""
+    key = f"checkpoint_{step}"
+    trial.set_user_attr(key, float(value))
+    if step < N_WARMUP_STEPS:
+        return False
+    done = [t.user_attrs.get(key) for t in trial.study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,))]
+    done = [v for v in done if v is not None]
+    if len(done) < N_STARTUP_TRIALS:
+        return False
+    return value < float(np.median(done))
+
+
+class Checkpoints:
+    """
+    回測引擎用的檢查點回報器。
+
+    n_bars 根 K 線平均切成 n_checkpoints 個檢查點；引擎在迴圈中呼叫
+        if checkpoints is not None and checkpoints.due(i):
+            checkpoints.report(i, equity / initial - 1)
+    向量化引擎可在算完權益曲線後改呼叫 checkpoints.report_series(equity / initial - 1)。
+    value 一律為「越大越好」(報酬率)，study 方向為 minimize 時自動取負號。
+    多資產目標函數以 segment=k 區分各資產，使各資產的檢查點 step 不重疊。
+    """
+
+    def __init__(self, trial, n_bars: int, n_checkpoints: int = 10, segment: int = 0):
+        self.trial = trial
+        self.n_checkpoints = max(1, int(n_checkpoints))
+        self.every = max(1, int(n_bars) // self.n_checkpoints)
+        self.base = int(segment) * self.n_checkpoints
+        self.enabled = trial is not None and not isinstance(trial.study.pruner, optuna.pruners.NopPruner)
+        directions = trial.study.directions if trial is not None else []
+        self.multi = len(directions) > 1
+        self.sign = -1.0 if (len(directions) == 1 and directions[0] == StudyDirection.MINIMIZE) else 1.0
+
+    def due(self, i: int) -> bool:
+        return self.enabled and (i + 1) % self.every == 0 and (i + 1) // self.every <= self.n_checkpoints
+
+    def report(self, i: int, value: float):
+        step = self.base + (i + 1) // self.every
+        value = float(value)
+        if not np.isfinite(value):
+            return
+        if self.multi:
+            prune = _should_prune_multi(self.trial, step, value)
+        else:
+            self.trial.report(self.sign * value, step)
+            prune = self.trial.should_prune()
+        if prune:
+            raise optuna.TrialPruned(f"pruned at checkpoint {step} (value={value:.4f})")
+
+    def report_series(self, values):
+        """向量化引擎整段算完後，依序回報各檢查點 (values[i] 對應迴圈中的第 i 根)"""
+        if not self.enabled:
+            return
+        for k in range(1, self.n_checkpoints + 1):
+            i = k * self.every - 1
+            if i >= len(values):
+                break
+            self.report(i, values[i])
@@ -0,0 +1,234 @@
+# parallel_optuna.py
+"""
+多行程平行 Optuna
+
+run_parallel() 以 K 個 worker 行程 (spawn) 共同跑同一個 study：
+- storage: "sqlite:///path.db" (RDB，含 heartbeat，當掉的 trial 會被標記失敗並重試)
+           或 "journal:path.log" / "*.log" (JournalStorage 檔案後端，適合網路磁碟)
+- shared: 預先載入的 { key: DataFrame } 會寫成 .npy，worker 以 memmap 唯讀開啟，不各自重抓也不複製
+- timeout: 整體牆鐘預算 (秒)；n_trials: 本次 run 的總 trial 數 (跨 worker 合計)
+- 續跑: 同一 study_name + run_id 再執行一次，只補足尚未完成的 trial 數
+
+objective / setup / sampler_factory 會被 pickle 給子行程，必須是模組層級函式 (或 functools.partial)，
+呼叫端腳本也必須有 if __name__ == "__main__": 保護。
+"""
+import inspect
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import optuna
+from optuna import storages as _storages
+from optuna.trial import TrialState
+
+RUN_ID_ATTR = "run_id"
+_DONE_STATES = (TrialState.COMPLETE, TrialState.PRUNED)
+
+
+# ========== storage ==========
+def make_storage(storage: Any, heartbeat_interval: int = 60, grace_period: int = 180, max_retry: int = 2) -> Any:
+    """字串 storage -> optuna storage 物件；非字串原樣回傳"""
+    if not isinstance(storage, str):
+        return storage
+    if storage.startswith("journal:") or storage.endswith(".log"):
+        path = storage[len("journal:"):] if storage.startswith("journal:") else storage
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        journal = optuna.storages.journal
+        backend_cls = getattr(journal, "JournalFileBackend", None) or optuna.storages.JournalFileStorage
+        return optuna.storages.JournalStorage(backend_cls(path))
+    engine_kwargs = {}
+    if storage.startswith("sqlite"):
+        # 多行程同時寫入 sqlite 時等待鎖，而不是立刻 "database is locked"
+        engine_kwargs["connect_args"] = {"timeout": 60}
+    # optuna 4.9 起 failed_trial_callback / RetryFailedTrialCallback 改名，兩種版本都支援
+    params = inspect.signature(optuna.storages.RDBStorage.__init__).parameters
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", optuna.exceptions.ExperimentalWarning)
+        if "heartbeat_stale_trial_callback" in params:
+            retry = {"heartbeat_stale_trial_callback": _storages.RetryHeartbeatStaleTrialCallback(max_retry=max_retry)}
+        else:
+            retry = {"failed_trial_callback": _storages.RetryFailedTrialCallback(max_retry=max_retry)}
+        return optuna.storages.RDBStorage(
+            storage,
+            engine_kwargs=engine_kwargs,
+            heartbeat_interval=heartbeat_interval,
+            grace_period=grace_period,
+            **retry,
+        )
+
+
+# ========== 共享 OHLCV (memmap) ==========
+def share_frames(frames: Dict[Hashable, pd.DataFrame], root: Optional[str] = None) -> Dict[str, Any]:
+    """
+    把 DataFrame 逐欄寫成 .npy，回傳可 pickle 的 manifest 給 load_frames 使用。
+    只支援數值 / bool / datetime 欄位 (OHLCV 與指標皆屬此類)。
+    """
+    root_path = Path(root or tempfile.mkdtemp(prefix="optuna_shared_"))
+    root_path.mkdir(parents=True, exist_ok=True)
+    entries = {}
+    for i, (key, df) in enumerate(frames.items()):
+        if df is None:
+            continue
+        cols = []
+        for j, col in enumerate(df.columns):
+            arr = df[col].to_numpy()
+            if arr.dtype == object:
+                raise ValueError(f"share_frames: column {col!r} of {key!r} is not numeric")
+            path = root_path / f"{i}_{j}.npy"
+            np.save(path, arr, allow_pickle=False)
+            cols.append((col, str(path)))
+        idx = df.index
+        if isinstance(idx, pd.RangeIndex):
+            index = ("range", idx.start, idx.stop, idx.step, idx.name)
+        else:
+            path = root_path / f"{i}_index.npy"
+            np.save(path, idx.to_numpy(), allow_pickle=False)
+            index = ("array", str(path), idx.name)
+        entries[key] = {"columns": cols, "index": index}
+    return {"root": str(root_path), "frames": entries}
+
+
+def load_frames(manifest: Dict[str, Any]) -> Dict[Hashable, pd.DataFrame]:
+    """share_frames 的反操作；各欄為唯讀 memmap，多個行程共用同一份 page cache"""
+    out = {}
+    for key, entry in manifest["frames"].items():
+        data = {col: np.load(path, mmap_mode="r") for col, path in entry["columns"]}
+        index = entry["index"]
+        if index[0] == "range":
+            idx = pd.RangeIndex(index[1], index[2], index[3], name=index[4])
+        else:
+            idx = pd.Index(np.load(index[1], mmap_mode="r"), name=index[2])
+        out[key] = pd.DataFrame(data, index=idx, copy=False)
+    return out
+
+
+# ========== trial 預算 ==========
+class _TaggedObjective:
+    """在 trial 上標記 run_id，讓續跑時能只計算本次 run 的 trial"""
+
+    def __init__(self, objective: Callable, run_id: Optional[str]):
+        self.objective = objective
+        self.run_id = run_id
+
+    def __call__(self, trial):
+        if self.run_id is not None:
+            trial.set_user_attr(RUN_ID_ATTR, self.run_id)
+        return self.objective(trial)
+
+
+def count_done(study: optuna.Study, run_id: Optional[str] = None) -> int:
+    trials = study.get_trials(deepcopy=False, states=_DONE_STATES)
+    if run_id is None:
+        return len(trials)
+    return sum(1 for t in trials if t.user_attrs.get(RUN_ID_ATTR) == run_id)
+
+
+class _TrialBudget:
+    """所有 worker 合計完成 n_trials 後停止 (以 storage 為準，因此跨行程與續跑皆正確)"""
+
+    def __init__(self, n_trials: int, run_id: Optional[str]):
+        self.n_trials = n_trials
+        self.run_id = run_id
+
+    def __call__(self, study: optuna.Study, trial):
+        if count_done(study, self.run_id) >= self.n_trials:
+            study.stop()
+
+
+# ========== worker ==========
+def _worker(rank: int, objective: Callable, study_name: str, storage: Any, n_trials: Optional[int],
+            deadline: Optional[float], run_id: Optional[str], sampler_factory: Optional[Callable],
+            seed: Optional[int], pruner: Any, shared: Optional[Dict[str, Any]], setup: Optional[Callable],
+            catch: Sequence[type]):
+    if rank > 0:
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+    if setup is not None:
+        setup(load_frames(shared) if shared is not None else None)
+
+    sampler = None
+    if sampler_factory is not None:
+        sampler = sampler_factory(None if seed is None else seed + rank)
+    study = optuna.load_study(study_name=study_name, storage=make_storage(storage), sampler=sampler, pruner=pruner)
+
+    callbacks = []
+    if n_trials is not None:
+        if count_done(study, run_id) >= n_trials:
+            return
+        callbacks.append(_TrialBudget(n_trials, run_id))
+    timeout = None
+    if deadline is not None:
+        timeout = deadline - time.time()
+        if timeout <= 0:
+            return
+    study.optimize(_TaggedObjective(objective, run_id), timeout=timeout,
+                   callbacks=callbacks, catch=tuple(catch), gc_after_trial=True)
+
+
+def run_parallel(objective: Callable, study_name: str, storage: str,
+                 n_trials: Optional[int] = None, timeout: Optional[float] = None,
+                 n_workers: Optional[int] = None, direction: Optional[str] = "maximize",
+                 directions: Optional[Sequence[str]] = None, run_id: Optional[str] = None,
+                 sampler_factory: Optional[Callable[[Optional[int]], Any]] = None, seed: Optional[int] = None,
+                 pruner: Optional[Any] = None,
+                 shared: Optional[Dict[Hashable, pd.DataFrame]] = None,
+                 setup: Optional[Callable[[Optional[Dict[Hashable, pd.DataFrame]]], None]] = None,
+                 catch: Iterable[type] = ()) -> optuna.Study:
+    """
+    以 n_workers 個行程 (預設 CPU 核心數) 平行最佳化同一個 study，回傳載入後的 study。
+
+    n_trials: 本次 run 的總 trial 數 (以 run_id 區分；run_id=None 時為整個 study 的總數)
+    timeout: 牆鐘預算秒數，所有 worker 共用同一個截止時間
+    sampler_factory(seed) -> sampler：每個 worker 以 seed + rank 建立，避免各行程抽到相同參數
+    pruner: 例如 optuna_pruning.make_pruner()，所有 worker 共用同一設定
+    shared / setup: shared 中的 DataFrame 以 memmap 共享，worker 啟動時呼叫 setup(frames)
+    """
+    if n_trials is None and timeout is None:
+        raise ValueError("run_parallel requires n_trials or timeout")
+    n_workers = max(1, int(n_workers or os.cpu_count() or 1))
+    deadline = time.time() + timeout if timeout is not None else None
+
+    study = optuna.create_study(
+        study_name=study_name,
+        storage=make_storage(storage),
+        direction=None if directions else direction,
+        directions=directions,
+        pruner=pruner,
+        load_if_exists=True,
+    )
+    if n_trials is not None:
+        done = count_done(study, run_id)
+        if done >= n_trials:
+            print(f"study {study_name} 已完成 {done} 個 trial，略過")
+            return study
+        # 剩餘 trial 少於核心數時不必啟動多餘的行程
+        n_workers = min(n_workers, n_trials - done)
+
+    manifest = share_frames(shared) if shared else None
+    args = (objective, study_name, storage, n_trials, deadline, run_id,
+            sampler_factory, seed, pruner, manifest, setup, tuple(catch))
+    try:
+        if n_workers == 1:
+            _worker(0, *args)
+        else:
+            ctx = mp.get_context("spawn")
+            procs = [ctx.Process(target=_worker, args=(rank, *args), name=f"optuna-worker-{rank}")
+                     for rank in range(n_workers)]
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+            failed = [p.name for p in procs if p.exitcode != 0]
+            if failed:
+                print(f"⚠️ worker 異常結束: {failed}；重新執行同一 study 即可續跑")
+    finally:
+        if manifest is not None:
+            shutil.rmtree(manifest["root"], ignore_errors=True)
+
+    return optuna.load_study(study_name=study_name, storage=make_storage(storage))
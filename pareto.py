@@ -0,0 +1,286 @@
+# pareto.py
+"""
+Pareto 前緣與非支配排序 (多目標最佳化結果的篩選)
+
+- pareto_mask(points, directions): 第一前緣；2 個目標以排序 + 前綴最大值的 skyline (O(n log n))，
+  3 個以上以 sort-filter skyline (依正規化和排序，後面的點不可能支配前面的點；每批找到的前緣點一次過濾其餘所有點)
+- non_dominated_sort(points, directions): 每個點的前緣編號 (0 = Pareto 前緣)；
+  2 個目標為排序後對各前緣的末端點二分搜尋 (O(n log n))，3 個以上以 skyline 逐層剝出前緣
+- crowding_distance(points, ranks): NSGA-II 的擁擠距離，同一前緣內依各目標排序後一次向量化算完
+- pareto_front(df, objectives) / rank_frame(df, objectives): 對 backtest_summary.csv 之類的 DataFrame 使用
+- study_front(study): 取代 study.best_trials，從 trial DB 匯出的目標值陣列直接求前緣
+
+directions: "maximize" / "minimize" (或 optuna 的 StudyDirection) 的序列，預設全部最大化。
+相同的點互不支配，會同時留在前緣上 (與原本 is_pareto_efficient 相同)；含 NaN 的點不列入任何前緣 (rank = -1)。
+"""
+import argparse
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+_CHUNK = 1024                # sort-filter skyline 每批判定的點數
+_BLOCK_ELEMENTS = 4_000_000   # 支配比對暫存矩陣的元素上限
+_FRONT_BLOCK = 16             # 每次拿幾個前緣點比對 (小塊才能盡早縮小候選集合)
+
+
+# ========== 輸入整理 ==========
+def _is_max(direction) -> bool:
+    name = getattr(direction, "name", direction)
+    name = str(name).lower()
+    if name in ("maximize", "max"):
+        return True
+    if name in ("minimize", "min"):
+        return False
+    raise ValueError(f"unknown direction: {direction!r}")
+
+
+def as_maximize(points, directions: Optional[Sequence] = None) -> np.ndarray:
+    """(n, k) 目標值 -> 全部轉為越大越好 (最小化的欄取負值) 的 float64 副本"""
+    pts = np.array(points, dtype=np.float64, ndmin=2)
+    if pts.ndim != 2:
+        raise ValueError("points must be a 2-D array of shape (n, k)")
+    if directions is not None:
+        if len(directions) != pts.shape[1]:
+            raise ValueError(f"{len(directions)} directions for {pts.shape[1]} objectives")
+        for j, d in enumerate(directions):
+            if not _is_max(d):
+                pts[:, j] = -pts[:, j]
+    return pts
+
+
+def _valid_rows(pts: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(~np.isnan(pts).any(axis=1))
+
+
+# ========== 第一前緣 ==========
+def _skyline_2d(pts: np.ndarray) -> np.ndarray:
+    """2 個目標：依 (x 遞減, y 遞減) 排序，x 相同的一組內只有 y 最大者可能留下，且須嚴格高於所有 x 更大者的 y"""
+    x, y = pts[:, 0], pts[:, 1]
+    order = np.lexsort((-y, -x))
+    xs, ys = x[order], y[order]
+    start = np.r_[True, xs[1:] != xs[:-1]]
+    group = np.cumsum(start) - 1
+    group_top = ys[start]                                   # 每組 (相同 x) 的最大 y
+    prev_best = np.r_[-np.inf, np.maximum.accumulate(group_top)[:-1]]
+    keep = (ys == group_top[group]) & (group_top[group] > prev_best[group])
+    mask = np.zeros(len(pts), dtype=bool)
+    mask[order[keep]] = True
+    return mask
+
+
+def _dominated_by(front: np.ndarray, cand: np.ndarray) -> np.ndarray:
+    """
+    cand 中每個點是否被 front 中任一點支配 (全部 >= 且至少一項 >)。
+    front 分小塊逐欄比較，每塊之後只保留尚未被支配的候選點，前面幾個強勢點淘汰大半後後續比對很便宜。
+    """
+    alive = np.arange(len(cand))
+    k = cand.shape[1]
+    lo = 0
+    while lo < len(front) and len(alive):
+        step = max(1, min(_FRONT_BLOCK, _BLOCK_ELEMENTS // len(alive)))
+        f = front[lo:lo + step]
+        sub = cand[alive]
+        ge = f[:, 0, None] >= sub[None, :, 0]
+        gt = f[:, 0, None] > sub[None, :, 0]
+        for j in range(1, k):
+            ge &= f[:, j, None] >= sub[None, :, j]
+            gt |= f[:, j, None] > sub[None, :, j]
+        alive = alive[~(ge & gt).any(axis=0)]
+        lo += step
+    out = np.ones(len(cand), dtype=bool)
+    out[alive] = False
+    return out
+
+
+def _skyline_nd(pts: np.ndarray) -> np.ndarray:
+    """
+    k 個目標：依正規化後的和遞減排序 (支配者必定排在前面)。
+    每次取尚未判定的前 _CHUNK 點，批內互比後的倖存者即為前緣成員，再以它們一次過濾其餘所有點；
+    多數點會被最早找到的幾個強勢點淘汰，剩下待判定的點迅速減少。
+    """
+    scale = pts.std(axis=0)
+    scale[~(scale > 0)] = 1.0
+    rest = np.argsort(-(pts / scale).sum(axis=1), kind="stable")
+    mask = np.zeros(len(pts), dtype=bool)
+    while len(rest):
+        head, rest = rest[:_CHUNK], rest[_CHUNK:]
+        cand = pts[head]
+        members = head[~_dominated_by(cand, cand)]
+        mask[members] = True
+        if len(rest):
+            rest = rest[~_dominated_by(pts[members], pts[rest])]
+    return mask
+
+
+def pareto_mask(points, directions: Optional[Sequence] = None) -> np.ndarray:
+    """第一前緣 (非支配點) 的布林遮罩"""
+    pts = as_maximize(points, directions)
+    mask = np.zeros(len(pts), dtype=bool)
+    rows = _valid_rows(pts)
+    if len(rows) == 0:
+        return mask
+    sub = pts[rows]
+    if sub.shape[1] == 1:
+        mask[rows] = sub[:, 0] == sub[:, 0].max()
+    elif sub.shape[1] == 2:
+        mask[rows] = _skyline_2d(sub)
+    else:
+        mask[rows] = _skyline_nd(sub)
+    return mask
+
+
+# ========== 非支配排序 ==========
+def _sort_2d(pts: np.ndarray) -> np.ndarray:
+    """
+    依 (x 遞減, y 遞減) 處理，各前緣只需記住最後加入的點：
+    它的 (y, x) 字典序嚴格大於新點即支配新點，且各前緣的末端鍵值隨前緣編號遞減，可二分搜尋
+    """
+    x, y = pts[:, 0], pts[:, 1]
+    order = np.lexsort((-y, -x))
+    ranks = np.empty(len(pts), dtype=np.int64)
+    tails: List[tuple] = []          # 各前緣末端點的 (-y, -x)，遞增
+    for i, (xi, yi) in zip(order.tolist(), zip(x[order].tolist(), y[order].tolist())):
+        key = (-yi, -xi)
+        f = bisect_left(tails, key)  # 第一個末端鍵值 <= 新點 (不支配新點) 的前緣
+        if f == len(tails):
+            tails.append(key)
+        else:
+            tails[f] = key
+        ranks[i] = f
+    return ranks
+
+
+def _sort_nd(pts: np.ndarray, max_rank: Optional[int]) -> np.ndarray:
+    """k 個目標：以 _skyline_nd 逐層剝出前緣 (每層都是整批向量化運算)"""
+    ranks = np.full(len(pts), -1, dtype=np.int64)
+    rest = np.arange(len(pts))
+    f = 0
+    while len(rest) and (max_rank is None or f <= max_rank):
+        front = _skyline_nd(pts[rest])
+        ranks[rest[front]] = f
+        rest = rest[~front]
+        f += 1
+    return ranks
+
+
+def non_dominated_sort(points, directions: Optional[Sequence] = None,
+                       max_rank: Optional[int] = None) -> np.ndarray:
+    """
+    每個點的前緣編號 (0 = Pareto 前緣，含 NaN 的點為 -1)。
+    max_rank: 3 個以上目標時只排到第 max_rank 層，其後的點為 -1 (NSGA 類選擇通常只需要前幾層)
+    """
+    pts = as_maximize(points, directions)
+    ranks = np.full(len(pts), -1, dtype=np.int64)
+    rows = _valid_rows(pts)
+    if len(rows) == 0:
+        return ranks
+    sub = pts[rows]
+    if sub.shape[1] == 1:
+        _, inv = np.unique(-sub[:, 0], return_inverse=True)
+        ranks[rows] = inv
+    elif sub.shape[1] == 2:
+        ranks[rows] = _sort_2d(sub)
+    else:
+        ranks[rows] = _sort_nd(sub, max_rank)
+    return ranks
+
+
+def crowding_distance(points, ranks: np.ndarray, directions: Optional[Sequence] = None) -> np.ndarray:
+    """
+    NSGA-II 擁擠距離：同一前緣內依各目標排序，兩端為 inf，中間為相鄰兩點差距 / 該前緣的值域，各目標加總。
+    rank = -1 的點為 NaN。
+    """
+    pts = as_maximize(points, directions)
+    ranks = np.asarray(ranks)
+    dist = np.zeros(len(pts))
+    valid = ranks >= 0
+    idx = np.flatnonzero(valid)
+    if len(idx) == 0:
+        return np.full(len(pts), np.nan)
+    r = ranks[idx]
+    for j in range(pts.shape[1]):
+        v = pts[idx, j]
+        order = np.lexsort((v, r))
+        vs, rs = v[order], r[order]
+        first = np.r_[True, rs[1:] != rs[:-1]]
+        last = np.r_[rs[1:] != rs[:-1], True]
+        group = np.cumsum(first) - 1
+        span = (vs[last] - vs[first])[group]
+        gap = np.zeros(len(vs))
+        inner = ~(first | last)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gap[inner] = np.where(span[inner] > 0, (vs[2:] - vs[:-2])[inner[1:-1]] / span[inner], 0.0)
+        gap[first | last] = np.inf
+        dist[idx[order]] += gap
+    dist[~valid] = np.nan
+    return dist
+
+
+# ========== DataFrame / Optuna ==========
+def _objective_arrays(df: pd.DataFrame, objectives: Dict[str, str]):
+    cols = list(objectives)
+    return df[cols].to_numpy(dtype=np.float64), [objectives[c] for c in cols]
+
+
+def pareto_front(df: pd.DataFrame, objectives: Dict[str, str]) -> pd.DataFrame:
+    """objectives: {欄名: "maximize"/"minimize"}，回傳第一前緣的列"""
+    pts, directions = _objective_arrays(df, objectives)
+    return df[pareto_mask(pts, directions)]
+
+
+def rank_frame(df: pd.DataFrame, objectives: Dict[str, str]) -> pd.DataFrame:
+    """加上 pareto_rank / crowding 欄位，依前緣編號、擁擠距離 (大者優先) 排序"""
+    pts, directions = _objective_arrays(df, objectives)
+    ranks = non_dominated_sort(pts, directions)
+    out = df.copy()
+    out["pareto_rank"] = ranks
+    out["crowding"] = crowding_distance(pts, ranks, directions)
+    out = out[out["pareto_rank"] >= 0]
+    return out.sort_values(["pareto_rank", "crowding"], ascending=[True, False], kind="stable")
+
+
+def study_values(study):
+    """完成的 trial 與其目標值矩陣 (n_trials, n_objectives)"""
+    from optuna.trial import TrialState
+
+    trials = study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,))
+    values = np.array([t.values for t in trials], dtype=np.float64).reshape(len(trials), len(study.directions))
+    return trials, values
+
+
+def study_front(study) -> list:
+    """study.best_trials 的替代：依 study.directions 求完成 trial 的 Pareto 前緣 (依 trial 編號排序)"""
+    trials, values = study_values(study)
+    if not trials:
+        return []
+    mask = pareto_mask(values, study.directions)
+    return [t for t, keep in zip(trials, mask) if keep]
+
+
+# ========== CLI ==========
+def _parse_objective(text: str):
+    name, _, direction = text.rpartition("=")
+    if not name:
+        raise argparse.ArgumentTypeError(f"objective must look like column=max|min, got {text!r}")
+    _is_max(direction)
+    return name, direction
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="從 CSV (例如 backtest_summary.csv) 擷取 Pareto 前緣")
+    parser.add_argument("csv")
+    parser.add_argument("objectives", nargs="+", type=_parse_objective, help="欄名=max 或 欄名=min")
+    parser.add_argument("--rank", action="store_true", help="輸出全部列並附上 pareto_rank / crowding")
+    parser.add_argument("--out", help="輸出 CSV 路徑 (預設印出)")
+    args = parser.parse_args()
+
+    table = pd.read_csv(args.csv)
+    objectives = dict(args.objectives)
+    result = rank_frame(table, objectives) if args.rank else pareto_front(table, objectives)
+    if args.out:
+        result.to_csv(args.out, index=False, encoding="utf-8-sig")
+        print(f"✅ {len(result)} 列已輸出到 {args.out}")
+    else:
+        print(result.to_string(index=False))
@@ -0,0 +1,221 @@
+# perf_metrics.py
+"""
+單次掃描的績效指標累加器
+
+- MetricsAccumulator: O(1) 記憶體，逐根 update(equity)、逐筆 add_trade(pnl)
+  報酬以 Welford 累計平均 / 變異數，權益維護滾動高點與最大回撤 (相對 / 絕對)，
+  交易累計勝率、獲利因子、平均持倉時間；update_many(arr) 以向量化方式一次併入一段權益
+- batch_metrics(equity, axis): (n_bars, n_paths) 權益矩陣的同一組指標，一次算完所有欄
+
+報酬 = (eq[i] - eq[i-1]) / eq[i-1]；前一根權益為 0 或報酬非有限值時該根不計入。
+Sharpe = mean / (std + eps) * sqrt(periods_per_year)，報酬少於 2 筆或分母為 0 時回傳 0。
+各呼叫端沿用自己原本的 ddof / eps / 年化期數。
+"""
+import math
+from typing import Dict, Optional
+
+import numpy as np
+
+PERIODS_PER_YEAR = 252 * 24  # 與 backtester.calculate_sharpe_ratio 相同 (小時線)
+
+
+class MetricsAccumulator:
+    __slots__ = ("n", "first", "last", "peak", "max_dd", "max_dd_abs",
+                 "n_ret", "_mean", "_m2",
+                 "n_trades", "wins", "losses", "gross_profit", "gross_loss",
+                 "_holding_sum", "_n_holding")
+
+    def __init__(self):
+        self.n = 0                  # 已併入的 bar 數
+        self.first = math.nan
+        self.last = math.nan
+        self.peak = math.nan
+        self.max_dd = 0.0           # (peak - eq) / peak 的最大值，peak <= 0 時不計
+        self.max_dd_abs = 0.0       # peak - eq 的最大值
+        self.n_ret = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.n_trades = 0
+        self.wins = 0
+        self.losses = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self._holding_sum = 0.0
+        self._n_holding = 0
+
+    # ========== 權益 ==========
+    def update(self, equity: float) -> None:
+        eq = float(equity)
+        if self.n == 0:
+            self.first = self.peak = eq
+        else:
+            prev = self.last
+            if prev != 0:
+                r = (eq - prev) / prev
+                if math.isfinite(r):
+                    self.n_ret += 1
+                    delta = r - self._mean
+                    self._mean += delta / self.n_ret
+                    self._m2 += delta * (r - self._mean)
+            if eq > self.peak:
+                self.peak = eq
+        self.last = eq
+        self.n += 1
+
+        dd_abs = self.peak - eq
+        if dd_abs > self.max_dd_abs:
+            self.max_dd_abs = dd_abs
+        if self.peak > 0 and dd_abs / self.peak > self.max_dd:
+            self.max_dd = dd_abs / self.peak
+
+    def update_many(self, equity) -> None:
+        """一次併入一段權益 (結果與逐根 update 相同，僅浮點誤差)"""
+        eq = np.asarray(equity, dtype=np.float64).ravel()
+        if eq.size == 0:
+            return
+        if self.n == 0:
+            self.first = float(eq[0])
+            self.peak = float(eq[0])
+            prev = eq[:-1]
+            cur = eq[1:]
+        else:
+            prev = np.concatenate(([self.last], eq[:-1]))
+            cur = eq
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = (cur - prev) / prev
+        r = r[(prev != 0) & np.isfinite(r)]
+        if r.size:
+            # Chan 的平行合併公式
+            m = r.size
+            mean_b = float(r.mean())
+            m2_b = float(((r - mean_b) ** 2).sum())
+            total = self.n_ret + m
+            delta = mean_b - self._mean
+            self._mean += delta * m / total
+            self._m2 += m2_b + delta * delta * self.n_ret * m / total
+            self.n_ret = total
+
+        peak = np.maximum.accumulate(np.concatenate(([self.peak], eq)))[1:]
+        dd_abs = peak - eq
+        self.max_dd_abs = max(self.max_dd_abs, float(dd_abs.max()))
+        pos = peak > 0
+        if pos.any():
+            self.max_dd = max(self.max_dd, float((dd_abs[pos] / peak[pos]).max()))
+        self.peak = float(peak[-1])
+        self.last = float(eq[-1])
+        self.n += eq.size
+
+    # ========== 交易 ==========
+    def add_trade(self, pnl: float, holding: Optional[float] = None) -> None:
+        """pnl: 單筆損益 (金額或報酬率皆可，勝率 / 獲利因子只看正負與相對大小)"""
+        pnl = float(pnl)
+        self.n_trades += 1
+        if pnl > 0:
+            self.wins += 1
+            self.gross_profit += pnl
+        elif pnl < 0:
+            self.losses += 1
+            self.gross_loss -= pnl
+        if holding is not None:
+            self._holding_sum += float(holding)
+            self._n_holding += 1
+
+    # ========== 結果 ==========
+    @property
+    def pnl(self) -> float:
+        return self.last - self.first if self.n else 0.0
+
+    @property
+    def total_return(self) -> float:
+        return self.last / self.first - 1 if self.n and self.first else 0.0
+
+    @property
+    def mean_return(self) -> float:
+        return self._mean
+
+    def std_return(self, ddof: int = 1) -> float:
+        if self.n_ret - ddof <= 0:
+            return 0.0
+        return math.sqrt(self._m2 / (self.n_ret - ddof))
+
+    def sharpe(self, periods_per_year: float = PERIODS_PER_YEAR, ddof: int = 1, eps: float = 0.0) -> float:
+        if self.n_ret < 2:
+            return 0.0
+        denom = self.std_return(ddof) + eps
+        if denom <= 0:
+            return 0.0
+        return self._mean / denom * math.sqrt(periods_per_year)
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.n_trades if self.n_trades else 0.0
+
+    @property
+    def profit_factor(self) -> float:
+        return self.gross_profit / self.gross_loss if self.gross_loss > 0 else float("inf")
+
+    @property
+    def avg_holding(self) -> float:
+        return self._holding_sum / self._n_holding if self._n_holding else 0.0
+
+    def summary(self, periods_per_year: float = PERIODS_PER_YEAR, ddof: int = 1, eps: float = 0.0) -> Dict[str, float]:
+        return {
+            "pnl": self.pnl,
+            "total_return": self.total_return,
+            "max_drawdown": self.max_dd,
+            "max_drawdown_abs": self.max_dd_abs,
+            "sharpe": self.sharpe(periods_per_year, ddof, eps),
+            "trades": self.n_trades,
+            "win_rate": self.win_rate,
+            "profit_factor": self.profit_factor,
+        }
+
+
+def batch_metrics(equity, axis: int = 0, periods_per_year: float = PERIODS_PER_YEAR,
+                  ddof: int = 1, eps: float = 0.0) -> Dict[str, np.ndarray]:
+    """
+    equity: 2-D 權益矩陣，axis 為時間軸 (預設 (n_bars, n_paths))。
+    回傳 {"pnl", "total_return", "max_drawdown", "max_drawdown_abs", "sharpe"}，各為每條路徑一個值，
+    定義與 MetricsAccumulator 相同。
+    """
+    eq = np.moveaxis(np.asarray(equity, dtype=np.float64), axis, 0)
+    n_paths = eq.shape[1:]
+    if eq.shape[0] == 0:
+        zeros = np.zeros(n_paths)
+        return {"pnl": zeros, "total_return": zeros, "max_drawdown": zeros,
+                "max_drawdown_abs": zeros, "sharpe": zeros}
+
+    first, last = eq[0], eq[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total_return = np.where(first != 0, last / first - 1, 0.0)
+
+    peak = np.maximum.accumulate(eq, axis=0)
+    dd_abs = peak - eq
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dd = np.where(peak > 0, dd_abs / peak, 0.0)
+    max_dd = dd.max(axis=0)
+    max_dd_abs = dd_abs.max(axis=0)
+    del peak, dd, dd_abs
+
+    prev = eq[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = (eq[1:] - prev) / prev
+    valid = (prev != 0) & np.isfinite(r)
+    r = np.where(valid, r, 0.0)
+    count = valid.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = r.sum(axis=0) / count
+        np.subtract(r, mean, out=r)
+        r *= valid
+        std = np.sqrt((r * r).sum(axis=0) / (count - ddof))
+        denom = std + eps
+        sharpe = np.where((count >= 2) & (denom > 0), mean / denom * math.sqrt(periods_per_year), 0.0)
+
+    return {
+        "pnl": last - first,
+        "total_return": total_return,
+        "max_drawdown": max_dd,
+        "max_drawdown_abs": max_dd_abs,
+        "sharpe": sharpe,
+    }
@@ -1,10 +1,18 @@
 import json
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
 import matplotlib.pyplot as plt
 import matplotlib
 
+from momentum_kernel import pct_change, run_all_in
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from monte_carlo import robustness_many
+from pareto import pareto_front
+from perf_metrics import MetricsAccumulator
+
 # ✅ 字型設定，避免中文亂碼與負號顯示錯誤
 matplotlib.rcParams['font.sans-serif'] = ['Microsoft JhengHei']  # Windows 中文字型
 matplotlib.rcParams['axes.unicode_minus'] = False
@@ -19,6 +27,7 @@ DATA_FILES = {
 }
 SUMMARY_FILE = Path(__file__).parent / "backtest_summary.csv"
 PARETO_FILE = Path(__file__).parent / "pareto_front.json"
+MC_PATHS = 10000  # 每組參數 × 幣種的 Monte Carlo 路徑數
 
 def load_params_list():
     print(f"[INFO] 嘗試讀取參數檔案: {PARAMS_FILE.resolve()}")
@@ -29,35 +38,24 @@ def load_data(symbol):
     print(f"[INFO] 載入數據檔案: {DATA_FILES[symbol].resolve()}")
     return pd.read_csv(DATA_FILES[symbol], parse_dates=["time"])
 
-def backtest(df, params):
+def backtest(df, params, checkpoints=None):
     buy_threshold = params["buy_threshold"]
     sell_threshold = params["sell_threshold"]
     position_size = params["position_size"]
 
-    balance = 10000
-    position = 0
-    trades = []
-    equity_curve = []
-
-    for i in range(1, len(df)):
-        price_prev = df.loc[i-1, "close"]
-        price_now = df.loc[i, "close"]
-        change = (price_now - price_prev) / price_prev
-
-        if change <= -buy_threshold and balance > 0:
-            position = balance / price_now
-            balance = 0
-            trades.append(("BUY", price_now, df.loc[i, "time"]))
+    # 向量化：漲跌幅只算一次，全倉進出狀態機交給共用核心 (結果與逐根迴圈一致)
+    # position_size 仍不參與此模型 (全倉)，fee_rate 未設定時為 0
+    close = df["close"].to_numpy(dtype=np.float64)
+    change = pct_change(close)
+    final_value, fills, equity = run_all_in(close, change <= -buy_threshold, change >= sell_threshold,
+                                            initial_capital=10000, fee_rate=params.get("fee_rate", 0.0))
+    trades = [(side, price, df["time"].iloc[i]) for side, i, price in fills]
+    equity_curve = equity[1:].tolist()
 
-        elif change >= sell_threshold and position > 0:
-            balance = position * price_now
-            position = 0
-            trades.append(("SELL", price_now, df.loc[i, "time"]))
+    # Optuna 剪枝：於檢查點回報當下報酬率
+    if checkpoints is not None:
+        checkpoints.report_series(equity[1:] / 10000 - 1)
 
-        equity = balance + position * price_now
-        equity_curve.append(equity)
-
-    final_value = balance + position * df.iloc[-1]["close"]
     equity_curve.append(final_value)
 
     # ✅ Debug 訊息
@@ -68,25 +66,15 @@ def backtest(df, params):
     return final_value, trades, equity_curve
 
 def calc_metrics(equity_curve):
-    equity = np.array(equity_curve)
-    returns = np.diff(equity) / equity[:-1]
+    acc = MetricsAccumulator()
+    acc.update_many(equity_curve)
 
-    total_return = (equity[-1] / equity[0] - 1) * 100
-    running_max = np.maximum.accumulate(equity)
-    drawdowns = (equity - running_max) / running_max
-    max_drawdown = drawdowns.min() * 100
-    sharpe_ratio = np.mean(returns) / np.std(returns) * np.sqrt(252) if np.std(returns) > 0 else 0
+    total_return = acc.total_return * 100
+    max_drawdown = -acc.max_dd * 100
+    sharpe_ratio = acc.sharpe(periods_per_year=252, ddof=0)
 
     return total_return, max_drawdown, sharpe_ratio
 
-def is_pareto_efficient(points):
-    is_efficient = np.ones(points.shape[0], dtype=bool)
-    for i, c in enumerate(points):
-        if is_efficient[i]:
-            is_efficient[is_efficient] = np.any(points[is_efficient] > c, axis=1) | np.all(points[is_efficient] == c, axis=1)
-            is_efficient[i] = True
-    return is_efficient
-
 def plot_pareto(summary_df, pareto_df, best):
     plt.figure(figsize=(10,8))
     # 所有點
@@ -120,12 +108,14 @@ def main():
     print(f"共載入 {len(params_list)} 組參數，將計算 Pareto Front")
 
     summary = []
+    curves = {}
 
     for idx, params in enumerate(params_list, start=1):
         for symbol in DATA_FILES.keys():
             df = load_data(symbol)
             final_value, trades, equity_curve = backtest(df, params)
             total_return, max_drawdown, sharpe_ratio = calc_metrics(equity_curve)
+            curves[len(summary)] = equity_curve
 
             summary.append({
                 "param_set": idx,
@@ -140,22 +130,25 @@ def main():
 
     # 輸出總結表格
     summary_df = pd.DataFrame(summary)
+
+    # Monte Carlo：對每條權益曲線做 block bootstrap，附上悲觀端 (5% / 95% 分位) 指標
+    mc = robustness_many(curves, n_paths=MC_PATHS, periods_per_year=252, seed=0)
+    summary_df["mc_return_p5(%)"] = mc["pnl_p5"].to_numpy() / 10000 * 100
+    summary_df["mc_max_drawdown_p95(%)"] = -mc["max_drawdown_p95"].to_numpy() * 100
+    summary_df["mc_sharpe_p5"] = mc["sharpe_p5"].to_numpy()
     summary_df.to_csv(SUMMARY_FILE, index=False, encoding="utf-8-sig")
     print(f"\n✅ 已輸出完整績效矩陣到 {SUMMARY_FILE}")
 
-    # 構建 Pareto Front (Return 最大化、Drawdown 最小化)
-    points = summary_df[["total_return(%)", "max_drawdown(%)"]].to_numpy()
-    points[:,1] = -points[:,1]  # drawdown 越小越好 → 取負值
-    mask = is_pareto_efficient(points)
-    pareto_df = summary_df[mask]
+    # 構建 Pareto Front (Return 最大化、Drawdown 最小化；max_drawdown(%) 為負值，越接近 0 越好)
+    pareto_df = pareto_front(summary_df, {"total_return(%)": "maximize", "max_drawdown(%)": "maximize"})
 
     # 輸出 Pareto Front
     pareto_df.to_json(PARETO_FILE, orient="records", indent=4, force_ascii=False)
     print(f"\n🏆 已輸出 Pareto Front 到 {PARETO_FILE}")
-    print(pareto_df[["symbol","total_return(%)","max_drawdown(%)","sharpe_ratio","params"]])
+    print(pareto_df[["symbol","total_return(%)","max_drawdown(%)","sharpe_ratio","mc_sharpe_p5","params"]])
 
-    # 選出 Pareto Front 中 Sharpe Ratio 最高的作為最佳參數
-    best = pareto_df.sort_values(by="sharpe_ratio", ascending=False).iloc[0]
+    # 選出 Pareto Front 中 Monte Carlo Sharpe 5% 分位最高的作為最佳參數 (不只看單一歷史路徑)
+    best = pareto_df.sort_values(by="mc_sharpe_p5", ascending=False).iloc[0]
     best_params = best["params"]
     best_params["symbol"] = best["symbol"]
 
@@ -166,7 +159,7 @@ def main():
     with open(BEST_PARAM_FILE, "w", encoding="utf-8") as f:
         json.dump(best_params, f, indent=4, ensure_ascii=False)
 
-    print(f"\n✅ 已將 Pareto Front 中 Sharpe 最高的參數更新到 {BEST_PARAM_FILE}")
+    print(f"\n✅ 已將 Pareto Front 中 MC Sharpe (5% 分位) 最高的參數更新到 {BEST_PARAM_FILE}")
     print("=== Backtest 結束 ===")
     import optuna
 
@@ -1,11 +1,16 @@
 import os
 import requests
 import pandas as pd
-import time
 import optuna
 from datetime import datetime
 import matplotlib.pyplot as plt
 import platform
+import sys
+
+from momentum_kernel import run_scaled
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from kline_downloader import download_range
 
 # 🔑 自動偵測系統字型（確保中文正常顯示）
 system = platform.system()
@@ -29,35 +34,13 @@ def get_top_volume_symbols(limit=10):
 
 # ========== 抓取歷史K線 ==========
 def get_binance_klines(symbol, interval="1h", start="2022-01-01", end="2025-08-31", base_dir="D:/crypto_data"):
-    url = "https://api.binance.com/api/v3/klines"
     folder = os.path.join(base_dir, symbol)
     os.makedirs(folder, exist_ok=True)
     filename = os.path.join(folder, f"{symbol}_{interval}_{start}_to_{end}.csv")
 
-    start_ts = int(pd.Timestamp(start).timestamp() * 1000)
-    end_ts = int(pd.Timestamp(end).timestamp() * 1000)
-    all_data = []
-    limit = 1000
-
-    while True:
-        params = {"symbol": symbol, "interval": interval, "startTime": start_ts, "endTime": end_ts, "limit": limit}
-        resp = requests.get(url, params=params)
-        data = resp.json()
-        if not data:
-            break
-        all_data.extend(data)
-        last_time = data[-1][0]
-        start_ts = last_time + 1
-        time.sleep(0.5)
-        if start_ts > end_ts:
-            break
-
-    df = pd.DataFrame(all_data, columns=[
-        "timestamp","open","high","low","close","volume",
-        "close_time","quote_asset_volume","trades","taker_base_vol","taker_quote_vol","ignore"
-    ])
+    # 分段並行下載進本地 OHLCV store (中斷後重跑只補缺少的分段)，CSV 為輸出副本
+    df = download_range(symbol, interval, start, end)
     df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-    df[["open","high","low","close","volume"]] = df[["open","high","low","close","volume"]].astype(float)
     df.to_csv(filename, index=False)
     return df
 
@@ -72,15 +55,9 @@ def backtest(df, buy_threshold, sell_threshold, position_size, fee_rate=0.001):
     """
     fee_rate: 交易費用比例 (例如 0.001 = 0.1%)
     """
-    capital = 10000
-    for i in range(1, len(df)):
-        change = (df["close"].iloc[i] - df["close"].iloc[i-1]) / df["close"].iloc[i-1]
-        if change > buy_threshold:
-            capital *= (1 + position_size * change)
-            capital *= (1 - fee_rate)  # 扣除手續費
-        elif change < -sell_threshold:
-            capital *= (1 - position_size * abs(change))
-            capital *= (1 - fee_rate)  # 扣除手續費
+    # 向量化連乘 (與逐根迴圈結果一致)，每次觸發扣一次手續費
+    capital, _, _ = run_scaled(df["close"].to_numpy(dtype=float), buy_threshold, sell_threshold,
+                               position_size, fee_rate=fee_rate, initial_capital=10000)
     return capital
 
 # ========== Optuna 目標函數（跨幣種） ==========
@@ -175,7 +152,6 @@ if __name__ == "__main__":
     import os
 import requests
 import pandas as pd
-import time
 import optuna
 from datetime import datetime
 import matplotlib.pyplot as plt
@@ -203,35 +179,13 @@ def get_top_volume_symbols(limit=10):
 
 # ========== 抓取歷史K線 ==========
 def get_binance_klines(symbol, interval="1h", start="2022-01-01", end="2025-08-31", base_dir="D:/crypto_data"):
-    url = "https://api.binance.com/api/v3/klines"
     folder = os.path.join(base_dir, symbol)
     os.makedirs(folder, exist_ok=True)
     filename = os.path.join(folder, f"{symbol}_{interval}_{start}_to_{end}.csv")
 
-    start_ts = int(pd.Timestamp(start).timestamp() * 1000)
-    end_ts = int(pd.Timestamp(end).timestamp() * 1000)
-    all_data = []
-    limit = 1000
-
-    while True:
-        params = {"symbol": symbol, "interval": interval, "startTime": start_ts, "endTime": end_ts, "limit": limit}
-        resp = requests.get(url, params=params)
-        data = resp.json()
-        if not data:
-            break
-        all_data.extend(data)
-        last_time = data[-1][0]
-        start_ts = last_time + 1
-        time.sleep(0.5)
-        if start_ts > end_ts:
-            break
-
-    df = pd.DataFrame(all_data, columns=[
-        "timestamp","open","high","low","close","volume",
-        "close_time","quote_asset_volume","trades","taker_base_vol","taker_quote_vol","ignore"
-    ])
+    # 分段並行下載進本地 OHLCV store (中斷後重跑只補缺少的分段)，CSV 為輸出副本
+    df = download_range(symbol, interval, start, end)
     df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-    df[["open","high","low","close","volume"]] = df[["open","high","low","close","volume"]].astype(float)
     df.to_csv(filename, index=False)
     return df
 
@@ -246,15 +200,9 @@ def backtest(df, buy_threshold, sell_threshold, position_size, fee_rate=0.001):
     """
     fee_rate: 交易費用比例 (例如 0.001 = 0.1%)
     """
-    capital = 10000
-    for i in range(1, len(df)):
-        change = (df["close"].iloc[i] - df["close"].iloc[i-1]) / df["close"].iloc[i-1]
-        if change > buy_threshold:
-            capital *= (1 + position_size * change)
-            capital *= (1 - fee_rate)  # 扣除手續費
-        elif change < -sell_threshold:
-            capital *= (1 - position_size * abs(change))
-            capital *= (1 - fee_rate)  # 扣除手續費
+    # 向量化連乘 (與逐根迴圈結果一致)，每次觸發扣一次手續費
+    capital, _, _ = run_scaled(df["close"].to_numpy(dtype=float), buy_threshold, sell_threshold,
+                               position_size, fee_rate=fee_rate, initial_capital=10000)
     return capital
 
 # ========== Optuna 目標函數（跨幣種） ==========
@@ -0,0 +1,205 @@
+# momentum_kernel.py
+"""
+research/ 內各門檻動能回測共用的向量化核心
+
+- pct_change(close): 漲跌幅序列 (第 0 根為 NaN)，只算一次
+- run_all_in(close, buy, sell, ...): 單一部位全倉進出 (空手遇 buy 進場、持倉遇 sell 出場)
+  狀態機化為交替事件 (第一個 buy、其後第一個 sell、下一個 buy...)，只對成交筆數迴圈
+- run_all_in_2d(close, buy, sell, ...): 同一條價格上 k 組 (n, k) 訊號一次模擬，
+  成交事件以 2-D 前向填補找出，只對「第幾筆成交」迴圈 (各欄同時處理)，逐欄結果與 run_all_in 相同
+- run_scaled(close, buy_th, sell_th, position_size, ...): 依漲跌幅按比例放大/縮小資金，
+  為連乘，以 np.multiply.accumulate 依原順序累乘
+
+運算順序與原本逐根迴圈相同，預設參數下結果逐位元一致。
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+Trade = Tuple[str, int, float]
+
+
+def pct_change(close) -> np.ndarray:
+    close = np.asarray(close, dtype=np.float64)
+    change = np.full(close.shape[0], np.nan)
+    if close.shape[0] > 1:
+        change[1:] = (close[1:] - close[:-1]) / close[:-1]
+    return change
+
+
+def _alternating_events(buy: np.ndarray, sell: np.ndarray) -> np.ndarray:
+    """全倉狀態機的成交 bar 索引；偶數位置為進場、奇數位置為出場"""
+    both = buy & sell
+    if not both.any():
+        idx = np.flatnonzero(buy | sell)
+        s = buy[idx]
+        keep = np.ones(len(s), dtype=bool)
+        keep[1:] = s[1:] != s[:-1]
+        idx, s = idx[keep], s[keep]
+        if len(s) and not s[0]:
+            idx = idx[1:]
+        return idx
+    # 同一根同時有 buy / sell 時必定翻轉狀態 (空手→進場、持倉→出場)，改逐事件判斷
+    events = []
+    holding = False
+    for i in np.flatnonzero(buy | sell):
+        if (not holding and buy[i]) or (holding and sell[i]):
+            events.append(i)
+            holding = not holding
+    return np.asarray(events, dtype=np.int64)
+
+
+def _forward_fill(n: int, idx: np.ndarray, values: np.ndarray, initial: float) -> np.ndarray:
+    out = np.full(n, initial, dtype=np.float64)
+    last = np.searchsorted(idx, np.arange(n), side="right") - 1
+    hit = last >= 0
+    out[hit] = values[last[hit]]
+    return out
+
+
+def run_all_in(close, buy, sell, initial_capital: float = 10000.0, fee_rate: float = 0.0,
+               position_size: float = 1.0,
+               valid: Optional[np.ndarray] = None) -> Tuple[float, List[Trade], np.ndarray]:
+    """
+    回傳 (final_value, trades, equity)
+    trades: [("BUY"/"SELL", bar 索引, 成交價), ...]；equity[i] = 現金 + 持倉 * close[i]
+    進場投入現金的 position_size 比例，買賣各扣一次 fee_rate。
+    valid: 無效 bar 不成交；最後一根無效時未平倉部位不計價。
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n = close.shape[0]
+    buy = np.asarray(buy, dtype=bool)
+    sell = np.asarray(sell, dtype=bool)
+    if valid is not None:
+        buy = buy & valid
+        sell = sell & valid
+    idx = _alternating_events(buy, sell)
+
+    cash_after = np.empty(len(idx), dtype=np.float64)
+    pos_after = np.empty(len(idx), dtype=np.float64)
+    cash = initial_capital
+    position = 0.0
+    trades: List[Trade] = []
+    for j, i in enumerate(idx):
+        price = close[i]
+        if j % 2 == 0:
+            invest = cash * position_size
+            position = invest * (1 - fee_rate) / price
+            cash = cash - invest
+            trades.append(("BUY", int(i), price))
+        else:
+            cash = cash + position * price * (1 - fee_rate)
+            position = 0.0
+            trades.append(("SELL", int(i), price))
+        cash_after[j] = cash
+        pos_after[j] = position
+
+    cash_bar = _forward_fill(n, idx, cash_after, initial_capital)
+    pos_bar = _forward_fill(n, idx, pos_after, 0.0)
+    equity = cash_bar + pos_bar * close
+
+    if n == 0:
+        return initial_capital, trades, equity
+    if valid is not None and not valid[-1]:
+        final_value = cash
+    else:
+        final_value = cash + position * close[-1]
+    return final_value, trades, equity
+
+
+def _alternating_events_2d(buy: np.ndarray, sell: np.ndarray) -> np.ndarray:
+    """(n, k) 成交遮罩：事件的買賣方向與同欄前一個事件不同才成交 (空手視為前一個事件是賣出)"""
+    n = buy.shape[0]
+    event = buy | sell
+    last = np.maximum.accumulate(np.where(event, np.arange(n)[:, None], -1), axis=0)
+    prev = np.full_like(last, -1)
+    prev[1:] = last[:-1]
+    prev_buy = np.take_along_axis(buy, np.maximum(prev, 0), axis=0) & (prev >= 0)
+    executed = event & (buy != prev_buy)
+    # 同一根同時有 buy / sell 的欄位退回逐事件判斷
+    for j in np.flatnonzero((buy & sell).any(axis=0)):
+        executed[:, j] = False
+        executed[_alternating_events(buy[:, j], sell[:, j]), j] = True
+    return executed
+
+
+def run_all_in_2d(close, buy, sell, initial_capital: float = 10000.0, fee_rate: float = 0.0,
+                  position_size: float = 1.0,
+                  valid: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    close: (n,)；buy / sell: (n, k)，每欄一組訊號。
+    回傳 (final_value (k,), 成交筆數 (k,), equity (n, k))，規則與 run_all_in 相同。
+    """
+    close = np.asarray(close, dtype=np.float64)
+    buy = np.asarray(buy, dtype=bool)
+    sell = np.asarray(sell, dtype=bool)
+    n, k = buy.shape
+    if valid is not None:
+        buy = buy & valid[:, None]
+        sell = sell & valid[:, None]
+    executed = _alternating_events_2d(buy, sell)
+
+    # 依欄、再依時間排列的成交事件；rank = 該欄第幾筆 (偶數進場、奇數出場)
+    cols, rows = np.nonzero(executed.T)
+    counts = np.bincount(cols, minlength=k)
+    rank = np.arange(len(cols)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    cash = np.full(k, float(initial_capital))
+    position = np.zeros(k)
+    cash_after = np.empty(len(cols))
+    pos_after = np.empty(len(cols))
+    for r in range(int(counts.max()) if k and len(cols) else 0):
+        sel = np.flatnonzero(rank == r)
+        c, price = cols[sel], close[rows[sel]]
+        if r % 2 == 0:
+            invest = cash[c] * position_size
+            position[c] = invest * (1 - fee_rate) / price
+            cash[c] = cash[c] - invest
+        else:
+            cash[c] = cash[c] + position[c] * price * (1 - fee_rate)
+            position[c] = 0.0
+        cash_after[sel] = cash[c]
+        pos_after[sel] = position[c]
+
+    # 成交後的現金 / 持倉沿時間前向填補
+    slot = np.full((n, k), -1, dtype=np.int64)
+    slot[rows, cols] = np.arange(len(cols))
+    slot = np.maximum.accumulate(slot, axis=0)
+    hit = slot >= 0
+    cash_bar = np.where(hit, cash_after[slot], initial_capital) if len(cols) else np.full((n, k), float(initial_capital))
+    pos_bar = np.where(hit, pos_after[slot], 0.0) if len(cols) else np.zeros((n, k))
+    equity = cash_bar + pos_bar * close[:, None]
+
+    if n == 0 or (valid is not None and not valid[-1]):
+        final_value = cash
+    else:
+        final_value = cash + position * close[-1]
+    return final_value, counts, equity
+
+
+def run_scaled(close, buy_threshold: float, sell_threshold: float, position_size: float,
+               fee_rate: float = 0.001,
+               initial_capital: float = 10000.0) -> Tuple[float, List[Trade], np.ndarray]:
+    """
+    漲幅 > buy_threshold: capital *= 1 + position_size * change
+    跌幅 > sell_threshold: capital *= 1 - position_size * |change|
+    每次觸發再乘 (1 - fee_rate)。回傳 (final_value, trades, equity)
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n = close.shape[0]
+    change = pct_change(close)
+    up = change > buy_threshold
+    down = ~up & (change < -sell_threshold)
+    idx = np.flatnonzero(up | down)
+
+    factors = np.empty(2 * len(idx) + 1, dtype=np.float64)
+    factors[0] = initial_capital
+    c = change[idx]
+    factors[1::2] = np.where(up[idx], 1 + position_size * c, 1 - position_size * np.abs(c))
+    factors[2::2] = 1 - fee_rate
+    capital = np.multiply.accumulate(factors)[2::2]
+
+    trades = [("BUY" if up[i] else "SELL", int(i), close[i]) for i in idx]
+    equity = _forward_fill(n, idx, capital, initial_capital)
+    final_value = capital[-1] if len(capital) else initial_capital
+    return final_value, trades, equity
@@ -1,13 +1,22 @@
-import ccxt
+import sys
+from pathlib import Path
 import pandas as pd
 import pandas_ta as ta
 import optuna
 import itertools
 import os
 import matplotlib.pyplot as plt
-import numpy as np
 from datetime import datetime
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from exchange_registry import get_exchange
+from functools import partial
+from parallel_optuna import run_parallel
+from pareto import study_front
+from td_sequential import SETUP_LENGTH, td_frame
+from perf_metrics import MetricsAccumulator
+from feature_store import default_store
+
 # === 1. 幣種與週期 ===
 symbols = ["BTC/USDT", "ETH/USDT", "SOL/USDT", "BNB/USDT", "XRP/USDT"]
 timeframes = ["15m", "1h", "4h", "1d"]
@@ -17,14 +26,29 @@ strategy_combos = ["+".join(c) for c in itertools.combinations(strategies, 2)]
 
 # === 2. 抓取幣安歷史資料 ===
 def fetch_data(symbol="BTC/USDT", timeframe="1h", limit=500):
-    exchange = ccxt.binance()
+    exchange = get_exchange("binance")
     ohlcv = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
     df = pd.DataFrame(ohlcv, columns=["timestamp","open","high","low","close","volume"])
     df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
     return df
 
 # === 3. 技術指標計算 ===
+OHLCV_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+INDICATOR_COLUMNS = ["macd", "macd_signal", "macd_hist", "bb_lower", "bb_middle", "bb_upper", "td9_buy", "td9_sell"]
+
+def with_features(symbol, timeframe, df, store=None):
+    """併上特徵庫的指標欄位 (RSI 為整段週期範圍)，之後 add_indicators 只需依 rsi_period 挑欄"""
+    features = (store or default_store()).sync(symbol, timeframe, df)
+    features["td9_buy"] = features["td_buy_setup"] >= SETUP_LENGTH
+    features["td9_sell"] = features["td_sell_setup"] >= SETUP_LENGTH
+    return pd.concat([df, features], axis=1)
+
 def add_indicators(df, rsi_period=14):
+    if f"rsi_{rsi_period}" in df.columns:
+        # 已由 with_features 併上：不重算，只留策略用到的欄位
+        out = df[OHLCV_COLUMNS + INDICATOR_COLUMNS].copy()
+        out["rsi"] = df[f"rsi_{rsi_period}"]
+        return out
     df["rsi"] = ta.rsi(df["close"], length=rsi_period)
     macd = ta.macd(df["close"], fast=12, slow=26, signal=9)
     df["macd"], df["macd_signal"], df["macd_hist"] = macd["MACD_12_26_9"], macd["MACDs_12_26_9"], macd["MACDh_12_26_9"]
@@ -35,8 +59,9 @@ def add_indicators(df, rsi_period=14):
         df["bb_middle"] = bb.iloc[:,1]
         df["bb_upper"]  = bb.iloc[:,2]
 
-    df["td9_buy"] = (df["close"] < df["close"].shift(1)).rolling(9).sum() == 9
-    df["td9_sell"] = (df["close"] > df["close"].shift(1)).rolling(9).sum() == 9
+    td = td_frame(df)
+    df["td9_buy"] = td["td_buy_setup"] >= SETUP_LENGTH
+    df["td9_sell"] = td["td_sell_setup"] >= SETUP_LENGTH
     return df
 
 # === 4. 策略模擬 + 績效指標 ===
@@ -44,10 +69,8 @@ def run_strategy(df, strategy_combo, params):
     df = add_indicators(df, rsi_period=params["rsi_period"])
     capital = 1000
     position = 0
-    trades = []
-    equity_curve = []
+    metrics = MetricsAccumulator()
     entry_time = None
-    holding_times = []
 
     max_holding_hours = params.get("max_holding_hours", 1e9)
 
@@ -84,8 +107,7 @@ def run_strategy(df, strategy_combo, params):
             holding_hours = (row["timestamp"] - entry_time).total_seconds() / 3600
             if holding_hours >= max_holding_hours:
                 capital = position * row["close"]
-                trades.append((entry_price, row["close"]))
-                holding_times.append(holding_hours)
+                metrics.add_trade(row["close"] - entry_price, holding_hours)
                 position = 0
                 entry_time = None
 
@@ -97,43 +119,42 @@ def run_strategy(df, strategy_combo, params):
 
         elif signal == "sell" and position > 0:
             capital = position * row["close"]
-            trades.append((entry_price, row["close"]))
-            if entry_time is not None:
-                holding_times.append((row["timestamp"] - entry_time).total_seconds()/3600)
+            holding = (row["timestamp"] - entry_time).total_seconds()/3600 if entry_time is not None else None
+            metrics.add_trade(row["close"] - entry_price, holding)
             position = 0
             entry_time = None
 
-        equity_curve.append(capital + position * row["close"])
+        metrics.update(capital + position * row["close"])
 
     if position > 0:
         capital = position * df.iloc[-1]["close"]
 
     final_capital = capital
-    equity_curve = np.array(equity_curve)
-
-    returns = np.diff(equity_curve) / equity_curve[:-1] if len(equity_curve) > 1 else np.array([0])
-    sharpe = (returns.mean() / returns.std()) * np.sqrt(252) if returns.std() > 0 else 0
-    max_dd = np.max(np.maximum.accumulate(equity_curve) - equity_curve)
-    max_dd_pct = max_dd / np.max(np.maximum.accumulate(equity_curve)) if len(equity_curve) > 0 else 0
-    win_rate = sum(1 for e, x in trades if x > e) / len(trades) if trades else 0
-
-    profits = [x-e for e,x in trades if x>e]
-    losses  = [e-x for e,x in trades if x<e]
-    profit_factor = (sum(profits) / abs(sum(losses))) if losses else float('inf')
-
-    avg_holding_time = np.mean(holding_times) if holding_times else 0
+    max_dd_pct = metrics.max_dd_abs / metrics.peak if metrics.n > 0 else 0
 
     return {
         "final_capital": final_capital,
         "return_pct": final_capital / 1000 - 1,
-        "sharpe": sharpe,
+        "sharpe": metrics.sharpe(periods_per_year=252, ddof=0),
         "max_drawdown_pct": max_dd_pct,
-        "win_rate": win_rate,
-        "profit_factor": profit_factor,
-        "avg_holding_time_h": avg_holding_time
+        "win_rate": metrics.win_rate,
+        "profit_factor": metrics.profit_factor,
+        "avg_holding_time_h": metrics.avg_holding
     }
 
 # === 5. Optuna 目標函數 (多目標) ===
+# run_parallel worker 啟動時注入 { (symbol, timeframe): df }；未注入時每個 trial 自行抓取
+_FRAMES = None
+
+def attach_frames(frames):
+    global _FRAMES
+    _FRAMES = frames
+
+def _get_frame(sym, timeframe, limit=500):
+    if _FRAMES is not None and (sym, timeframe) in _FRAMES:
+        return _FRAMES[(sym, timeframe)].copy()
+    return fetch_data(sym, timeframe=timeframe, limit=limit)
+
 def objective(trial, timeframe, symbols):
     strategy_combo = trial.suggest_categorical("strategy_combo", strategy_combos)
     rsi_period = trial.suggest_int("rsi_period", 7, 21)
@@ -143,7 +164,7 @@ def objective(trial, timeframe, symbols):
 
     total_metrics = {"final_capital":0,"return_pct":0,"sharpe":0,"max_drawdown_pct":0,"win_rate":0,"profit_factor":0,"avg_holding_time_h":0}
     for sym in symbols:
-        df = fetch_data(sym, timeframe=timeframe, limit=500)
+        df = _get_frame(sym, timeframe, limit=500)
         metrics = run_strategy(df, strategy_combo, {
             "rsi_period": rsi_period,
             "rsi_buy": rsi_buy,
@@ -162,59 +183,6 @@ def objective(trial, timeframe, symbols):
         -avg_metrics["avg_holding_time_h"]
     )
 
-# === 6. 主程式 ===
-results = []
-for tf in timeframes:
-    study_name = f"multi_strategy_multiobj_{tf}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    study = optuna.create_study(
-        study_name=study_name,
-        directions=["maximize", "maximize", "minimize"],
-        storage="sqlite:///D:/crypto_data/optuna_study.db",
-        load_if_exists=False
-    )
-    study.optimize(lambda trial: objective(trial, tf, symbols), n_trials=30)
-
-    pareto_trials = study.best_trials
-    for t in pareto_trials:
-        results.append({
-            "timeframe": tf,
-                        "strategy_combo": t.params["strategy_combo"],
-            "rsi_period": t.params["rsi_period"],
-            "rsi_buy": t.params["rsi_buy"],
-            "rsi_sell": t.params["rsi_sell"],
-            "dca_interval": t.params["dca_interval"],
-            "final_capital": t.values[0],
-            "profit_factor": t.values[1],
-            "avg_holding_time_h": -t.values[2]  # 還原正值
-        })
-
-# === 7. 輸出結果 ===
-df_results = pd.DataFrame(results)
-out_path = f"D:/crypto_data/results/multi_asset_multi_timeframe_results_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.csv"
-os.makedirs(os.path.dirname(out_path), exist_ok=True)
-df_results.to_csv(out_path, index=False, encoding="utf-8-sig")
-
-print("✅ 多幣種 × 多週期最佳策略表已輸出:", out_path)
-print(df_results)
-
-# === 8. 畫圖 ===
-plt.figure(figsize=(8,5))
-plt.bar(df_results["timeframe"], df_results["final_capital"], color="skyblue")
-plt.title("不同週期最佳策略績效比較 (多幣種平均, 強制平倉版)")
-plt.xlabel("Timeframe")
-plt.ylabel("Final Capital")
-
-for i, v in enumerate(df_results["final_capital"]):
-    plt.text(i, v+5, f"{v:.1f}", ha="center", fontsize=9)
-
-plot_path = "D:/crypto_data/plots/multi_asset_multi_timeframe_performance.png"
-os.makedirs(os.path.dirname(plot_path), exist_ok=True)
-plt.savefig(plot_path, dpi=150)
-plt.close()
-
-print("📊 圖表已輸出:", plot_path)
-
-
 # === 9. 自動清理舊 study 工具 ===
 def cleanup_old_studies(storage_url="sqlite:///D:/crypto_data/optuna_study.db", keep_recent=5, core_studies=None):
     """
@@ -241,5 +209,65 @@ def cleanup_old_studies(storage_url="sqlite:///D:/crypto_data/optuna_study.db",
             storage.delete_study(study_id=s._study_id)
 
 
-# ✅ 執行清理：保留核心 + 最近 5 個探索 study
-cleanup_old_studies(keep_recent=5, core_studies=["core_strategy_1h"])
\ No newline at end of file
+# === 6. 主程式 ===
+if __name__ == "__main__":
+    results = []
+    # 所有 幣種 × 週期 的 K 線只抓一次，以 memmap 共享給各 worker 行程
+    # 指標由特徵庫整段算好 (只補新 K 線)，trial 內不再重算
+    frames = {(sym, tf): with_features(sym, tf, fetch_data(sym, timeframe=tf, limit=500))
+              for tf in timeframes for sym in symbols}
+    for tf in timeframes:
+        # 同一天重跑時接續同名 study，只補足未完成的 trial
+        study_name = f"multi_strategy_multiobj_{tf}_{datetime.now().strftime('%Y%m%d')}"
+        study = run_parallel(
+            partial(objective, timeframe=tf, symbols=symbols),
+            study_name=study_name,
+            storage="sqlite:///D:/crypto_data/optuna_study.db",
+            n_trials=30,
+            directions=["maximize", "maximize", "minimize"],
+            shared={k: v for k, v in frames.items() if k[1] == tf},
+            setup=attach_frames,
+        )
+
+        pareto_trials = study_front(study)
+        for t in pareto_trials:
+            results.append({
+                "timeframe": tf,
+                            "strategy_combo": t.params["strategy_combo"],
+                "rsi_period": t.params["rsi_period"],
+                "rsi_buy": t.params["rsi_buy"],
+                "rsi_sell": t.params["rsi_sell"],
+                "dca_interval": t.params["dca_interval"],
+                "final_capital": t.values[0],
+                "profit_factor": t.values[1],
+                "avg_holding_time_h": -t.values[2]  # 還原正值
+            })
+
+    # === 7. 輸出結果 ===
+    df_results = pd.DataFrame(results)
+    out_path = f"D:/crypto_data/results/multi_asset_multi_timeframe_results_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.csv"
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    df_results.to_csv(out_path, index=False, encoding="utf-8-sig")
+
+    print("✅ 多幣種 × 多週期最佳策略表已輸出:", out_path)
+    print(df_results)
+
+    # === 8. 畫圖 ===
+    plt.figure(figsize=(8,5))
+    plt.bar(df_results["timeframe"], df_results["final_capital"], color="skyblue")
+    plt.title("不同週期最佳策略績效比較 (多幣種平均, 強制平倉版)")
+    plt.xlabel("Timeframe")
+    plt.ylabel("Final Capital")
+
+    for i, v in enumerate(df_results["final_capital"]):
+        plt.text(i, v+5, f"{v:.1f}", ha="center", fontsize=9)
+
+    plot_path = "D:/crypto_data/plots/multi_asset_multi_timeframe_performance.png"
+    os.makedirs(os.path.dirname(plot_path), exist_ok=True)
+    plt.savefig(plot_path, dpi=150)
+    plt.close()
+
+    print("📊 圖表已輸出:", plot_path)
+
+    # ✅ 執行清理：保留核心 + 最近 5 個探索 study
+    cleanup_old_studies(keep_recent=5, core_studies=["core_strategy_1h"])
\ No newline at end of file
@@ -1,12 +1,20 @@
+import argparse
 import os
+import sys
 import requests
-import optuna
 import pandas as pd
-import pandas_ta as ta
 import numpy as np
 from datetime import datetime
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parallel_optuna import run_parallel
+from momentum_kernel import run_all_in, run_all_in_2d
+from perf_metrics import batch_metrics
+from td_sequential import COUNTDOWN_LENGTH, td_frame
+from indicator_cache import CACHE, cached_ta, fingerprint
+from feature_store import default_store
+
 # === 基本設定 ===
 base_dir = "D:/crypto_data"
 os.makedirs(os.path.join(base_dir, "klines"), exist_ok=True)
@@ -33,11 +41,12 @@ def get_binance_klines(symbol, interval=INTERVAL, limit=LIMIT, base_dir=None):
     # 型別轉換
     for col in ["open","high","low","close","volume"]:
         df[col] = df[col].astype(float)
+    df["timestamp"] = df["open_time"].astype("int64")
     # 可選：存檔到本地
     if base_dir:
         path = os.path.join(base_dir, f"{symbol}_{interval}.csv")
         df.to_csv(path, index=False)
-    return df[["open","high","low","close","volume"]]
+    return df[["timestamp","open","high","low","close","volume"]]
 
 # === 切分訓練/測試集 ===
 def split_train_test(df, ratio=0.8):
@@ -70,24 +79,24 @@ def pick_col(prefix_list, columns):
                 return c
     return None
 
-# === 策略執行 ===
-def run_strategy_combo(strategy_combo, df, params):
-    # 防呆：資料不足直接回傳初始資金
-    if df is None or len(df) < MIN_BARS:
-        return INITIAL_CAPITAL
-
+# === 指標（與交易參數無關，可整段算一次後切片重用；經 indicator_cache，同一段資料各指標只算一次） ===
+def compute_indicators(df, rsi_periods=(14,)):
+    """回傳含 rsi_{n} / macd / macdsignal / upper / lower / td_seq / td_sell_seq / slowk / slowd 欄位的副本"""
     df = df.copy()
     close = df["close"]
+    fp = fingerprint(close)
+    fp_hlc = fingerprint(df["high"], df["low"], close)
 
-    # RSI
-    try:
-        df["rsi"] = ta.rsi(close, length=params.get("rsi_period", 14))
-    except Exception:
-        df["rsi"] = np.nan
+    # RSI（每個週期一欄）
+    for n in rsi_periods:
+        try:
+            df[f"rsi_{n}"] = cached_ta("rsi", close, fp=fp, length=n)
+        except Exception:
+            df[f"rsi_{n}"] = np.nan
 
     # MACD（欄位名因版本可能不同，動態抓）
     try:
-        macd_df = ta.macd(close, fast=12, slow=26, signal=9)
+        macd_df = cached_ta("macd", close, fp=fp, fast=12, slow=26, signal=9)
         if macd_df is not None and not macd_df.empty:
             macd_col = pick_col(["MACD_"], macd_df.columns)       # MACD line
             macds_col = pick_col(["MACDs_"], macd_df.columns)     # signal line
@@ -102,7 +111,7 @@ def run_strategy_combo(strategy_combo, df, params):
 
     # BBANDS（欄位名動態抓）
     try:
-        bbands = ta.bbands(close, length=20, std=2)
+        bbands = cached_ta("bbands", close, fp=fp, length=20, std=2)
         if bbands is not None and not bbands.empty:
             upper_col = pick_col(["BBU_"], bbands.columns)
             lower_col = pick_col(["BBL_"], bbands.columns)
@@ -115,22 +124,18 @@ def run_strategy_combo(strategy_combo, df, params):
         df["upper"] = np.nan
         df["lower"] = np.nan
 
-    # TD13（簡化版，需最少資料才有意義）
+    # TD13：買進 / 賣出 countdown，達 13 即完成
     try:
-        df["td_seq"] = (df["close"] > df["close"].shift(4)).astype(int).rolling(13, min_periods=1).sum()
+        td = CACHE.get(fp_hlc, "td_frame", None, lambda: td_frame(df))
+        df["td_seq"] = td["td_buy_countdown"]
+        df["td_sell_seq"] = td["td_sell_countdown"]
     except Exception:
         df["td_seq"] = np.nan
-
-    # DCA（固定間隔）
-    try:
-        interval = max(1, int(params.get("dca_interval", 10)))
-        df["dca_signal"] = (np.arange(len(df)) % interval == 0)
-    except Exception:
-        df["dca_signal"] = False
+        df["td_sell_seq"] = np.nan
 
     # SKDJ（用 KD 近似，欄位名動態抓）
     try:
-        stoch = ta.stoch(df["high"], df["low"], df["close"])
+        stoch = cached_ta("stoch", df["high"], df["low"], close, fp=fp_hlc)
         if stoch is not None and not stoch.empty:
             slowk_col = pick_col(["STOCHk"], stoch.columns)
             slowd_col = pick_col(["STOCHd"], stoch.columns)
@@ -143,122 +148,211 @@ def run_strategy_combo(strategy_combo, df, params):
         df["slowk"] = np.nan
         df["slowd"] = np.nan
 
-    # === 組合判斷（對 NaN 做保護） ===
-    def nz(series):
-        # True/False 條件用，將 NaN 當 False
-        return series.fillna(False)
-
-    def lt(a, v):  # a < v with NaN→False
-        return (a < v).fillna(False)
-
-    def gt(a, v):  # a > v with NaN→False
-        return (a > v).fillna(False)
-
-    if strategy_combo == "RSI+MACD":
-        buy = nz(lt(df["rsi"], params["rsi_buy"]) & gt(df["macd"], df["macdsignal"]))
-        sell = nz(gt(df["rsi"], params["rsi_sell"]) & lt(df["macd"], df["macdsignal"]))
-
-    elif strategy_combo == "RSI+BBANDS":
-        buy = nz(lt(df["rsi"], params["rsi_buy"]) & lt(df["close"], df["lower"]))
-        sell = nz(gt(df["rsi"], params["rsi_sell"]) & gt(df["close"], df["upper"]))
-
-    elif strategy_combo == "RSI+TD13":
-        buy = nz(lt(df["rsi"], params["rsi_buy"]) & (df["td_seq"].fillna(0) >= 13))
-        sell = nz(gt(df["rsi"], params["rsi_sell"]) & (df["td_seq"].fillna(0) <= 0))
-
-    elif strategy_combo == "RSI+SKDJ":
-        buy = nz(lt(df["rsi"], params["rsi_buy"]) & gt(df["slowk"], df["slowd"]))
-        sell = nz(gt(df["rsi"], params["rsi_sell"]) & lt(df["slowk"], df["slowd"]))
-
-    elif strategy_combo == "RSI+DCA":
-        buy = nz(lt(df["rsi"], params["rsi_buy"]) & df["dca_signal"])
-        sell = nz(gt(df["rsi"], params["rsi_sell"]) & df["dca_signal"])
-
-    elif strategy_combo == "MACD+BBANDS":
-        buy = nz(gt(df["macd"], df["macdsignal"]) & lt(df["close"], df["lower"]))
-        sell = nz(lt(df["macd"], df["macdsignal"]) & gt(df["close"], df["upper"]))
-
-    elif strategy_combo == "MACD+TD13":
-        buy = nz(gt(df["macd"], df["macdsignal"]) & (df["td_seq"].fillna(0) >= 13))
-        sell = nz(lt(df["macd"], df["macdsignal"]) & (df["td_seq"].fillna(0) <= 0))
-
-    elif strategy_combo == "MACD+SKDJ":
-        buy = nz(gt(df["macd"], df["macdsignal"]) & gt(df["slowk"], df["slowd"]))
-        sell = nz(lt(df["macd"], df["macdsignal"]) & lt(df["slowk"], df["slowd"]))
-
-    elif strategy_combo == "MACD+DCA":
-        buy = nz(gt(df["macd"], df["macdsignal"]) & df["dca_signal"])
-        sell = nz(lt(df["macd"], df["macdsignal"]) & df["dca_signal"])
-
-    elif strategy_combo == "DCA+BBANDS":
-        buy = nz(df["dca_signal"] & lt(df["close"], df["lower"]))
-        sell = nz(df["dca_signal"] & gt(df["close"], df["upper"]))
+    return df
+
+# === 特徵庫（指標整段預先算好並存檔，trial 只依參數查欄位） ===
+INDICATOR_COLUMNS = ("macd", "macdsignal", "upper", "lower", "td_seq", "td_sell_seq", "slowk", "slowd")
+FEATURE_RENAME = {"macd_signal": "macdsignal", "bb_upper": "upper", "bb_lower": "lower",
+                  "td_buy_countdown": "td_seq", "td_sell_countdown": "td_sell_seq"}
+
+def with_features(symbol, timeframe, df, store=None):
+    """df (需含 timestamp) 併上特徵庫的指標欄位，欄名同 compute_indicators；rsi_{n} 涵蓋特徵庫的整段週期範圍"""
+    store = store or default_store()
+    features = store.sync(symbol, timeframe, df).rename(columns=FEATURE_RENAME)
+    return pd.concat([df, features], axis=1)
+
+def has_indicators(df, rsi_period):
+    return f"rsi_{rsi_period}" in df.columns and all(c in df.columns for c in INDICATOR_COLUMNS)
+
+# === 策略訊號 ===
+PRIMITIVES = ("RSI", "MACD", "BBANDS", "TD13", "SKDJ", "DCA")
+
+def _values(ind, col):
+    return ind[col].to_numpy(dtype=np.float64) if col in ind.columns else np.full(len(ind), np.nan)
+
+def primitive_signals(ind, params):
+    """
+    由 compute_indicators 的結果產生各基本訊號的 (buy, sell) 布林陣列 (NaN 視為 False)；
+    每個組合即兩個基本訊號的 AND，所有組合共用同一份
+    """
+    n = len(ind)
+    period = params.get("rsi_period", 14)
+    col = f"rsi_{period}"
+    if col in ind.columns:
+        rsi = _values(ind, col)
+    else:
+        try:
+            rsi = cached_ta("rsi", ind["close"], length=period).to_numpy(dtype=np.float64)
+        except Exception:
+            rsi = np.full(n, np.nan)
 
-    elif strategy_combo == "DCA+TD13":
-        buy = nz(df["dca_signal"] & (df["td_seq"].fillna(0) >= 13))
-        sell = nz(df["dca_signal"] & (df["td_seq"].fillna(0) <= 0))
+    # DCA（固定間隔，相對於傳入資料的第一根）
+    try:
+        interval = max(1, int(params.get("dca_interval", 10)))
+        dca = np.arange(n) % interval == 0
+    except Exception:
+        dca = np.zeros(n, dtype=bool)
+
+    close = _values(ind, "close")
+    macd, macdsignal = _values(ind, "macd"), _values(ind, "macdsignal")
+    slowk, slowd = _values(ind, "slowk"), _values(ind, "slowd")
+    td_seq, td_sell_seq = _values(ind, "td_seq"), _values(ind, "td_sell_seq")
+    return {
+        "RSI": (rsi < params["rsi_buy"], rsi > params["rsi_sell"]),
+        "MACD": (macd > macdsignal, macd < macdsignal),
+        "BBANDS": (close < _values(ind, "lower"), close > _values(ind, "upper")),
+        "TD13": (td_seq >= COUNTDOWN_LENGTH, td_sell_seq >= COUNTDOWN_LENGTH),
+        "SKDJ": (slowk > slowd, slowk < slowd),
+        "DCA": (dca, dca),
+    }
 
-    elif strategy_combo == "DCA+SKDJ":
-        buy = nz(df["dca_signal"] & gt(df["slowk"], df["slowd"]))
-        sell = nz(df["dca_signal"] & lt(df["slowk"], df["slowd"]))
+def _combo_arrays(strategy_combo, primitives, n):
+    parts = strategy_combo.split("+")
+    if not all(p in primitives for p in parts):
+        return np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)
+    buy = np.logical_and.reduce([primitives[p][0] for p in parts])
+    sell = np.logical_and.reduce([primitives[p][1] for p in parts])
+    return buy, sell
+
+def combo_masks(strategy_combo, ind, params):
+    """由 compute_indicators 的結果產生 (buy, sell) 布林序列"""
+    buy, sell = _combo_arrays(strategy_combo, primitive_signals(ind, params), len(ind))
+    return pd.Series(buy, index=ind.index), pd.Series(sell, index=ind.index)
+
+def combo_backtest(strategy_combo, ind, params):
+    """單次全倉進出；價格 <= 0 或 NaN 的 bar 不成交。回傳 (final_value, trades, equity)"""
+    buy, sell = combo_masks(strategy_combo, ind, params)
+    close = ind["close"].to_numpy(dtype=np.float64)
+    return run_all_in(close, buy.to_numpy(dtype=bool), sell.to_numpy(dtype=bool),
+                      initial_capital=float(INITIAL_CAPITAL), valid=close > 0)
+
+def evaluate_combos(ind, params, combos=None):
+    """
+    所有組合一次評估：基本訊號只算一次，(n, 組合數) 的訊號矩陣交給 run_all_in_2d 同時模擬。
+    回傳以組合為 index 的表：final_capital / trades / total_return / max_drawdown / sharpe
+    """
+    combos = list(combos or strategy_combos)
+    primitives = primitive_signals(ind, params)
+    masks = [_combo_arrays(c, primitives, len(ind)) for c in combos]
+    buy = np.column_stack([m[0] for m in masks])
+    sell = np.column_stack([m[1] for m in masks])
+    close = ind["close"].to_numpy(dtype=np.float64)
+    final, trades, equity = run_all_in_2d(close, buy, sell, initial_capital=float(INITIAL_CAPITAL), valid=close > 0)
+    metrics = batch_metrics(equity)
+    return pd.DataFrame({
+        "final_capital": final,
+        "trades": trades,
+        "total_return": metrics["total_return"],
+        "max_drawdown": metrics["max_drawdown"],
+        "sharpe": metrics["sharpe"],
+    }, index=pd.Index(combos, name="strategy_combo"))
 
-    elif strategy_combo == "BBANDS+TD13":
-        buy = nz(lt(df["close"], df["lower"]) & (df["td_seq"].fillna(0) >= 13))
-        sell = nz(gt(df["close"], df["upper"]) & (df["td_seq"].fillna(0) <= 0))
+# === 策略執行 ===
+def run_strategy_combo(strategy_combo, df, params):
+    # 防呆：資料不足直接回傳初始資金
+    if df is None or len(df) < MIN_BARS:
+        return INITIAL_CAPITAL
 
-    elif strategy_combo == "BBANDS+SKDJ":
-        buy = nz(lt(df["close"], df["lower"]) & gt(df["slowk"], df["slowd"]))
-        sell = nz(gt(df["close"], df["upper"]) & lt(df["slowk"], df["slowd"]))
+    capital, _, _ = combo_backtest(strategy_combo, strategy_indicators(df, params), params)
+    return float(capital)
 
-    elif strategy_combo == "TD13+SKDJ":
-        buy = nz((df["td_seq"].fillna(0) >= 13) & gt(df["slowk"], df["slowd"]))
-        sell = nz((df["td_seq"].fillna(0) <= 0) & lt(df["slowk"], df["slowd"]))
+def strategy_indicators(df, params):
+    period = params.get("rsi_period", 14)
+    return df if has_indicators(df, period) else compute_indicators(df, rsi_periods=(period,))
 
-    else:
-        buy = sell = pd.Series(False, index=df.index)
-
-    # === 簡單回測邏輯（單次全倉進出） ===
-    position = 0.0
-    capital = float(INITIAL_CAPITAL)
-    for i in range(len(df)):
-        price = df["close"].iloc[i]
-        if price <= 0 or np.isnan(price):
-            continue
-        if buy.iloc[i] and position == 0.0:
-            position = capital / price
-            capital = 0.0
-        elif sell.iloc[i] and position > 0.0:
-            capital = position * price
-            position = 0.0
-    if position > 0.0:
-        last_price = df["close"].iloc[-1]
-        if last_price > 0 and not np.isnan(last_price):
-            capital = position * last_price
-            position = 0.0
-
-    return float(capital)
+def run_all_combos(df, params):
+    """同一組參數下所有 strategy_combos 的績效表 (資料不足時回傳 None)"""
+    if df is None or len(df) < MIN_BARS:
+        return None
+    return evaluate_combos(strategy_indicators(df, params), params)
 
 # === Optuna 目標函數 ===
-def objective(trial, train_sets):
-    if not train_sets:
-        return 0.0
+RSI_PERIODS = tuple(range(7, 22))
+
+def suggest_params(trial):
     strategy_combo = trial.suggest_categorical("strategy_combo", strategy_combos)
     params = {
-        "rsi_period": trial.suggest_int("rsi_period", 7, 21),
+        "rsi_period": trial.suggest_int("rsi_period", RSI_PERIODS[0], RSI_PERIODS[-1]),
         "rsi_buy": trial.suggest_int("rsi_buy", 20, 40),
         "rsi_sell": trial.suggest_int("rsi_sell", 60, 80),
         "dca_interval": trial.suggest_int("dca_interval", 5, 30),
     }
+    return strategy_combo, params
+
+def objective(trial, train_sets):
+    if not train_sets:
+        return 0.0
+    strategy_combo, params = suggest_params(trial)
+    # 一次評估所有組合：回傳所選組合的平均資金，其餘組合的分數記在 user_attrs["combo_capital"]
     total_capital = 0.0
     valid_sets = 0
     for df in train_sets:
-        if df is None or len(df) < MIN_BARS:
+        table = run_all_combos(df, params)
+        if table is None:
             continue
-        total_capital += run_strategy_combo(strategy_combo, df, params)
+        total_capital = total_capital + table["final_capital"]
         valid_sets += 1
     if valid_sets == 0:
         return 0.0
-    return total_capital / valid_sets
+    avg = total_capital / valid_sets
+    trial.set_user_attr("combo_capital", {k: float(v) for k, v in avg.items()})
+    return float(avg[strategy_combo])
+
+# run_parallel worker 啟動時注入 (memmap 共享的訓練集)
+_TRAIN_SETS = []
+
+def attach_train_sets(frames):
+    global _TRAIN_SETS
+    _TRAIN_SETS = [frames[k] for k in sorted(frames)]
+
+def shared_objective(trial):
+    return objective(trial, _TRAIN_SETS)
+
+# === Walk-forward（指標整段算一次，各 fold 直接切片重用） ===
+def wf_indicators(df):
+    return compute_indicators(df, rsi_periods=RSI_PERIODS)
+
+def wf_objective(trial, train_ind):
+    strategy_combo, params = suggest_params(trial)
+    capital, _, _ = combo_backtest(strategy_combo, train_ind, params)
+    return float(capital)
+
+def wf_evaluate(params, test_ind):
+    _, _, equity = combo_backtest(params["strategy_combo"], test_ind, params)
+    return equity
+
+def load_klines_csv(path):
+    df = pd.read_csv(path)
+    time_col = next((c for c in ("timestamp", "time", "open_time") if c in df.columns), None)
+    if time_col is not None:
+        ts = df[time_col]
+        df.index = pd.to_datetime(ts, unit="ms") if pd.api.types.is_numeric_dtype(ts) else pd.to_datetime(ts)
+    return df[["open", "high", "low", "close", "volume"]].astype(float)
+
+def run_walk_forward(path, n_folds=12, n_trials=200, anchored=False, n_workers=None):
+    from walk_forward import walk_forward
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    df = load_klines_csv(path)
+    res = walk_forward(df, wf_objective, wf_evaluate, indicators=wf_indicators,
+                       n_folds=n_folds, anchored=anchored, n_trials=n_trials, n_workers=n_workers,
+                       initial=INITIAL_CAPITAL, study_name=f"wf_{name}")
+
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
+    summary_file = os.path.join(base_dir, "results", f"walk_forward_{name}_{timestamp}.csv")
+    res["summary"].to_csv(summary_file, index=False)
+    res["equity"].to_csv(os.path.join(base_dir, "results", f"walk_forward_equity_{name}_{timestamp}.csv"))
+    print(res["summary"].to_string(index=False))
+
+    plt.figure(figsize=(10, 5))
+    res["equity"].plot()
+    plt.title(f"Walk-forward OOS Equity ({name}, {len(res['folds'])} folds)")
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig(os.path.join(base_dir, "plots", f"walk_forward_{name}.png"))
+    plt.close()
+    print(f"✅ walk-forward 結果已輸出 → {summary_file}")
+    return res
 
 # === 合併結果 + 繪圖 ===
 def merge_and_plot(base_dir):
@@ -301,13 +395,19 @@ def merge_and_plot(base_dir):
 
 # === 主程式 ===
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--walk-forward", metavar="CSV", help="以本地 K 線 CSV 跑 walk-forward（不抓 Binance）")
+    parser.add_argument("--folds", type=int, default=12)
+    parser.add_argument("--trials", type=int, default=200, help="每個 fold 的 trial 數")
+    parser.add_argument("--anchored", action="store_true", help="訓練窗起點固定（預設為滾動窗）")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    if args.walk_forward:
+        run_walk_forward(args.walk_forward, n_folds=args.folds, n_trials=args.trials,
+                         anchored=args.anchored, n_workers=args.workers)
+        sys.exit(0)
+
     storage = f"sqlite:///{base_dir}/optuna_study.db"
-    study = optuna.create_study(
-        direction="maximize",
-        storage=storage,
-        study_name="multi_strategy",
-        load_if_exists=True
-    )
 
     symbols = get_top_volume_symbols(limit=50)
     train_sets, test_sets = [], {}
@@ -317,6 +417,7 @@ if __name__ == "__main__":
             if df is None or len(df) < MIN_BARS:
                 print(f"⚠️ {sym} 資料過短（{len(df)}），跳過")
                 continue
+            df = with_features(sym, INTERVAL, df)
             train_df, test_df = split_train_test(df)
             train_sets.append(train_df)
             test_sets[sym] = test_df
@@ -327,9 +428,18 @@ if __name__ == "__main__":
     if not train_sets:
         raise RuntimeError("❌ 沒有任何訓練資料，請檢查 API 或網路連線")
 
-    # 可先小跑，確認流程無誤後改大
-    # study.optimize(lambda trial: objective(trial, train_sets), n_trials=1000)
-    study.optimize(lambda trial: objective(trial, train_sets), n_trials=200)
+    # 可先小跑，確認流程無誤後改大 (n_trials=1000)
+    # 多行程共同跑 multi_strategy；同一晚中斷後重跑只補足本次剩餘的 trial
+    study = run_parallel(
+        shared_objective,
+        study_name="multi_strategy",
+        storage=storage,
+        n_trials=200,
+        direction="maximize",
+        run_id=datetime.now().strftime("%Y%m%d"),
+        shared=dict(enumerate(train_sets)),
+        setup=attach_train_sets,
+    )
 
     best_params = study.best_params
     print(f"\n🔥 跨幣種最佳參數: {best_params}")
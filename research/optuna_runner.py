@@ -1,7 +1,13 @@
 import optuna
 import json
+import sys
+from pathlib import Path
 from backtest import load_data, backtest, calc_metrics
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from optuna_pruning import Checkpoints, make_pruner
+from pareto import study_front
+
 # === Optuna 目標函式 ===
 def objective(trial):
     # 1. 定義參數搜尋空間
@@ -15,9 +21,11 @@ def objective(trial):
     symbols = ["BTCUSDT", "ETHUSDT", "BNBUSDT"]
     total_returns, max_drawdowns = [], []
 
-    for symbol in symbols:
+    for k, symbol in enumerate(symbols):
         df = load_data(symbol)
-        final_value, trades, equity_curve = backtest(df, params)
+        # 每個資產各自的檢查點區段；報酬明顯落後的參數組在第一個資產就會被剪掉
+        checkpoints = Checkpoints(trial, n_bars=len(df) - 1, segment=k)
+        final_value, trades, equity_curve = backtest(df, params, checkpoints=checkpoints)
         total_return, max_drawdown, sharpe_ratio = calc_metrics(equity_curve)
 
         total_returns.append(total_return)
@@ -33,16 +41,17 @@ def objective(trial):
 
 if __name__ == "__main__":
     # 建立多目標 study
-    study = optuna.create_study(directions=["maximize", "maximize"])
+    study = optuna.create_study(directions=["maximize", "maximize"], pruner=make_pruner(multi_objective=True))
     study.optimize(objective, n_trials=100)
 
     # 輸出 Pareto Front
     print("\n=== Pareto Front Trials ===")
-    for t in study.best_trials:
+    front = study_front(study)
+    for t in front:
         print(f"Values={t.values}, Params={t.params}")
 
     # 儲存最佳參數 (以第一個 Pareto 解為例)
-    best_params = study.best_trials[0].params
+    best_params = front[0].params
     with open("../configs/strategy_params.json", "w", encoding="utf-8") as f:
         json.dump(best_params, f, indent=4, ensure_ascii=False)
 
@@ -1,4 +1,5 @@
 import os
+import sys
 import requests
 import optuna
 import pandas as pd
@@ -6,6 +7,10 @@ import pandas_ta as ta
 import numpy as np
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from feature_store import default_store
+from momentum_kernel import run_all_in
+
 # === 基本設定 ===
 base_dir = "D:/crypto_data"
 os.makedirs(os.path.join(base_dir, "klines"), exist_ok=True)
@@ -24,31 +29,30 @@ def get_binance_klines(symbol, interval="1h", limit=500):
     df["low"] = df["low"].astype(float)
     df["close"] = df["close"].astype(float)
     df["volume"] = df["volume"].astype(float)
-    return df[["open","high","low","close","volume"]]
+    df["timestamp"] = df["open_time"].astype("int64")
+    return df[["timestamp","open","high","low","close","volume"]]
+
+# === 特徵庫：RSI 各週期 / MACD 整段預先算好，trial 只查欄位 ===
+def with_features(symbol, timeframe, df, store=None):
+    features = (store or default_store()).sync(symbol, timeframe, df)
+    return pd.concat([df, features], axis=1)
 
 # === 策略（RSI+MACD） ===
 def run_strategy_combo(df, params):
     close = df["close"]
-    df["rsi"] = ta.rsi(close, length=params.get("rsi_period", 14))
-    macd_df = ta.macd(close, fast=12, slow=26, signal=9)
-    df["macd"] = macd_df["MACD_12_26_9"]
-    df["macdsignal"] = macd_df["MACDs_12_26_9"]
-
-    buy = (df["rsi"] < params["rsi_buy"]) & (df["macd"] > df["macdsignal"])
-    sell = (df["rsi"] > params["rsi_sell"]) & (df["macd"] < df["macdsignal"])
+    period = params.get("rsi_period", 14)
+    if f"rsi_{period}" in df.columns and "macd_signal" in df.columns:
+        rsi, macd, macdsignal = df[f"rsi_{period}"], df["macd"], df["macd_signal"]
+    else:
+        rsi = ta.rsi(close, length=period)
+        macd_df = ta.macd(close, fast=12, slow=26, signal=9)
+        macd, macdsignal = macd_df["MACD_12_26_9"], macd_df["MACDs_12_26_9"]
 
-    position = 0
-    capital = 1000
-    for i in range(len(df)):
-        if buy.iloc[i] and position == 0:
-            position = capital / df["close"].iloc[i]
-            capital = 0
-        elif sell.iloc[i] and position > 0:
-            capital = position * df["close"].iloc[i]
-            position = 0
-    if position > 0:
-        capital = position * df["close"].iloc[-1]
+    buy = (rsi < params["rsi_buy"]) & (macd > macdsignal)
+    sell = (rsi > params["rsi_sell"]) & (macd < macdsignal)
 
+    capital, _, _ = run_all_in(close.to_numpy(dtype=np.float64), buy.to_numpy(dtype=bool),
+                               sell.to_numpy(dtype=bool), initial_capital=1000.0)
     return capital
 
 # === Optuna 目標函數 ===
@@ -74,7 +78,7 @@ if __name__ == "__main__":
     for sym in symbols:
         try:
             df = get_binance_klines(sym, interval="1h", limit=500)
-            train_sets.append(df)
+            train_sets.append(with_features(sym, "1h", df))
             print(f"✅ 已抓取 {sym} K線資料，共 {len(df)} 根")
         except Exception as e:
             print(f"⚠️ {sym} 抓取失敗: {e}")
@@ -0,0 +1,206 @@
+# walk_forward.py
+"""
+Walk-forward 最佳化
+
+- make_folds: 依 K 線根數切出滾動 (rolling) 或錨定 (anchored) 的訓練 / 測試窗
+- walk_forward: 指標對整段序列只算一次 (indicators(df))，以 memmap 共享給 process pool，
+  每個 fold 在自己的行程內跑一個 Optuna study，訓練 / 測試窗都是同一份指標的切片；
+  回傳每個 fold 的最佳參數、串接後的樣本外 (OOS) 權益曲線與摘要表
+
+objective(trial, train_df) -> float 與 evaluate(params, test_df) -> 權益序列 必須是模組層級函式，
+呼叫端腳本也必須有 if __name__ == "__main__": 保護 (spawn 子行程會重新 import)。
+指標為因果計算 (只用過去資料)，整段先算再切片不會偷看未來，且各 fold 的訓練窗不必重新暖機。
+"""
+import os
+import shutil
+import sys
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import optuna
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parallel_optuna import count_done, load_frames, make_storage, share_frames
+
+TRAIN_TEST_RATIO = 3  # 只指定 n_folds 時，訓練窗 = 3 × 測試窗
+
+
+# ========== 切窗 ==========
+def make_folds(n_bars: int, n_folds: Optional[int] = None, train_bars: Optional[int] = None,
+               test_bars: Optional[int] = None, step: Optional[int] = None,
+               anchored: bool = False) -> List[Dict[str, Any]]:
+    """
+    回傳 [{"fold": k, "train": (start, stop), "test": (start, stop)}, ...] (iloc 區間，stop 不含)
+    - 指定 train_bars / test_bars：fold 間隔 step (預設 = test_bars)，最多 n_folds 個
+    - 只指定 n_folds：測試窗 = n_bars // (n_folds + 3)，訓練窗 = 3 倍測試窗
+    - 最後一個測試窗一律貼齊資料尾端
+    - anchored=True：訓練窗起點固定在 0，長度隨 fold 增加
+    """
+    if test_bars is None:
+        if not n_folds:
+            raise ValueError("make_folds requires test_bars or n_folds")
+        if train_bars is None:
+            test_bars = n_bars // (n_folds + TRAIN_TEST_RATIO)
+            train_bars = TRAIN_TEST_RATIO * test_bars
+        else:
+            test_bars = (n_bars - train_bars) // n_folds
+    if train_bars is None:
+        train_bars = TRAIN_TEST_RATIO * test_bars
+    if train_bars <= 0 or test_bars <= 0:
+        raise ValueError(f"not enough bars for walk-forward: n_bars={n_bars}")
+    step = step or test_bars
+
+    # 讓最後一個測試窗貼齊資料尾端
+    span = n_bars - train_bars - test_bars
+    if span < 0:
+        raise ValueError(f"train_bars + test_bars exceeds n_bars ({train_bars} + {test_bars} > {n_bars})")
+    count = span // step + 1
+    if n_folds:
+        count = min(count, n_folds)
+    offset = n_bars - (train_bars + (count - 1) * step + test_bars)
+
+    folds = []
+    for k in range(count):
+        test_start = offset + train_bars + k * step
+        train_start = 0 if anchored else test_start - train_bars
+        folds.append({"fold": k, "train": (train_start, test_start), "test": (test_start, test_start + test_bars)})
+    return folds
+
+
+# ========== 權益串接 ==========
+def stitch_equity(curves: List[pd.Series], initial: float = 1.0) -> pd.Series:
+    """各 fold 的 OOS 權益依序接起來：每段先除以自己的起點，再乘上前一段結束時的資金"""
+    parts = []
+    capital = float(initial)
+    for curve in curves:
+        curve = pd.Series(curve, dtype=float)
+        if curve.empty or not np.isfinite(curve.iloc[0]) or curve.iloc[0] == 0:
+            continue
+        scaled = curve / curve.iloc[0] * capital
+        parts.append(scaled)
+        capital = float(scaled.iloc[-1])
+    if not parts:
+        return pd.Series(dtype=float)
+    return pd.concat(parts)
+
+
+def _max_drawdown(equity: np.ndarray) -> float:
+    if len(equity) == 0:
+        return 0.0
+    peak = np.maximum.accumulate(equity)
+    return float(np.nanmin((equity - peak) / peak))
+
+
+# ========== worker ==========
+_FEATURES: Optional[pd.DataFrame] = None
+
+
+def _init_worker(manifest: Dict[str, Any]):
+    global _FEATURES
+    _FEATURES = load_frames(manifest)["features"]
+
+
+def _run_fold(fold: Dict[str, Any], objective: Callable, evaluate: Callable, n_trials: int,
+              timeout: Optional[float], direction: str, sampler_factory: Optional[Callable],
+              seed: Optional[int], pruner: Any, storage: Any, study_name: str) -> Dict[str, Any]:
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    train = _FEATURES.iloc[fold["train"][0]:fold["train"][1]]
+    test = _FEATURES.iloc[fold["test"][0]:fold["test"][1]]
+
+    sampler = None
+    if sampler_factory is not None:
+        sampler = sampler_factory(None if seed is None else seed + fold["fold"])
+    study = optuna.create_study(
+        study_name=f"{study_name}_fold{fold['fold']}",
+        storage=make_storage(storage) if storage is not None else None,
+        direction=direction,
+        sampler=sampler,
+        pruner=pruner,
+        load_if_exists=True,
+    )
+    # 有 storage 時可續跑：只補足尚未完成的 trial
+    remaining = n_trials - count_done(study)
+    if remaining > 0:
+        # 指標已預先算好、每個 trial 很輕，不做 gc_after_trial (大 heap 下 gc 比回測本身還貴)
+        study.optimize(lambda trial: objective(trial, train), n_trials=remaining, timeout=timeout)
+
+    best = study.best_trial
+    equity = pd.Series(np.asarray(evaluate(best.params, test), dtype=float))
+    if len(equity) == len(test):
+        equity.index = test.index
+    return {
+        "fold": fold["fold"],
+        "train": fold["train"],
+        "test": fold["test"],
+        "best_params": dict(best.params),
+        "train_value": best.value,
+        "n_trials": len(study.trials),
+        "equity": equity,
+    }
+
+
+# ========== 主流程 ==========
+def walk_forward(df: pd.DataFrame, objective: Callable, evaluate: Callable,
+                 folds: Optional[List[Dict[str, Any]]] = None, indicators: Optional[Callable] = None,
+                 n_trials: int = 100, timeout: Optional[float] = None, n_workers: Optional[int] = None,
+                 direction: str = "maximize", sampler_factory: Optional[Callable] = None,
+                 seed: Optional[int] = None, pruner: Any = None, storage: Optional[str] = None,
+                 study_name: str = "walk_forward", initial: float = 1.0, **fold_kwargs) -> Dict[str, Any]:
+    """
+    df: 原始 K 線；indicators(df) -> 含全部指標欄位的 DataFrame (只呼叫一次)
+    folds: make_folds() 的結果；未指定時以 fold_kwargs (n_folds / train_bars / test_bars / anchored) 建立
+    n_trials / timeout: 每個 fold 的 study 預算；fold 之間以 n_workers 個行程平行
+    storage: 指定時每個 fold 的 study 存為 {study_name}_fold{k}，中斷後重跑可續跑
+    回傳 {"folds": [...], "equity": 串接後的 OOS 權益 (起點 = initial), "summary": DataFrame}
+    """
+    features = indicators(df) if indicators is not None else df
+    if folds is None:
+        folds = make_folds(len(features), **fold_kwargs)
+    if not folds:
+        raise ValueError("walk_forward: no folds")
+
+    manifest = share_frames({"features": features})
+    args = (objective, evaluate, n_trials, timeout, direction, sampler_factory, seed, pruner, storage, study_name)
+    n_workers = max(1, min(int(n_workers or os.cpu_count() or 1), len(folds)))
+    results = []
+    try:
+        if n_workers == 1:
+            _init_worker(manifest)
+            results = [_run_fold(fold, *args) for fold in folds]
+        else:
+            ctx = mp.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx,
+                                     initializer=_init_worker, initargs=(manifest,)) as pool:
+                futures = [pool.submit(_run_fold, fold, *args) for fold in folds]
+                for fut in as_completed(futures):
+                    res = fut.result()
+                    print(f"✅ fold {res['fold']} 完成：train={res['train_value']:.4f} params={res['best_params']}")
+                    results.append(res)
+    finally:
+        shutil.rmtree(manifest["root"], ignore_errors=True)
+
+    results.sort(key=lambda r: r["fold"])
+    index = features.index
+    rows = []
+    for r in results:
+        eq = r["equity"].to_numpy()
+        rows.append({
+            "fold": r["fold"],
+            "train_start": index[r["train"][0]],
+            "train_end": index[r["train"][1] - 1],
+            "test_start": index[r["test"][0]],
+            "test_end": index[r["test"][1] - 1],
+            "n_trials": r["n_trials"],
+            "train_value": r["train_value"],
+            "test_return": float(eq[-1] / eq[0] - 1) if len(eq) and eq[0] else np.nan,
+            "test_max_drawdown": _max_drawdown(eq),
+            **{f"param_{k}": v for k, v in r["best_params"].items()},
+        })
+    return {
+        "folds": results,
+        "equity": stitch_equity([r["equity"] for r in results], initial=initial),
+        "summary": pd.DataFrame(rows),
+    }
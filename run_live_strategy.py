@@ -3,6 +3,7 @@ import time
 import csv
 from typing import Dict, Any
 from data_fetch import fetch_multi_timeframes
+from ohlcv_resample import alignment
 from bybit_utils import open_position, close_position, get_position, get_balance
 from signal_generator import generate_signal
 from strategies import run_strategy
@@ -70,18 +71,16 @@ def run_live(symbol="BTCUSDT"):
 
     dfs = fetch_multi_timeframes(symbol, limit=1000)
     df_1m = dfs["1m"]
+    align = alignment(dfs)
 
     for i in range(len(df_1m)):
         ts = int(time.time())
         price = df_1m["close"].iloc[i]
 
-        dfs_slice = {
-            "1m": df_1m.iloc[:i+1],
-            "15m": dfs["15m"].iloc[:i//15+1],
-            "1h": dfs["1h"].iloc[:i//60+1],
-            "4h": dfs["4h"].iloc[:i//240+1],
-            "1d": dfs["1d"].iloc[:i//1440+1],
-        }
+        # 高週期前綴依時間戳對齊 (包含第 i 根 1m 的那根高週期 K 線為止)
+        dfs_slice = {"1m": df_1m.iloc[:i+1]}
+        for tf in ("15m", "1h", "4h", "1d"):
+            dfs_slice[tf] = dfs[tf].iloc[:align[tf][i]+1] if tf in align else dfs[tf]
 
         sigs = generate_signal(dfs_slice)
         decision = run_strategy(strategy_name, sigs)
@@ -1,3 +1,4 @@
+import numpy as np
 from signal_generator import (
     signal_macd, signal_rsi, signal_bollinger, signal_atr, signal_adx,
     signal_stochastic, signal_skdj, signal_td, signal_roc, signal_mom,
@@ -39,6 +40,29 @@ def combine_signals_weight(sigs, weights, threshold=0.5):
     if score <= -threshold: return -1
     return 0
 
+# === 矩陣版本：sig_matrix 為 generate_signal_matrix 的輸出，一次產生整段決策 ===
+def _column(sig_matrix, ind):
+    if ind in sig_matrix:
+        return np.asarray(sig_matrix[ind], dtype=float)
+    return np.zeros(len(sig_matrix))
+
+def combine_signals_rule_matrix(sig_matrix, ruleset):
+    """combine_signals_rule 的向量版，回傳 int8 決策陣列"""
+    mask = np.ones(len(sig_matrix), dtype=bool)
+    for ind, val in ruleset:
+        mask &= _column(sig_matrix, ind) == val
+    hit = 1 if all(v == 1 for _, v in ruleset) else -1
+    return np.where(mask, hit, 0).astype(np.int8)
+
+def combine_signals_weight_matrix(sig_matrix, weights, threshold=0.5):
+    """combine_signals_weight 的向量版，回傳 int8 決策陣列"""
+    score = np.zeros(len(sig_matrix))
+    total = sum(weights.values())
+    for ind, w in weights.items():
+        score += _column(sig_matrix, ind) * w
+    score = score / total if total > 0 else np.zeros(len(sig_matrix))
+    return np.where(score >= threshold, 1, np.where(score <= -threshold, -1, 0)).astype(np.int8)
+
 # === 自動生成組合 (避免重複趨勢類) ===
 def generate_combinations():
     combos = []
@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 import talib
+from ohlcv_resample import alignment
+from td_sequential import COUNTDOWN_LENGTH, SETUP_LENGTH, td_frame, td_sequential
 
 # === 單一指標信號 ===
 def signal_macd(df):
@@ -41,14 +43,13 @@ def signal_skdj(df, k_period=9, d_period=3):
     d = k.ewm(com=d_period-1).mean()
     return 1 if k.iloc[-1] > d.iloc[-1] else -1
 
-def signal_td(df, length=9):
-    count = 0
-    for i in range(len(df)-length, len(df)):
-        if df['close'].iloc[i] < df['close'].iloc[i-4]:
-            count += 1
-        else:
-            count = 0
-    return 1 if count >= length else 0
+def signal_td(df, length=SETUP_LENGTH):
+    """買進 setup 連續 length 根以上"""
+    return int(series_td(df, length)[-1])
+
+def signal_td_countdown(df, length=COUNTDOWN_LENGTH):
+    """最新一根完成買進 countdown"""
+    return int(series_td_countdown(df, length)[-1])
 
 def signal_roc(df, period=10):
     roc = talib.ROC(df['close'], timeperiod=period)
@@ -97,7 +98,7 @@ def generate_signal(dfs: dict):
     sigs["boll"] = signal_bollinger(df)
     sigs["skdj"] = signal_skdj(df)
     sigs["td9"] = signal_td(df, 9)
-    sigs["td13"] = signal_td(df, 13)
+    sigs["td13"] = signal_td_countdown(df)
     sigs["atr"] = signal_atr(df)
     sigs["adx"] = signal_adx(df)
     sigs["stoch"] = signal_stochastic(df)
@@ -116,4 +117,140 @@ def generate_signal(dfs: dict):
             sigs[f"rsi_{tf}"] = signal_rsi(dfs[tf])
             sigs[f"adx_{tf}"] = signal_adx(dfs[tf])
 
-    return sigs
\ No newline at end of file
+    return sigs
+
+# === 整段序列信號 (向量化) ===
+# 每個指標只跑一次 talib，回傳每根 K 線的信號值；
+# 最後一列與對應 signal_* 對同一前綴的結果相同。
+def series_macd(df):
+    macd, signal, hist = talib.MACD(df['close'].to_numpy(dtype=float), 12, 26, 9)
+    return np.where(macd > signal, 1, -1)
+
+def series_rsi(df, period=14):
+    rsi = talib.RSI(df['close'].to_numpy(dtype=float), timeperiod=period)
+    return np.where(rsi < 30, 1, np.where(rsi > 70, -1, 0))
+
+def series_bollinger(df, period=20, nbdev=2):
+    close = df['close'].to_numpy(dtype=float)
+    upper, mid, lower = talib.BBANDS(close, timeperiod=period, nbdevup=nbdev, nbdevdn=nbdev)
+    return np.where(close > upper, -1, np.where(close < lower, 1, 0))
+
+def series_atr(df, period=14):
+    return talib.ATR(df['high'].to_numpy(dtype=float), df['low'].to_numpy(dtype=float),
+                     df['close'].to_numpy(dtype=float), timeperiod=period)
+
+def series_adx(df, period=14):
+    adx = talib.ADX(df['high'].to_numpy(dtype=float), df['low'].to_numpy(dtype=float),
+                    df['close'].to_numpy(dtype=float), timeperiod=period)
+    return np.where(adx > 25, 1, 0)
+
+def series_stochastic(df, k=14, d=3):
+    slowk, slowd = talib.STOCH(df['high'].to_numpy(dtype=float), df['low'].to_numpy(dtype=float),
+                               df['close'].to_numpy(dtype=float),
+                               fastk_period=k, slowk_period=d, slowd_period=d)
+    return np.where(slowk > slowd, 1, np.where(slowk < slowd, -1, 0))
+
+def series_skdj(df, k_period=9, d_period=3):
+    low_min = df['low'].rolling(window=k_period).min()
+    high_max = df['high'].rolling(window=k_period).max()
+    rsv = (df['close'] - low_min) / (high_max - low_min) * 100
+    k = rsv.ewm(com=d_period-1).mean()
+    d = k.ewm(com=d_period-1).mean()
+    return np.where(k.to_numpy() > d.to_numpy(), 1, -1)
+
+def series_td(df, length=SETUP_LENGTH):
+    td = td_sequential(df['close'].to_numpy(dtype=float))
+    return np.where(td["buy_setup"] >= length, 1, 0)
+
+def series_td_countdown(df, length=COUNTDOWN_LENGTH):
+    td = td_frame(df, countdown_length=length)
+    return np.where(td["td_buy_countdown"].to_numpy() == length, 1, 0)
+
+def series_roc(df, period=10):
+    roc = talib.ROC(df['close'].to_numpy(dtype=float), timeperiod=period)
+    return np.where(roc > 0, 1, -1)
+
+def series_mom(df, period=10):
+    mom = talib.MOM(df['close'].to_numpy(dtype=float), timeperiod=period)
+    return np.where(mom > 0, 1, -1)
+
+def series_stddev(df, period=20):
+    return talib.STDDEV(df['close'].to_numpy(dtype=float), timeperiod=period)
+
+def series_obv(df):
+    obv = talib.OBV(df['close'].to_numpy(dtype=float), df['volume'].to_numpy(dtype=float))
+    up = np.zeros(len(obv), dtype=bool)
+    up[1:] = obv[1:] > obv[:-1]
+    return np.where(up, 1, -1)
+
+def series_vwap(df):
+    vwap = (df['close'] * df['volume']).cumsum() / df['volume'].cumsum()
+    return np.where(df['close'].to_numpy() > vwap.to_numpy(), 1, -1)
+
+def series_ichimoku(df):
+    high9 = df['high'].rolling(9).max()
+    low9 = df['low'].rolling(9).min()
+    tenkan = (high9 + low9) / 2
+    high26 = df['high'].rolling(26).max()
+    low26 = df['low'].rolling(26).min()
+    kijun = (high26 + low26) / 2
+    return np.where(tenkan.to_numpy() > kijun.to_numpy(), 1, -1)
+
+def series_kama(df, period=10):
+    close = df['close'].to_numpy(dtype=float)
+    kama = talib.KAMA(close, timeperiod=period)
+    return np.where(close > kama, 1, -1)
+
+def signal_matrix(df):
+    """
+    單一週期的整段信號矩陣
+    return: DataFrame (index 同 df)，欄位與 generate_signal 的 1m 鍵值相同
+    """
+    cols = {
+        "macd": series_macd(df),
+        "rsi": series_rsi(df),
+        "boll": series_bollinger(df),
+        "skdj": series_skdj(df),
+        "td9": series_td(df, 9),
+        "td13": series_td_countdown(df),
+        "atr": series_atr(df),
+        "adx": series_adx(df),
+        "stoch": series_stochastic(df),
+        "roc": series_roc(df),
+        "mom": series_mom(df),
+        "stddev": series_stddev(df),
+        "obv": series_obv(df),
+        "vwap": series_vwap(df),
+        "ichimoku": series_ichimoku(df),
+        "kama": series_kama(df),
+    }
+    return pd.DataFrame(cols, index=df.index, dtype=float)
+
+def generate_signal_matrix(dfs: dict, align: dict = None):
+    """
+    generate_signal 的整段版本
+    dfs: dict { "1m": df, "15m": df, "1h": df, "4h": df, "1d": df }
+    align: ohlcv_resample.alignment(dfs) 的結果；未提供時在此計算
+    return: DataFrame，第 i 列 = generate_signal(各週期前綴 [:align[tf][i]+1])；尚無對應高週期 K 線時為 NaN
+    """
+    base = dfs["1m"]
+    mat = signal_matrix(base)
+    if align is None:
+        align = alignment(dfs)
+
+    def pick(values, idx):
+        out = values[np.maximum(idx, 0)]
+        if (idx < 0).any():
+            out = out.astype(float)
+            out[idx < 0] = np.nan
+        return out
+
+    for tf in ["15m", "1h", "4h", "1d"]:
+        if tf in dfs and len(dfs[tf]):
+            df = dfs[tf]
+            idx = align[tf]
+            mat[f"macd_{tf}"] = pick(series_macd(df), idx)
+            mat[f"rsi_{tf}"] = pick(series_rsi(df), idx)
+            mat[f"adx_{tf}"] = pick(series_adx(df), idx)
+
+    return mat
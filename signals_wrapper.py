@@ -1,5 +1,5 @@
 ﻿# signals_wrapper.py
-import json, traceback
+import inspect, json, traceback
 from pathlib import Path
 
 CAND_FILE = "candidate_list.json"
@@ -20,6 +20,15 @@ def try_import_generate_signals():
     except Exception:
         return None
 
+def prefetch(cands, timeframes, limit=200):
+    """所有 候選 × 週期 的 K 線一次並行抓取，回傳 { (symbol, timeframe): df }"""
+    try:
+        from async_fetcher import fetch_many
+        return fetch_many([(s, tf, limit) for s in cands for tf in timeframes])
+    except Exception:
+        traceback.print_exc()
+        return {}
+
 def fallback_signals(cands, timeframes):
     sigs=[]
     for s in cands:
@@ -34,18 +43,35 @@ def fallback_signals(cands, timeframes):
             })
     return sigs
 
+def _call_form(gen):
+    """依 generate_signals 的簽名決定呼叫方式：'data' (可收預抓資料) / 'keywords' / 'positional'"""
+    try:
+        params = inspect.signature(gen).parameters
+    except (TypeError, ValueError):
+        return "positional"
+    kinds = {p.kind for p in params.values()}
+    if "data" in params or inspect.Parameter.VAR_KEYWORD in kinds:
+        return "data"
+    if "timeframes" in params and "dry_run" in params:
+        return "keywords"
+    return "positional"
+
 def main():
     cands = load_candidates()[:50]
     gen = try_import_generate_signals()
     if gen:
+        form = _call_form(gen)
         try:
-            sigs = gen(cands, timeframes=TIMEFRAMES, dry_run=True)
-        except TypeError:
-            try:
+            if form == "data":
+                # 所有 候選 × 週期 一次並行預抓，交給產生器使用
+                frames = prefetch(cands, TIMEFRAMES)
+                sigs = gen(cands, timeframes=TIMEFRAMES, dry_run=True, data=frames)
+            elif form == "keywords":
+                sigs = gen(cands, timeframes=TIMEFRAMES, dry_run=True)
+            else:
                 sigs = gen(cands, TIMEFRAMES)
-            except Exception:
-                sigs = fallback_signals(cands, TIMEFRAMES)
         except Exception:
+            traceback.print_exc()
             sigs = fallback_signals(cands, TIMEFRAMES)
     else:
         sigs = fallback_signals(cands, TIMEFRAMES)
@@ -1,4 +1,8 @@
-from signal_combiner import combine_signals_rule, combine_signals_weight
+import numpy as np
+from signal_combiner import (
+    combine_signals_rule, combine_signals_weight,
+    combine_signals_rule_matrix, combine_signals_weight_matrix
+)
 
 # === 策略配置表 ===
 STRATEGY_CONFIGS = {
@@ -50,4 +54,17 @@ def run_strategy(strategy_name, sigs):
     elif cfg["mode"] == "weight":
         return combine_signals_weight(sigs, cfg["weights"], cfg["threshold"])
     else:
-        return 0
\ No newline at end of file
+        return 0
+
+def run_strategy_matrix(strategy_name, sig_matrix):
+    """run_strategy 的向量版：sig_matrix 每列一根 K 線，回傳 int8 決策陣列"""
+    cfg = STRATEGY_CONFIGS.get(strategy_name)
+    if not cfg:
+        raise ValueError(f"未知策略: {strategy_name}")
+
+    if cfg["mode"] == "rule":
+        return combine_signals_rule_matrix(sig_matrix, cfg["ruleset"])
+    elif cfg["mode"] == "weight":
+        return combine_signals_weight_matrix(sig_matrix, cfg["weights"], cfg["threshold"])
+    else:
+        return np.zeros(len(sig_matrix), dtype=np.int8)
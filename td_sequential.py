@@ -0,0 +1,162 @@
+# td_sequential.py
+"""
+TD Sequential (setup 9 / countdown 13)
+
+- setup: 買進 setup 為連續 close < close[i-4] 的根數 (run-length，不封頂)，賣出 setup 為連續 close > close[i-4]；
+  計數達 9 的那一根為 setup 完成
+- countdown: 買進 setup 完成的那一根起 (含該根) 計算 close <= low[i-2] 的根數，達 13 即完成並停止；
+  期間出現反向 (賣出) setup 完成則取消，再次出現同向 setup 完成則重新起算。賣出方向對稱 (close >= high[i-2])。
+  未提供 high / low 時以 close 代替。
+
+td_sequential(close, high, low) 對整段陣列一次算完 (run-length 與分段 cumsum，無逐根迴圈)；
+TDSequential 為逐根更新的串流版本 (實盤用)，每根結果與整段計算完全相同。
+"""
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+SETUP_LENGTH = 9
+COUNTDOWN_LENGTH = 13
+SETUP_LAG = 4
+COUNTDOWN_LAG = 2
+
+
+# ========== 整段計算 ==========
+def run_length(cond) -> np.ndarray:
+    """每根為止連續 cond 為 True 的根數"""
+    cond = np.asarray(cond, dtype=bool)
+    pos = np.arange(len(cond))
+    last_break = np.maximum.accumulate(np.where(cond, -1, pos)) if len(cond) else pos
+    return pos - last_break
+
+
+def _lagged(values: np.ndarray, lag: int) -> np.ndarray:
+    out = np.full(len(values), np.nan)
+    if len(values) > lag:
+        out[lag:] = values[:-lag]
+    return out
+
+
+def setup_counts(close, lag: int = SETUP_LAG):
+    """(買進 setup 計數, 賣出 setup 計數)"""
+    close = np.asarray(close, dtype=np.float64)
+    ref = _lagged(close, lag)
+    return run_length(close < ref), run_length(close > ref)
+
+
+def countdown(qualify: np.ndarray, start: np.ndarray, cancel: np.ndarray,
+              length: int = COUNTDOWN_LENGTH) -> np.ndarray:
+    """
+    單一方向的 countdown 計數 (未啟動或已完成為 0)。
+    start / cancel 把序列切成區段，區段內以 cumsum(qualify) 減去區段起點前的累計值即為計數。
+    """
+    qualify = np.asarray(qualify, dtype=bool)
+    events = np.flatnonzero(start | cancel)
+    if len(events) == 0:
+        return np.zeros(len(qualify), dtype=np.int64)
+    seg = np.cumsum(start | cancel)                      # 0 = 第一個事件之前
+    active = np.r_[False, start[events]][seg]
+    cq = np.cumsum(qualify, dtype=np.int64)
+    base = np.r_[0, cq[events] - qualify[events]][seg]
+    count = cq - base
+    done = active & qualify & (count == length)
+    return np.where(active & ((count < length) | done), count, 0)
+
+
+def td_sequential(close, high=None, low=None, setup_length: int = SETUP_LENGTH,
+                  countdown_length: int = COUNTDOWN_LENGTH) -> Dict[str, np.ndarray]:
+    """
+    回傳 {"buy_setup", "sell_setup", "buy_countdown", "sell_countdown"} (int64 陣列)。
+    setup 完成：*_setup == setup_length；countdown 完成：*_countdown == countdown_length。
+    """
+    close = np.asarray(close, dtype=np.float64)
+    high = close if high is None else np.asarray(high, dtype=np.float64)
+    low = close if low is None else np.asarray(low, dtype=np.float64)
+
+    buy_setup, sell_setup = setup_counts(close)
+    buy_done = buy_setup == setup_length
+    sell_done = sell_setup == setup_length
+    return {
+        "buy_setup": buy_setup,
+        "sell_setup": sell_setup,
+        "buy_countdown": countdown(close <= _lagged(low, COUNTDOWN_LAG), buy_done, sell_done, countdown_length),
+        "sell_countdown": countdown(close >= _lagged(high, COUNTDOWN_LAG), sell_done, buy_done, countdown_length),
+    }
+
+
+def td_frame(df: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    """K 線 DataFrame -> td_buy_setup / td_sell_setup / td_buy_countdown / td_sell_countdown 欄位 (index 同 df)"""
+    high = df["high"].to_numpy(dtype=np.float64) if "high" in df.columns else None
+    low = df["low"].to_numpy(dtype=np.float64) if "low" in df.columns else None
+    td = td_sequential(df["close"].to_numpy(dtype=np.float64), high, low, **kwargs)
+    return pd.DataFrame({f"td_{k}": v for k, v in td.items()}, index=df.index)
+
+
+# ========== 逐根更新 ==========
+class TDSequential:
+    """串流版 TD Sequential：update(close, high, low) 每根呼叫一次，屬性與 td_sequential 的同一根相同"""
+
+    def __init__(self, setup_length: int = SETUP_LENGTH, countdown_length: int = COUNTDOWN_LENGTH):
+        self.setup_length = setup_length
+        self.countdown_length = countdown_length
+        self.closes = deque(maxlen=SETUP_LAG)
+        self.highs = deque(maxlen=COUNTDOWN_LAG)
+        self.lows = deque(maxlen=COUNTDOWN_LAG)
+        self.buy_setup = self.sell_setup = 0
+        self.buy_countdown = self.sell_countdown = 0
+        self._buy_active = self._sell_active = False
+        self._buy_count = self._sell_count = 0
+
+    def update(self, close: float, high: Optional[float] = None, low: Optional[float] = None) -> "TDSequential":
+        high = close if high is None else high
+        low = close if low is None else low
+
+        full = len(self.closes) == self.closes.maxlen
+        self.buy_setup = self.buy_setup + 1 if full and close < self.closes[0] else 0
+        self.sell_setup = self.sell_setup + 1 if full and close > self.closes[0] else 0
+        buy_done = self.buy_setup == self.setup_length
+        sell_done = self.sell_setup == self.setup_length
+
+        ready = len(self.lows) == self.lows.maxlen
+        buy_q = ready and close <= self.lows[0]
+        sell_q = ready and close >= self.highs[0]
+        self._buy_active, self._buy_count, self.buy_countdown = self._step(
+            self._buy_active, self._buy_count, buy_q, buy_done, sell_done)
+        self._sell_active, self._sell_count, self.sell_countdown = self._step(
+            self._sell_active, self._sell_count, sell_q, sell_done, buy_done)
+
+        self.closes.append(close)
+        self.highs.append(high)
+        self.lows.append(low)
+        return self
+
+    def _step(self, active: bool, count: int, qualify: bool, start: bool, cancel: bool):
+        if start:
+            active, count = True, 0
+        elif cancel:
+            active, count = False, 0
+        if not active:
+            return False, count, 0
+        if qualify:
+            count += 1
+        if count >= self.countdown_length:
+            return False, count, count   # 完成的這一根回報 13，之後停止
+        return True, count, count
+
+    @property
+    def buy_setup_done(self) -> bool:
+        return self.buy_setup == self.setup_length
+
+    @property
+    def sell_setup_done(self) -> bool:
+        return self.sell_setup == self.setup_length
+
+    @property
+    def buy_countdown_done(self) -> bool:
+        return self.buy_countdown == self.countdown_length
+
+    @property
+    def sell_countdown_done(self) -> bool:
+        return self.sell_countdown == self.countdown_length
@@ -6,6 +6,7 @@ def debug_log(*a, **k): logging.debug("TD_TEST_DBG " + " ".join(str(x) for x in
 debug_log("td_test_manager loaded")
 # --- end injected debug helpers ---
 import sqlite3, json, time, os
+from td_sequential import COUNTDOWN_LENGTH, SETUP_LENGTH, TDSequential, td_frame
 DB = 'td_test.db'
 LOG = os.path.join('logs','td_test.log')
 os.makedirs('logs', exist_ok=True)
@@ -76,6 +77,49 @@ def record_trade(tr):
         _log("{} TD_TRADE_ERR {}".format(time.strftime('%Y-%m-%dT%H:%M:%SZ'), str(e)))
 
 
+# === TD Sequential 信號 (setup 9 / countdown 13) ===
+_TD_EVENTS = (
+    ("buy_setup", "buy", "setup"),
+    ("sell_setup", "sell", "setup"),
+    ("buy_countdown", "buy", "countdown"),
+    ("sell_countdown", "sell", "countdown"),
+)
+
+def td_events(symbol, timeframe, state, price, strategy='td_sequential'):
+    """state: {buy_setup, sell_setup, buy_countdown, sell_countdown} 的最新一根；只回傳剛完成的 setup / countdown"""
+    out = []
+    for key, side, phase in _TD_EVENTS:
+        count = int(state[key])
+        target = SETUP_LENGTH if phase == 'setup' else COUNTDOWN_LENGTH
+        if count != target:
+            continue
+        out.append({'symbol': symbol, 'timeframe': timeframe, 'strategy': strategy, 'price': float(price),
+                    'strength': count / COUNTDOWN_LENGTH,
+                    'meta': {'td_count': count, 'side': side, 'phase': phase}})
+    return out
+
+def record_td_signals(symbol, timeframe, df):
+    """整段 K 線一次算完 TD，記錄最新一根完成的 setup / countdown"""
+    if df is None or df.empty:
+        return []
+    last = td_frame(df).iloc[-1]
+    state = {key: last[f"td_{key}"] for key, _, _ in _TD_EVENTS}
+    events = td_events(symbol, timeframe, state, df['close'].iloc[-1])
+    for s in events:
+        record_signal(s)
+    return events
+
+_TD_STREAMS = {}
+
+def on_bar(symbol, timeframe, close, high=None, low=None):
+    """實盤逐根更新：每個 symbol / timeframe 維護一個 TDSequential，不重算歷史"""
+    td = _TD_STREAMS.setdefault((symbol, timeframe), TDSequential()).update(close, high, low)
+    state = {key: getattr(td, key) for key, _, _ in _TD_EVENTS}
+    events = td_events(symbol, timeframe, state, close)
+    for s in events:
+        record_signal(s)
+    return events
+
 
 # --- injected start wrapper (autopatch) ---
 import time, traceback
@@ -1,14 +1,141 @@
 # backtester.py
+import sys
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from pathlib import Path
 from data_pipeline import build_dataset
-from strategy_triggers import evaluate_signals
+from strategy_triggers import evaluate_signals, signal_codes
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from perf_metrics import MetricsAccumulator
 
 REPORTS_DIR = Path(__file__).parent / "reports"
 REPORTS_DIR.mkdir(exist_ok=True)
 
+# === 出場引擎 (單次線性掃描) ===
+def simulate_exits(close, high, low, signals, params, initial_balance=1000, fee_rate=0.001,
+                   slippage=0.0005, leverage=1, times=None, checkpoints=None, trail_from_entry=False,
+                   metrics=None):
+    """
+    停損 / 停利 / 移動停損的逐根模擬，LONG 與 SHORT 共用一次 O(n) 掃描。
+    移動停損的參考極值以累積最高 / 最低價維護，不再每根重掃前綴；
+    trail_from_entry=False 時極值自序列起點起算 (與原本 iloc[:i+1] 的結果完全相同)，
+    True 時改為自進場那根起算。
+    signals 可為 "LONG"/"SHORT"/"NONE" 字串序列或 int8 陣列 (1/-1/0)。
+    metrics: perf_metrics.MetricsAccumulator，逐根併入權益、逐筆併入平倉報酬。
+    回傳 (equity_curve, trades)，trades 為每筆交易的 dict 紀錄 (未平倉者 reason="open")。
+    """
+    n = len(close)
+    codes = signal_codes(signals) if n else np.zeros(0, dtype=np.int8)
+    if trail_from_entry:
+        run_high = run_low = None
+    else:
+        # fmax / fmin 與 pandas max / min 一樣略過 NaN
+        run_high = np.fmax.accumulate(high) if n else high
+        run_low = np.fmin.accumulate(low) if n else low
+    stop_loss = params["stop_loss"]
+    take_profit = params["take_profit"]
+    trailing_stop = params["trailing_stop"]
+    keep = 1 - fee_rate
+
+    balance = initial_balance
+    equity_curve = [balance]
+    trades = []
+    if metrics is not None:
+        metrics.update(balance)
+    position = None
+    entry_price = 0
+    entry_index = -1
+    entry_balance = balance
+    peak = trough = 0.0
+
+    def close_trade(i, price, reason):
+        trades.append({
+            "side": str(position),
+            "entry_index": entry_index,
+            "entry_time": times[entry_index] if times is not None else None,
+            "entry_price": float(entry_price),
+            "exit_index": i,
+            "exit_time": times[i] if times is not None else None,
+            "exit_price": float(price),
+            "reason": reason,
+            "return_pct": float(balance / entry_balance - 1),
+            "balance": float(balance),
+        })
+        if metrics is not None:
+            metrics.add_trade(balance / entry_balance - 1, i - entry_index)
+
+    for i in range(n):
+        price = close[i] * (1 + slippage)
+        sig = codes[i]
+
+        # === 平倉檢查 ===
+        if position == "LONG":
+            if trail_from_entry:
+                peak = max(peak, high[i])
+            else:
+                peak = run_high[i]
+            reason = None
+            if price <= entry_price * stop_loss:
+                reason = "stop_loss"
+            elif price >= entry_price * take_profit:
+                reason = "take_profit"
+            elif price <= peak * (1 - trailing_stop):
+                reason = "trailing_stop"
+            if reason is not None:
+                balance *= (price / entry_price) * leverage * keep
+                close_trade(i, price, reason)
+                position = None
+
+        elif position == "SHORT":
+            if trail_from_entry:
+                trough = min(trough, low[i])
+            else:
+                trough = run_low[i]
+            reason = None
+            if price >= entry_price * (2 - stop_loss):
+                reason = "stop_loss"
+            elif price <= entry_price * (2 - take_profit):
+                reason = "take_profit"
+            elif price >= trough * (1 + trailing_stop):
+                reason = "trailing_stop"
+            if reason is not None:
+                balance *= (entry_price / price) * leverage * keep
+                close_trade(i, price, reason)
+                position = None
+
+        # === 開倉 ===
+        if position is None and sig != 0:
+            position = "LONG" if sig == 1 else "SHORT"
+            entry_price = price
+            entry_index = i
+            entry_balance = balance
+            peak = high[i]
+            trough = low[i]
+
+        equity_curve.append(balance)
+        if metrics is not None:
+            metrics.update(balance)
+
+        if checkpoints is not None and checkpoints.due(i):
+            checkpoints.report(i, balance / initial_balance - 1)
+
+    if position is not None:
+        trades.append({
+            "side": str(position),
+            "entry_index": entry_index,
+            "entry_time": times[entry_index] if times is not None else None,
+            "entry_price": float(entry_price),
+            "exit_index": None,
+            "exit_time": None,
+            "exit_price": None,
+            "reason": "open",
+            "return_pct": 0.0,
+            "balance": float(balance),
+        })
+    return equity_curve, trades
+
 class Backtester:
     def __init__(self, symbol="BTCUSDT", initial_balance=1000, fee_rate=0.001, slippage=0.0005, leverage=1):
         self.symbol = symbol
@@ -17,61 +144,35 @@ class Backtester:
         self.slippage = slippage
         self.leverage = leverage
 
-    def run(self, params, lookback=2000, save_report=False, label="test"):
+    def run(self, params, lookback=2000, save_report=False, label="test", checkpoints=None):
+        # checkpoints: optuna_pruning.Checkpoints，於檢查點回報當下報酬率以便剪枝
         df = build_dataset(self.symbol, "5m", lookback)
-        signals = evaluate_signals(df, params)
-
-        balance = self.initial_balance
-        equity_curve = [balance]
-        position = None
-        entry_price = 0
+        signals = evaluate_signals(df, params, as_strings=False)
 
         # === 資金分配策略 ===
         allocation_mode = params.get("allocation_mode", 0)  # 0=固定金額, 1=固定比例
         allocation_value = params.get("allocation_value", 0.05)  # 預設 5% 或 50 USDT
 
-        for i in range(len(df)):
-            price = df["close"].iloc[i] * (1 + self.slippage)
-            sig = signals[i]
-
-            # === 平倉檢查 ===
-            if position == "LONG":
-                if price <= entry_price * params["stop_loss"]:
-                    balance *= (price / entry_price) * self.leverage * (1 - self.fee_rate)
-                    position = None
-                elif price >= entry_price * params["take_profit"]:
-                    balance *= (price / entry_price) * self.leverage * (1 - self.fee_rate)
-                    position = None
-                elif price <= df["high"].iloc[:i+1].max() * (1 - params["trailing_stop"]):
-                    balance *= (price / entry_price) * self.leverage * (1 - self.fee_rate)
-                    position = None
-
-            elif position == "SHORT":
-                if price >= entry_price * (2 - params["stop_loss"]):
-                    balance *= (entry_price / price) * self.leverage * (1 - self.fee_rate)
-                    position = None
-                elif price <= entry_price * (2 - params["take_profit"]):
-                    balance *= (entry_price / price) * self.leverage * (1 - self.fee_rate)
-                    position = None
-                elif price >= df["low"].iloc[:i+1].min() * (1 + params["trailing_stop"]):
-                    balance *= (entry_price / price) * self.leverage * (1 - self.fee_rate)
-                    position = None
-
-            # === 開倉 ===
-            if position is None:
-                if sig == "LONG":
-                    position = "LONG"
-                    entry_price = price
-                elif sig == "SHORT":
-                    position = "SHORT"
-                    entry_price = price
-
-            equity_curve.append(balance)
+        times = df["time"].tolist() if "time" in df.columns else None
+        metrics = MetricsAccumulator()
+        equity_curve, trades = simulate_exits(
+            df["close"].to_numpy(dtype=float),
+            df["high"].to_numpy(dtype=float),
+            df["low"].to_numpy(dtype=float),
+            signals, params,
+            initial_balance=self.initial_balance,
+            fee_rate=self.fee_rate,
+            slippage=self.slippage,
+            leverage=self.leverage,
+            times=times,
+            checkpoints=checkpoints,
+            metrics=metrics,
+        )
+        balance = equity_curve[-1]
 
         pnl = balance - self.initial_balance
-        returns = np.diff(equity_curve) / equity_curve[:-1]
-        sharpe = np.mean(returns) / (np.std(returns) + 1e-9) * np.sqrt(252*24*12)
-        maxdd = np.max(np.maximum.accumulate(equity_curve) - equity_curve)
+        sharpe = metrics.sharpe(periods_per_year=252*24*12, ddof=0, eps=1e-9)
+        maxdd = metrics.max_dd_abs
 
         # === 資金分配策略標註 ===
         alloc_label = "固定金額" if allocation_mode == 0 else "固定比例"
@@ -82,6 +183,9 @@ class Backtester:
             "sharpe": sharpe,
             "maxdd": maxdd,
             "equity_curve": equity_curve,
+            "trades": trades,
+            "win_rate": metrics.win_rate,
+            "profit_factor": metrics.profit_factor,
             "allocation_mode": alloc_label,
             "allocation_value": alloc_value
         }
@@ -48,6 +48,13 @@ def save_history(params, result):
     with open(HISTORY_FILE, "w") as f:
         json.dump(history, f, indent=2)
 
+def show_trades(result):
+    """顯示回測引擎回傳的逐筆交易紀錄 (不需重新模擬)"""
+    trades = result.get("trades") or []
+    st.caption(f"交易筆數: {len(trades)}")
+    if trades:
+        st.dataframe(pd.DataFrame(trades))
+
 # === Optuna 目標函數 ===
 def objective(trial):
     params = {
@@ -94,6 +101,7 @@ if st.button("執行回測"):
     col3.metric("Max Drawdown", f"{result['maxdd']:.2f}")
 
     st.line_chart(result["equity_curve"])
+    show_trades(result)
 
 # === 一鍵觸發 Optuna 優化 ===
 st.subheader("⚡ Optuna 優化")
@@ -122,6 +130,7 @@ if st.button("開始優化"):
     col3.metric("Max Drawdown", f"{result['maxdd']:.2f}")
 
     st.line_chart(result["equity_curve"])
+    show_trades(result)
 
 # === 歷史最佳參數比較 ===
 st.subheader("📜 歷史最佳參數紀錄")
@@ -147,5 +156,6 @@ if history:
             col3.metric("Max Drawdown", f"{result['maxdd']:.2f}")
 
             st.line_chart(result["equity_curve"])
+            show_trades(result)
 else:
     st.info("目前沒有歷史紀錄")
\ No newline at end of file
@@ -1,8 +1,17 @@
 # data_pipeline.py
 import pandas as pd
-import pandas_ta as ta
 from binance.client import Client
 import os
+import sys
+from pathlib import Path
+
+# 專案根目錄放在搜尋路徑最後，避免遮蔽 tools 下同名模組 (portfolio_manager / backtester)
+_ROOT = str(Path(__file__).resolve().parent.parent)
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from indicator_cache import CACHE, cached_ta, fingerprint
+from td_sequential import run_length, td_frame
 
 # === 初始化 Binance API ===
 def init_client():
@@ -28,51 +37,53 @@ def fetch_klines(symbol="BTCUSDT", interval="5m", limit=1000):
     df["volume"] = df["volume"].astype(float)
     return df
 
-# === TD Sequential (簡化版) ===
-def calc_td_seq(df, length=13):
-    td = [0] * len(df)
-    count = 0
-    for i in range(1, len(df)):
-        if df["close"].iloc[i] < df["close"].iloc[i-1]:
-            count += 1
-        else:
-            count = 0
-        td[i] = count
-    df["td_seq"] = td
+# === TD Sequential ===
+def calc_td_seq(df, length=13, fp=None):
+    # td_seq = 連續收低於前一根收盤的根數 (原本的簡化版定義，策略觸發沿用)；
+    # 另附標準 TD setup / countdown 各欄 (setup 比較 close[i-4]，countdown 達 length 即完成)
+    fp = fp or fingerprint(df["high"], df["low"], df["close"])
+    td = CACHE.get(fp, "td_frame", {"countdown_length": length}, lambda: td_frame(df, countdown_length=length))
+    for col in td.columns:
+        df[col] = td[col]
+    df["td_seq"] = run_length((df["close"] < df["close"].shift(1)).to_numpy())
     return df
 
-# === 技術指標計算 ===
+# === 技術指標計算 (經 indicator_cache：同一段 K 線重複建置時直接命中) ===
 def add_indicators(df):
+    close = df["close"]
+    fp = fingerprint(close)
+    fp_hlc = fingerprint(df["high"], df["low"], close)
+
     # RSI
-    df["rsi"] = ta.rsi(df["close"], length=14)
+    df["rsi"] = cached_ta("rsi", close, fp=fp, length=14)
 
     # MACD (內部已用 EMA)
-    macd = ta.macd(df["close"], fast=12, slow=26, signal=9)
+    macd = cached_ta("macd", close, fp=fp, fast=12, slow=26, signal=9)
     df["macd"] = macd["MACD_12_26_9"]
     df["signal"] = macd["MACDs_12_26_9"]
     df["hist"] = macd["MACDh_12_26_9"]
 
     # 布林帶 (基於 EMA)
-    bb = ta.bbands(df["close"], length=20, std=2, mamode="ema")
+    bb = cached_ta("bbands", close, fp=fp, length=20, std=2, mamode="ema")
     df["bb_lower"] = bb.iloc[:, 0]
     df["bb_middle"] = bb.iloc[:, 1]
     df["bb_upper"] = bb.iloc[:, 2]
 
     # ATR
-    df["atr"] = ta.atr(df["high"], df["low"], df["close"], length=14)
+    df["atr"] = cached_ta("atr", df["high"], df["low"], close, fp=fp_hlc, length=14)
 
     # EMA (多週期)
-    df["ema20"] = ta.ema(df["close"], length=20)
-    df["ema50"] = ta.ema(df["close"], length=50)
-    df["ema100"] = ta.ema(df["close"], length=100)
+    df["ema20"] = cached_ta("ema", close, fp=fp, length=20)
+    df["ema50"] = cached_ta("ema", close, fp=fp, length=50)
+    df["ema100"] = cached_ta("ema", close, fp=fp, length=100)
 
     # SKDJ (Stochastic KDJ)
-    stoch = ta.stoch(df["high"], df["low"], df["close"], k=14, d=3, smooth_k=3)
+    stoch = cached_ta("stoch", df["high"], df["low"], close, fp=fp_hlc, k=14, d=3, smooth_k=3)
     df["kdj_k"] = stoch["STOCHk_14_3_3"]
     df["kdj_d"] = stoch["STOCHd_14_3_3"]
 
     # TD Sequential
-    df = calc_td_seq(df, length=13)
+    df = calc_td_seq(df, length=13, fp=fp_hlc)
 
     return df.dropna()
 
@@ -82,6 +93,24 @@ def build_dataset(symbol="BTCUSDT", interval="5m", limit=1000):
     df = add_indicators(df)
     return df
 
+def build_datasets(requests, max_concurrency=10):
+    """
+    並行版 build_dataset：requests 為 [(symbol, interval, limit), ...]，
+    全部 K 線經 ccxt.async_support 同時抓取，回傳 { (symbol, interval): df }。
+    抓取失敗的標的不在結果內，由呼叫端退回 build_dataset。
+    """
+    from async_fetcher import fetch_many
+
+    frames = fetch_many(requests, exchange_id="binance", max_concurrency=max_concurrency)
+    out = {}
+    for key, raw in frames.items():
+        df = raw.rename(columns={"timestamp": "time"})
+        df["time"] = pd.to_datetime(df["time"], unit="ms")
+        for col in ["open", "high", "low", "close", "volume"]:
+            df[col] = df[col].astype(float)
+        out[key] = add_indicators(df)
+    return out
+
 if __name__ == "__main__":
     df = build_dataset("BTCUSDT", "5m", 500)
     print(df.tail())
\ No newline at end of file
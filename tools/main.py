@@ -3,6 +3,7 @@ import time, csv, json
 from pathlib import Path
 from market_scanner import scan_market
 import trader
+from data_pipeline import build_datasets
 import portfolio_manager as pm
 
 # === 全域設定 ===
@@ -72,6 +73,13 @@ def run_cycle():
     # 現貨 + 永續合約
     symbols = list(market["spot"]["symbol"]) + list(market["futures"]["symbol"])
 
+    # 所有標的的 5m / 1h K 線一次並行抓取，整輪耗時取決於最慢的請求
+    try:
+        datasets = build_datasets([(s, tf, 500) for s in dict.fromkeys(symbols) for tf in ("5m", "1h")])
+    except Exception as e:
+        print("並行抓取失敗，改為逐一抓取:", e)
+        datasets = {}
+
     for symbol in symbols:
         print(f"\n檢查標的: {symbol}")
         result = trader.trade_once(
@@ -81,7 +89,8 @@ def run_cycle():
             dry_run=DRY_RUN,
             stop_loss=params["stop_loss"],
             take_profit=params["take_profit"],
-            trailing_stop=params["trailing_stop"]
+            trailing_stop=params["trailing_stop"],
+            datasets=datasets
         )
         print("交易結果:", result)
         log_trade(result)
@@ -55,105 +55,104 @@ def _ensure_indicators(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
-# --- 單一策略訊號（每根K線回傳 "LONG"/"SHORT"/"NONE"） ---
+# --- 單一策略訊號 ---
+# 內部以 int8 陣列表示：1=LONG, -1=SHORT, 0=NONE；as_strings=True 時轉回字串 list (相容舊介面)
 
-def breakout_signals(df: pd.DataFrame, params: dict) -> list:
+LABELS = np.array(["NONE", "LONG", "SHORT"])  # 以 code 索引 (-1 對應最後一個元素)
+
+def to_strings(codes: np.ndarray) -> list:
+    return LABELS[np.asarray(codes, dtype=np.int8)].tolist()
+
+def signal_codes(signals) -> np.ndarray:
+    """字串序列或 int 陣列 -> int8 {-1, 0, 1}"""
+    arr = np.asarray(signals)
+    if arr.dtype.kind in "iub":
+        return arr.astype(np.int8, copy=False)
+    return ((arr == "LONG").astype(np.int8) - (arr == "SHORT").astype(np.int8))
+
+def _col(df: pd.DataFrame, name: str) -> np.ndarray:
+    return df[name].to_numpy(dtype=float)
+
+def _ternary(valid: np.ndarray, long_mask: np.ndarray, short_mask: np.ndarray) -> np.ndarray:
+    out = np.zeros(len(valid), dtype=np.int8)
+    out[valid & long_mask] = 1
+    out[valid & short_mask & ~long_mask] = -1
+    return out
+
+def breakout_signals(df: pd.DataFrame, params: dict, as_strings: bool = True):
     """布林通道突破"""
-    sigs = []
-    for i in range(len(df)):
-        c = df["close"].iloc[i]
-        up = df["bb_upper"].iloc[i]
-        lo = df["bb_lower"].iloc[i]
-        if pd.isna(up) or pd.isna(lo):
-            sigs.append("NONE")
-            continue
-        if c > up:
-            sigs.append("LONG")
-        elif c < lo:
-            sigs.append("SHORT")
-        else:
-            sigs.append("NONE")
-    return sigs
-
-def mean_reversion_signals(df: pd.DataFrame, params: dict) -> list:
+    c = _col(df, "close")
+    up = _col(df, "bb_upper")
+    lo = _col(df, "bb_lower")
+    valid = ~(np.isnan(up) | np.isnan(lo))
+    with np.errstate(invalid="ignore"):
+        codes = _ternary(valid, c > up, c < lo)
+    return to_strings(codes) if as_strings else codes
+
+def mean_reversion_signals(df: pd.DataFrame, params: dict, as_strings: bool = True):
     """均值回歸：RSI 超買/超賣 + 乖離"""
     rsi_buy = params.get("rsi_buy", 30)
     rsi_sell = params.get("rsi_sell", 70)
-    ema = df["ema20"]
-    sigs = []
-    for i in range(len(df)):
-        c = df["close"].iloc[i]
-        r = df["rsi"].iloc[i]
-        e = ema.iloc[i]
-        if pd.isna(r) or pd.isna(e):
-            sigs.append("NONE")
-            continue
-        # 過度低估 → LONG；過度高估 → SHORT
-        if r <= rsi_buy and c < e * 0.995:
-            sigs.append("LONG")
-        elif r >= rsi_sell and c > e * 1.005:
-            sigs.append("SHORT")
-        else:
-            sigs.append("NONE")
-    return sigs
-
-def trend_follow_signals(df: pd.DataFrame, params: dict) -> list:
+    c = _col(df, "close")
+    r = _col(df, "rsi")
+    e = _col(df, "ema20")
+    valid = ~(np.isnan(r) | np.isnan(e))
+    # 過度低估 → LONG；過度高估 → SHORT
+    with np.errstate(invalid="ignore"):
+        codes = _ternary(valid, (r <= rsi_buy) & (c < e * 0.995), (r >= rsi_sell) & (c > e * 1.005))
+    return to_strings(codes) if as_strings else codes
+
+def trend_follow_signals(df: pd.DataFrame, params: dict, as_strings: bool = True):
     """趨勢跟隨：EMA20/EMA50 多空"""
-    sigs = []
-    for i in range(len(df)):
-        e20 = df["ema20"].iloc[i]
-        e50 = df["ema50"].iloc[i]
-        if pd.isna(e20) or pd.isna(e50):
-            sigs.append("NONE")
-            continue
-        if e20 > e50:
-            sigs.append("LONG")
-        elif e20 < e50:
-            sigs.append("SHORT")
-        else:
-            sigs.append("NONE")
-    return sigs
+    e20 = _col(df, "ema20")
+    e50 = _col(df, "ema50")
+    valid = ~(np.isnan(e20) | np.isnan(e50))
+    with np.errstate(invalid="ignore"):
+        codes = _ternary(valid, e20 > e50, e20 < e50)
+    return to_strings(codes) if as_strings else codes
 
 # --- 融合邏輯 ---
 
-def _vote(s_list: list[str], weights: list[float], mode: str = "weighted") -> str:
+def vote(series: list, weights: list, mode: str = "weighted") -> np.ndarray:
     """
+    series: 各策略的 int8 陣列；回傳逐根融合後的 int8 陣列。
     mode:
-      - "weighted": LONG/SHORT 加權，NONE=0
+      - "weighted": LONG/SHORT 加權，NONE=0，|score| <= 1e-9 視為 NONE
       - "majority": 多數決（權重僅作為平票打破）
+    累加順序與逐根版本相同，浮點結果一致。
     """
-    if len(s_list) == 0:
-        return "NONE"
+    if len(series) == 0:
+        return np.zeros(0, dtype=np.int8)
+    n = len(series[0])
 
     if mode == "majority":
-        long_w = sum(w for s, w in zip(s_list, weights) if s == "LONG")
-        short_w = sum(w for s, w in zip(s_list, weights) if s == "SHORT")
-        if long_w > short_w and long_w > 0:
-            return "LONG"
-        if short_w > long_w and short_w > 0:
-            return "SHORT"
-        return "NONE"
+        long_w = np.zeros(n)
+        short_w = np.zeros(n)
+        for s, w in zip(series, weights):
+            long_w += np.where(s == 1, w, 0.0)
+            short_w += np.where(s == -1, w, 0.0)
+        out = np.zeros(n, dtype=np.int8)
+        out[(long_w > short_w) & (long_w > 0)] = 1
+        out[(short_w > long_w) & (short_w > 0)] = -1
+        return out
 
     # weighted
-    score = 0.0
-    for s, w in zip(s_list, weights):
-        if s == "LONG":
-            score += w
-        elif s == "SHORT":
-            score -= w
-    if score > 1e-9:
-        return "LONG"
-    elif score < -1e-9:
-        return "SHORT"
-    return "NONE"
-
-def evaluate_signals(df: pd.DataFrame, params: dict) -> list:
+    score = np.zeros(n)
+    for s, w in zip(series, weights):
+        score += np.where(s == 1, w, np.where(s == -1, -w, 0.0))
+    out = np.zeros(n, dtype=np.int8)
+    out[score > 1e-9] = 1
+    out[score < -1e-9] = -1
+    return out
+
+def evaluate_signals(df: pd.DataFrame, params: dict, as_strings: bool = True):
     """
     產生融合後的訊號序列。
     params 控制：
       - use_breakout, use_mean_reversion, use_trend_follow: 0/1
       - weight_breakout, weight_mean, weight_trend: 浮點
       - vote_mode: "weighted" / "majority"
+    as_strings=True 回傳 "LONG"/"SHORT"/"NONE" list；False 回傳 int8 陣列 (1/-1/0)
     """
     df = _ensure_indicators(df)
 
@@ -172,25 +171,21 @@ def evaluate_signals(df: pd.DataFrame, params: dict) -> list:
     weights = []
 
     if use_breakout == 1:
-        series.append(breakout_signals(df, params))
+        series.append(breakout_signals(df, params, as_strings=False))
         weights.append(weight_breakout)
 
     if use_mean == 1:
-        series.append(mean_reversion_signals(df, params))
+        series.append(mean_reversion_signals(df, params, as_strings=False))
         weights.append(weight_mean)
 
     if use_trend == 1:
-        series.append(trend_follow_signals(df, params))
+        series.append(trend_follow_signals(df, params, as_strings=False))
         weights.append(weight_trend)
 
     # 若沒有任何策略啟用
     if len(series) == 0:
-        return ["NONE"] * len(df)
-
-    # 逐根投票融合
-    fused = []
-    for i in range(len(df)):
-        votes = [s[i] for s in series]
-        fused.append(_vote(votes, weights, mode=vote_mode))
+        fused = np.zeros(len(df), dtype=np.int8)
+    else:
+        fused = vote(series, weights, mode=vote_mode)
 
-    return fused
\ No newline at end of file
+    return to_strings(fused) if as_strings else fused
@@ -61,15 +61,21 @@ def _dynamic_order_size(df_short, balance, params):
 
 # === 主交易函數 ===
 def trade_once(symbol, params, usdt_budget, dry_run=True,
-               stop_loss=0.95, take_profit=1.05, trailing_stop=0.05):
+               stop_loss=0.95, take_profit=1.05, trailing_stop=0.05, datasets=None):
+    # datasets: build_datasets 預先並行抓好的 { (symbol, interval): df }，缺少時才單獨抓取
+    datasets = datasets or {}
 
     # 短週期 (5m)
-    df_short = build_dataset(symbol, "5m", 500)
+    df_short = datasets.get((symbol, "5m"))
+    if df_short is None:
+        df_short = build_dataset(symbol, "5m", 500)
     signals = evaluate_signals(df_short, params)
     signal = signals[-1]
 
     # 長週期 (1h)
-    df_long = build_dataset(symbol, "1h", 500)
+    df_long = datasets.get((symbol, "1h"))
+    if df_long is None:
+        df_long = build_dataset(symbol, "1h", 500)
 
     # 過濾條件
     if params.get("use_multi_timeframe", 1) == 1:
@@ -1,9 +1,13 @@
 # vaal_optuna.py
 import optuna
 import json
+import sys
 from pathlib import Path
 from backtester import Backtester
 
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from optuna_pruning import Checkpoints, make_pruner
+
 # 儲存最佳參數的檔案
 BEST_PARAMS_FILE = Path(__file__).parent / "best_params.json"
 
@@ -51,7 +55,8 @@ def objective(trial):
 
     # 呼叫完整回測模組
     bt = Backtester("BTCUSDT", initial_balance=1000, fee_rate=0.001, slippage=0.0005, leverage=3)
-    result = bt.run(params, lookback=2000)
+    lookback = 2000
+    result = bt.run(params, lookback=lookback, checkpoints=Checkpoints(trial, n_bars=lookback))
 
     # 多目標優化：最大化 PnL & Sharpe，最小化 MaxDD
     return result["pnl"], result["sharpe"], -result["maxdd"]
@@ -65,7 +70,8 @@ def save_best_params(study):
     return best_trial.params
 
 if __name__ == "__main__":
-    study = optuna.create_study(directions=["maximize", "maximize", "maximize"])
+    study = optuna.create_study(directions=["maximize", "maximize", "maximize"],
+                                pruner=make_pruner(multi_objective=True))
     study.optimize(objective, n_trials=50)
 
     print("最佳參數:")
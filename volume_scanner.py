@@ -1,5 +1,5 @@
 # volume_scanner.py
-import ccxt
+from exchange_registry import ensure_markets, get_exchange
 
 # ========= 可調參數（如需） =========
 DEFAULT_FALLBACK = ["BTC/USDT", "ETH/USDT", "SOL/USDT", "BNB/USDT", "ADA/USDT"]
@@ -8,12 +8,12 @@ EXCLUDE = {"USDT/USDT"}  # 排除不合法或無意義的交易對
 
 def _ensure_exchange(exchange=None):
     """
-    建立或沿用 exchange 實例，並嘗試載入 markets。
+    沿用傳入的 exchange 實例或取得共用連線，並嘗試載入 markets (優先使用磁碟快取)。
     """
     if exchange is None:
-        exchange = ccxt.bybit({"enableRateLimit": True})
+        return get_exchange("bybit")
     try:
-        exchange.load_markets()
+        ensure_markets(exchange)
     except Exception:
         # 某些環境即使未載入 markets，fetch_tickers 仍可工作
         pass